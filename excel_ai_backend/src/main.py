@@ -30,7 +30,7 @@ from src.routes.tools import tools_bp
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'fallback-secret-key')
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max request body; upload routes raise it, see src/utils/ingest.py
 
 # Enable CORS for all routes
 CORS(app)
@@ -90,7 +90,9 @@ def api_info():
                 'upload': '/api/v1/excel/upload',
                 'analyze': '/api/v1/excel/analyze',
                 'query': '/api/v1/excel/query',
-                'formulas': '/api/v1/excel/formulas'
+                'formulas': '/api/v1/excel/formulas',
+                'dataset_rows': '/api/v1/excel/datasets/<id>/rows',
+                'upload_job': '/api/v1/excel/jobs/<id>'
             },
             'formula': {
                 'generate': '/api/v1/formula/generate',
@@ -8,15 +8,27 @@ from datetime import datetime
 import json
 import pandas as pd
 import numpy as np
-import time
 
 from src.models.auth import db, User
 from src.models.connectors import DataConnector, ConnectorDataset, DataAnalysis
 from src.routes.user import token_required
-from src.utils.openai_helper import call_openai_with_retry, estimate_tokens
+from src.utils.dataset_store import connector_store, DatasetNotFoundError
+from src.utils.profile_state import state_for
+from src.utils.model_executor import execute_chain
+from src.utils.model_router import get_model_chain
+from src.utils.sse import sse_response, stream_llm, stream_requested
+from src.utils.telemetry import estimate_tokens
 
 analysis_bp = Blueprint('analysis', __name__)
 
+# Rows of the real dataset included in the prompt as examples
+CONTEXT_SAMPLE_ROWS = 20
+# Categorical columns report this many most frequent values
+CONTEXT_TOP_VALUES = 5
+# Generation settings for one analysis answer
+ANALYSIS_MAX_TOKENS = 1500
+ANALYSIS_TEMPERATURE = 0.7
+
 # Analysis type definitions
 ANALYSIS_TYPES = {
     'root_cause': {
@@ -140,6 +152,15 @@ def create_analysis(current_user):
             if not connector:
                 return jsonify({'error': 'Connector not found'}), 404
         
+        if dataset_id:
+            dataset = ConnectorDataset.query.join(DataConnector).filter(
+                ConnectorDataset.id == dataset_id,
+                DataConnector.user_id == current_user.id
+            ).first()
+            if not dataset or (connector_id and dataset.connector_id != connector_id):
+                return jsonify({'error': 'Dataset not found'}), 404
+            connector_id = dataset.connector_id
+        
         # Create analysis record
         analysis = DataAnalysis(
             user_id=current_user.id,
@@ -155,22 +176,14 @@ def create_analysis(current_user):
         db.session.add(analysis)
         db.session.commit()
         
+        if stream_requested():
+            return _stream_analysis(analysis, current_user)
+        
         # Run analysis
         try:
-            analysis_result = _run_analysis(analysis, current_user)
-            analysis.status = 'completed'
-            analysis.completed_at = datetime.utcnow()
-            analysis.execution_time_ms = int((analysis.completed_at - analysis.started_at).total_seconds() * 1000)
-            analysis.results = analysis_result.get('results')
-            analysis.insights = analysis_result.get('insights')
-            analysis.visualizations = analysis_result.get('visualizations')
-            analysis.model_used = analysis_result.get('model_used')
-            analysis.tokens_used = analysis_result.get('tokens_used')
-            
+            _complete_analysis(analysis, _run_analysis(analysis, current_user))
         except Exception as e:
-            analysis.status = 'failed'
-            analysis.completed_at = datetime.utcnow()
-            analysis.results = {'error': str(e)}
+            _fail_analysis(analysis, e)
         
         db.session.commit()
         current_user.increment_usage('query')
@@ -230,17 +243,67 @@ def delete_analysis(current_user, analysis_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
-def _run_analysis(analysis, user):
-    """Execute the actual analysis based on type"""
+def _data_context(connector, dataset_id=None):
+    """Summarize a connector dataset for the analysis prompt from its persisted profile state"""
+    datasets = [d for d in connector.datasets if d.dataset_id and (dataset_id is None or d.id == dataset_id)]
+    if not datasets:
+        return (connector.config or {}).get('data_summary', {})
+    dataset = max(datasets, key=lambda d: d.id)
+    try:
+        stored = connector_store.meta(dataset.dataset_id)
+        profile = state_for(connector_store, dataset.dataset_id).summary()
+        sample, _ = connector_store.read_window(dataset.dataset_id, 0, CONTEXT_SAMPLE_ROWS)
+    except DatasetNotFoundError:
+        return (connector.config or {}).get('data_summary', {})
+    
+    columns = profile['columns']
+    context = {
+        'dataset': dataset.name,
+        'shape': [profile['rows'], len(stored['columns'])],
+        'dtypes': stored['dtypes'],
+        'null_counts': {col: stats['nulls'] for col, stats in columns.items() if stats['nulls']}
+    }
+    numeric_summary = {
+        col: {key: stats[key] for key in ('count', 'mean', 'std', 'min', 'max')}
+        for col, stats in columns.items() if 'mean' in stats
+    }
+    if numeric_summary:
+        context['numeric_summary'] = numeric_summary
+    top_values = {
+        col: dict(list(stats['top_values'].items())[:CONTEXT_TOP_VALUES])
+        for col, stats in columns.items() if stats.get('top_values')
+    }
+    if top_values:
+        context['top_values'] = top_values
+    context['sample_rows'] = json.loads(sample.to_json(orient='records', date_format='iso'))
+    return context
+
+def _complete_analysis(analysis, analysis_result):
+    analysis.status = 'completed'
+    analysis.completed_at = datetime.utcnow()
+    analysis.execution_time_ms = int((analysis.completed_at - analysis.started_at).total_seconds() * 1000)
+    analysis.results = analysis_result.get('results')
+    analysis.insights = analysis_result.get('insights')
+    analysis.visualizations = analysis_result.get('visualizations')
+    analysis.model_used = analysis_result.get('model_used')
+    analysis.tokens_used = analysis_result.get('tokens_used')
+
+def _fail_analysis(analysis, error):
+    analysis.status = 'failed'
+    analysis.completed_at = datetime.utcnow()
+    analysis.results = {'error': str(error)}
+
+def _analysis_messages(analysis):
+    """Prompt for an analysis record"""
     analysis_type = analysis.analysis_type
     parameters = analysis.parameters
     
-    # Get data if connector is specified
+    # Get data if connector is specified: profile the stored rows, else fall back to the config summary
     data_context = {}
     if analysis.connector_id:
         connector = DataConnector.query.get(analysis.connector_id)
-        if connector and connector.config.get('data_summary'):
-            data_context = connector.config['data_summary']
+        if connector:
+            data_context = _data_context(connector, analysis.dataset_id)
     
     # Generate AI-powered analysis based on type
     system_prompt = f"""You are an expert data analyst performing {ANALYSIS_TYPES[analysis_type]['name']}. 
@@ -251,7 +314,7 @@ def _run_analysis(analysis, user):
     
     Analysis Name: {analysis.name}
     Parameters: {json.dumps(parameters, indent=2)}
-    Data Context: {json.dumps(data_context, indent=2) if data_context else 'No data context provided'}
+    Data Context: {json.dumps(data_context, indent=2, default=str) if data_context else 'No data context provided'}
     
     Provide results in JSON format with these sections:
     - summary: Brief overview of the analysis
@@ -260,17 +323,13 @@ def _run_analysis(analysis, user):
     - recommendations: Actionable recommendations
     - visualizations: Suggested chart types and configurations
     """
-    
-    # Track timing for telemetry
-    start_time = time.time()
-    result = call_openai_with_retry([
+    return [
         {"role": "system", "content": system_prompt},
         {"role": "user", "content": user_prompt}
-    ], max_tokens=1500)
-    
-    if not result['success']:
-        raise Exception(f"AI analysis failed: {result.get('error', 'Unknown error')}")
-    
+    ]
+
+def _analysis_result(result):
+    """Parse a successful model-chain answer into the analysis record fields"""
     # Parse AI response
     try:
         ai_results = json.loads(result['content'])
@@ -290,3 +349,38 @@ def _run_analysis(analysis, user):
         'model_used': result.get('model_used'),
         'tokens_used': tokens_used
     }
+
+def _run_analysis(analysis, user):
+    """Execute the actual analysis based on type"""
+    # Each tier's timeout is sized for ANALYSIS_MAX_TOKENS (32s on gpt-4o), not the short-answer budget
+    result = execute_chain(_analysis_messages(analysis), get_model_chain(user, 'analysis'),
+                           max_tokens=ANALYSIS_MAX_TOKENS, temperature=ANALYSIS_TEMPERATURE)
+    
+    if not result['success']:
+        raise Exception(f"AI analysis failed: {result.get('error', 'Unknown error')}")
+    
+    return _analysis_result(result)
+
+def _stream_analysis(analysis, user):
+    """Stream the analysis answer over SSE; the ``done`` event carries the saved record"""
+    try:
+        messages = _analysis_messages(analysis)
+    except Exception as e:
+        _fail_analysis(analysis, e)
+        db.session.commit()
+        return jsonify({'success': False, 'error': str(e)}), 500
+    
+    def finish(result, latency_ms):
+        _complete_analysis(analysis, _analysis_result(result))
+        db.session.commit()
+        user.increment_usage('query')
+        return {'success': True, 'data': analysis.to_dict()}
+    
+    def failed(result):
+        _fail_analysis(analysis, f"AI analysis failed: {result.get('error', 'Unknown error')}")
+        db.session.commit()
+        user.increment_usage('query')
+    
+    return sse_response(stream_llm(messages, get_model_chain(user, 'analysis'), finish,
+                                   max_tokens=ANALYSIS_MAX_TOKENS, temperature=ANALYSIS_TEMPERATURE,
+                                   on_error=failed))
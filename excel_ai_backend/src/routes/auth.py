@@ -57,6 +57,17 @@ def token_required(f):
     
     return decorated
 
+def get_optional_user():
+    """Return the user for a valid Bearer token, or None for anonymous requests"""
+    auth_header = request.headers.get('Authorization', '')
+    parts = auth_header.split(' ')
+    if len(parts) != 2:
+        return None
+    try:
+        return User.verify_token(parts[1])
+    except Exception:
+        return None
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """User registration endpoint"""
@@ -6,14 +6,15 @@ Handles external data source connections and management
 from flask import Blueprint, request, jsonify
 from datetime import datetime
 import json
-import pandas as pd
-import io
-import time
 
 from src.models.auth import db, User
 from src.models.connectors import DataConnector, ConnectorDataset, DataAnalysis
 from src.routes.user import token_required
 from src.utils.openai_helper import call_openai_with_retry, estimate_tokens
+from src.utils.dataset_store import connector_store, DatasetNotFoundError
+from src.utils.excel_readers import ExcelReaderError
+from src.utils.ingest import IngestValidationError, allow_upload_body, append_datasets, ingest_upload, owner_key
+from src.utils.profile_state import state_for
 
 connectors_bp = Blueprint('connectors', __name__)
 
@@ -188,6 +189,13 @@ def update_connector(current_user, connector_id):
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
 
+def _delete_unreferenced(stored_ids):
+    """Drop stored rows no connector dataset still points at (uploads are deduplicated)"""
+    if stored_ids:
+        shared = {d.dataset_id for d in ConnectorDataset.query.filter(ConnectorDataset.dataset_id.in_(stored_ids))}
+        for stored_id in set(stored_ids) - shared:
+            connector_store.delete(stored_id)
+
 @connectors_bp.route('/<int:connector_id>', methods=['DELETE'])
 @token_required
 def delete_connector(current_user, connector_id):
@@ -201,8 +209,10 @@ def delete_connector(current_user, connector_id):
         if not connector:
             return jsonify({'error': 'Connector not found'}), 404
         
+        stored_ids = {d.dataset_id for d in connector.datasets if d.dataset_id}
         db.session.delete(connector)
         db.session.commit()
+        _delete_unreferenced(stored_ids)
         
         return jsonify({
             'success': True,
@@ -217,6 +227,7 @@ def delete_connector(current_user, connector_id):
 @token_required
 def upload_data(current_user, connector_id):
     """Upload data to a connector (for Excel/CSV files)"""
+    allow_upload_body()
     try:
         connector = DataConnector.query.filter_by(
             id=connector_id, 
@@ -236,43 +247,55 @@ def upload_data(current_user, connector_id):
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Read file data
-        file_content = file.read()
         file_extension = file.filename.split('.')[-1].lower()
+        meta = {'filename': file.filename, 'connector_id': connector.id}
         
-        # Parse file based on extension
-        if file_extension in ['xlsx', 'xls']:
-            df = pd.read_excel(io.BytesIO(file_content))
-        elif file_extension == 'csv':
-            df = pd.read_csv(io.BytesIO(file_content))
-        else:
+        if file_extension not in ['xlsx', 'xls', 'csv']:
             return jsonify({'error': 'Unsupported file format'}), 400
         
+        # Parse (CSV in chunks) unless this user already uploaded the same bytes.
+        # Rows are kept in the non-expiring connector store so analyses and syncs can use them,
+        # with a profile state built while parsing so later appends only profile the new rows.
+        try:
+            ingested = ingest_upload(file.stream, file.filename, owner_key(current_user.id), meta,
+                                     reader=request.values.get('reader'), store=connector_store, profile=True)
+        except IngestValidationError as e:
+            return jsonify({'error': 'File validation failed', 'details': e.validation['errors']}), 400
+        except ExcelReaderError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        stored = ingested['meta']
+        shape = [stored['rows'], len(stored['columns'])]
+        preview = ingested['preview']
+        
         # Create dataset
         dataset = ConnectorDataset(
             connector_id=connector.id,
             name=file.filename,
-            dataset_id=f"upload_{int(time.time())}"
+            dataset_id=ingested['dataset_id']
         )
         
         # Extract schema information
-        dataset.columns = df.columns.tolist()
-        dataset.data_types = {col: str(df[col].dtype) for col in df.columns}
-        dataset.records_count = len(df)
+        dataset.columns = stored['columns']
+        dataset.data_types = stored['dtypes']
+        dataset.records_count = stored['rows']
         dataset.last_updated = datetime.utcnow()
         
         # Update connector stats
-        connector.records_count = len(df)
-        connector.columns_count = len(df.columns)
+        connector.records_count = stored['rows']
+        connector.columns_count = len(stored['columns'])
         connector.last_sync = datetime.utcnow()
         
-        # Store data summary in config for quick access
-        connector.config['data_preview'] = df.head(5).to_dict('records')
-        connector.config['data_summary'] = {
-            'shape': df.shape,
-            'columns': df.columns.tolist(),
-            'dtypes': {col: str(dtype) for col, dtype in df.dtypes.items()},
-            'null_counts': df.isnull().sum().to_dict()
+        # Store data summary in config for quick access (reassign so the JSON column is marked dirty)
+        connector.config = {
+            **(connector.config or {}),
+            'data_preview': preview.head(5).to_dict('records'),
+            'data_summary': {
+                'shape': shape,
+                'columns': stored['columns'],
+                'dtypes': stored['dtypes'],
+                'null_counts': ingested['validation']['null_counts']
+            }
         }
         
         db.session.add(dataset)
@@ -283,7 +306,8 @@ def upload_data(current_user, connector_id):
             'data': {
                 'connector': connector.to_dict(),
                 'dataset': dataset.to_dict(),
-                'preview': df.head(10).to_dict('records')
+                'preview': preview.to_dict('records'),
+                'profile': ingested['profile_state'].summary()
             }
         })
         
@@ -304,10 +328,34 @@ def sync_connector(current_user, connector_id):
         if not connector:
             return jsonify({'error': 'Connector not found'}), 404
         
-        # TODO: Implement sync logic for different connector types
-        # For now, just update last_sync timestamp
-        connector.last_sync = datetime.utcnow()
+        # Excel connectors re-read their stored datasets; other types still only update last_sync
+        # TODO: Implement sync logic for external connector types
         connector.status = 'active'
+        if connector.connector_type == 'excel' and connector.datasets:
+            missing = []
+            for dataset in connector.datasets:
+                try:
+                    stored = connector_store.meta(dataset.dataset_id)
+                except DatasetNotFoundError:
+                    missing.append(dataset.name)
+                    continue
+                dataset.columns = stored['columns']
+                dataset.data_types = stored['dtypes']
+                dataset.records_count = stored['rows']
+                dataset.last_updated = datetime.utcnow()
+            
+            latest = max(connector.datasets, key=lambda d: d.id)
+            connector.records_count = latest.records_count
+            connector.columns_count = len(latest.columns or [])
+            if missing:
+                connector.status = 'error'
+                db.session.commit()
+                return jsonify({
+                    'success': False,
+                    'error': f'Stored data missing for: {", ".join(missing)}. Please upload the file again.',
+                    'data': connector.to_dict()
+                }), 409
+        connector.last_sync = datetime.utcnow()
         db.session.commit()
         
         return jsonify({
@@ -319,3 +367,111 @@ def sync_connector(current_user, connector_id):
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'error': str(e)}), 500
+
+@connectors_bp.route('/<int:connector_id>/datasets/<int:dataset_id>/append', methods=['POST'])
+@token_required
+def append_data(current_user, connector_id, dataset_id):
+    """Append the rows of an uploaded file to a connector dataset
+
+    Only the new rows are profiled; their statistics are merged into the
+    dataset's persisted profile state.
+    """
+    allow_upload_body()
+    try:
+        connector = DataConnector.query.filter_by(
+            id=connector_id, 
+            user_id=current_user.id
+        ).first()
+        
+        if not connector:
+            return jsonify({'error': 'Connector not found'}), 404
+        
+        dataset = ConnectorDataset.query.filter_by(id=dataset_id, connector_id=connector.id).first()
+        if not dataset or not dataset.dataset_id:
+            return jsonify({'error': 'Dataset not found'}), 404
+        
+        if 'file' not in request.files:
+            return jsonify({'error': 'No file provided'}), 400
+        
+        file = request.files['file']
+        if file.filename == '':
+            return jsonify({'error': 'No file selected'}), 400
+        
+        if file.filename.split('.')[-1].lower() not in ['xlsx', 'xls', 'csv']:
+            return jsonify({'error': 'Unsupported file format'}), 400
+        
+        previous_id, ingested = dataset.dataset_id, None
+        try:
+            state = state_for(connector_store, previous_id)
+            ingested = ingest_upload(file.stream, file.filename, owner_key(current_user.id),
+                                     {'filename': file.filename, 'connector_id': connector.id},
+                                     reader=request.values.get('reader'), store=connector_store, profile=True)
+            appended = append_datasets(connector_store, previous_id, ingested['dataset_id'],
+                                       state.merge(ingested['profile_state']),
+                                       {'filename': dataset.name, 'connector_id': connector.id})
+        except IngestValidationError as e:
+            if ingested:
+                # Parsed but not appendable (e.g. different columns): drop the staged rows
+                _delete_unreferenced({ingested['dataset_id']} - {previous_id})
+            return jsonify({'error': 'File validation failed', 'details': e.validation['errors']}), 400
+        except ExcelReaderError as e:
+            return jsonify({'error': str(e)}), 400
+        except DatasetNotFoundError:
+            return jsonify({'error': f'Stored data missing for: {dataset.name}. Please upload the file again.'}), 409
+        
+        stored = appended['meta']
+        dataset.dataset_id = appended['dataset_id']
+        dataset.columns = stored['columns']
+        dataset.data_types = stored['dtypes']
+        dataset.records_count = stored['rows']
+        dataset.last_updated = datetime.utcnow()
+        
+        if dataset.id == max(d.id for d in connector.datasets):
+            connector.records_count = stored['rows']
+            connector.columns_count = len(stored['columns'])
+        connector.last_sync = datetime.utcnow()
+        db.session.commit()
+        
+        # The previous rows and the staged upload now live in the appended dataset
+        _delete_unreferenced({previous_id, ingested['dataset_id']})
+        
+        return jsonify({
+            'success': True,
+            'data': {
+                'connector': connector.to_dict(),
+                'dataset': dataset.to_dict(),
+                'appended_rows': ingested['meta']['rows'],
+                'profile': appended['profile_state'].summary()
+            }
+        })
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+@connectors_bp.route('/<int:connector_id>/datasets/<int:dataset_id>/profile', methods=['GET'])
+@token_required
+def get_dataset_profile(current_user, connector_id, dataset_id):
+    """Column statistics of a connector dataset from its persisted profile state"""
+    try:
+        connector = DataConnector.query.filter_by(
+            id=connector_id, 
+            user_id=current_user.id
+        ).first()
+        
+        if not connector:
+            return jsonify({'error': 'Connector not found'}), 404
+        
+        dataset = ConnectorDataset.query.filter_by(id=dataset_id, connector_id=connector.id).first()
+        if not dataset or not dataset.dataset_id:
+            return jsonify({'error': 'Dataset not found'}), 404
+        
+        return jsonify({
+            'success': True,
+            'data': state_for(connector_store, dataset.dataset_id).summary()
+        })
+        
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)}), 500
@@ -1,42 +1,57 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
 from src.models.visualization import DataPrep
+from src.utils.dataset_store import frame_from_payload, DatasetNotFoundError
+from src.utils.duplicates import NEAR_DUPLICATE_THRESHOLD, drop_duplicate_rows, near_duplicates
+from src.utils.serialization import frame_response
+from src.utils.compaction import expand_categories
+from src.utils.llm_client import chat_completion, get_client
+from src.utils.profile_cache import get_profile
+from src.utils.sampling import SamplingError, sample_estimates, sample_from_payload
 import pandas as pd
 import numpy as np
 from datetime import datetime
 import re
-import os
-from openai import OpenAI
+import json
 from dotenv import load_dotenv
 
 load_dotenv()
 
 data_prep_bp = Blueprint('data_prep', __name__)
 
-# Initialize OpenAI client
-api_key = os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=api_key) if api_key and api_key != 'sk-test-key-replace-with-real-key' else None
+# Shared pooled OpenAI client (None when OPENAI_API_KEY is not configured)
+client = get_client()
 
 @data_prep_bp.route('/api/v1/data-prep/analyze', methods=['POST'])
 def analyze_data():
     """Analyze data quality and suggest cleaning operations"""
     try:
         data = request.get_json()
-        input_data = data.get('data', [])
         
-        if not input_data:
+        # Load stored dataset or inline rows (sample=true profiles a sample of large datasets)
+        df, sampling = sample_from_payload(data)
+        if df is None:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Convert to DataFrame
-        df = pd.DataFrame(input_data)
-        
+        # Shared column profile (approx=true estimates distinct counts with HyperLogLog)
+        approx = str(data.get('approx', '')).lower() in ('1', 'true', 'yes')
+        near_threshold = None
+        if str(data.get('near_duplicates', '')).lower() in ('1', 'true', 'yes'):
+            try:
+                near_threshold = float(data.get('near_duplicate_threshold', NEAR_DUPLICATE_THRESHOLD))
+            except (TypeError, ValueError):
+                near_threshold = -1
+            if not 0 < near_threshold <= 1:
+                return jsonify({'error': 'near_duplicate_threshold must be a number in (0, 1]'}), 400
+        profile = get_profile(df, None if sampling else data.get('dataset_id'), approx)
+
         # Analyze data quality
         analysis = {
             'summary': {
-                'rows': len(df),
-                'columns': len(df.columns),
-                'memory_usage': df.memory_usage(deep=True).sum(),
-                'duplicate_rows': df.duplicated().sum()
+                'rows': profile.rows,
+                'columns': len(profile.columns),
+                'memory_usage': profile.memory_usage_bytes,
+                'duplicate_rows': profile.duplicate_rows
             },
             'columns': {},
             'issues': [],
@@ -44,8 +59,15 @@ def analyze_data():
         }
         
         # Analyze each column
+        if approx:
+            analysis['approximation'] = profile.error_bounds
+        if sampling:
+            analysis['sampling'] = {**sampling, 'estimates': sample_estimates(df, profile, sampling)}
+        if near_threshold is not None:
+            # Rows equal up to case/whitespace or a few fields; exact duplicates are counted above
+            analysis['near_duplicates'] = near_duplicates(df, near_threshold, profile.duplicate_positions)
         for col in df.columns:
-            col_analysis = analyze_column(df[col])
+            col_analysis = analyze_column(df[col], profile)
             analysis['columns'][col] = col_analysis
             
             # Generate issues and suggestions
@@ -65,7 +87,7 @@ def analyze_data():
         
         # Check for potential data type issues
         for col in df.columns:
-            if df[col].dtype == 'object':
+            if df[col].dtype in ('object', 'category'):
                 # Check if it could be numeric
                 numeric_conversion = try_convert_to_numeric(df[col])
                 if numeric_conversion['convertible']:
@@ -98,6 +120,10 @@ def analyze_data():
             'data': analysis
         })
         
+    except SamplingError as e:
+        return jsonify({'error': str(e)}), 400
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to analyze data: {str(e)}'}), 500
 
@@ -106,14 +132,13 @@ def clean_data():
     """Apply cleaning operations to data"""
     try:
         data = request.get_json()
-        input_data = data.get('data', [])
         operations = data.get('operations', [])
         
-        if not input_data:
+        # Load stored dataset or inline rows
+        df = frame_from_payload(data)
+        if df is None:
             return jsonify({'error': 'No data provided'}), 400
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(input_data)
+        df = expand_categories(df)
         original_df = df.copy()
         
         # Apply each operation
@@ -147,8 +172,8 @@ def clean_data():
             user_id=user_id,
             title=data.get('title', f'Data Cleaning - {datetime.now().strftime("%Y-%m-%d %H:%M")}'),
             prep_type='cleaning',
-            input_data=input_data[:100],  # Store sample
-            output_data=df.to_dict('records')[:100],  # Store sample
+            input_data=_records_sample(original_df),  # Store sample
+            output_data=_records_sample(df),  # Store sample
             operations=operations,
             status='completed'
         )
@@ -156,16 +181,17 @@ def clean_data():
         db.session.add(data_prep)
         db.session.commit()
         
-        return jsonify({
+        return frame_response({
             'success': True,
             'data': {
                 'id': data_prep.id,
-                'cleaned_data': df.to_dict('records'),
                 'summary': summary,
                 'operations': applied_operations
             }
-        })
+        }, ('data', 'cleaned_data'), df)
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to clean data: {str(e)}'}), 500
 
@@ -183,7 +209,10 @@ def blend_data():
         # Convert datasets to DataFrames
         dfs = []
         for i, dataset in enumerate(datasets):
-            df = pd.DataFrame(dataset['data'])
+            df = frame_from_payload(dataset)
+            if df is None:
+                return jsonify({'error': f'Dataset {i+1} has no data or dataset_id'}), 400
+            df = expand_categories(df)
             df.name = dataset.get('name', f'Dataset_{i+1}')
             dfs.append(df)
         
@@ -219,7 +248,7 @@ def blend_data():
             title=data.get('title', f'Data Blending - {datetime.now().strftime("%Y-%m-%d %H:%M")}'),
             prep_type='blending',
             input_data={'datasets': [ds.get('name', f'Dataset_{i+1}') for i, ds in enumerate(datasets)]},
-            output_data=result_df.to_dict('records')[:100],  # Store sample
+            output_data=_records_sample(result_df),  # Store sample
             operations=[blend_config],
             status='completed'
         )
@@ -227,11 +256,10 @@ def blend_data():
         db.session.add(data_prep)
         db.session.commit()
         
-        return jsonify({
+        return frame_response({
             'success': True,
             'data': {
                 'id': data_prep.id,
-                'blended_data': result_df.to_dict('records'),
                 'summary': {
                     'input_datasets': len(datasets),
                     'output_rows': len(result_df),
@@ -239,8 +267,10 @@ def blend_data():
                     'blend_type': blend_type
                 }
             }
-        })
+        }, ('data', 'blended_data'), result_df)
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to blend data: {str(e)}'}), 500
 
@@ -249,14 +279,14 @@ def transform_data():
     """Apply transformations to data"""
     try:
         data = request.get_json()
-        input_data = data.get('data', [])
         transformations = data.get('transformations', [])
         
-        if not input_data:
+        # Load stored dataset or inline rows
+        df = frame_from_payload(data)
+        if df is None:
             return jsonify({'error': 'No data provided'}), 400
-        
-        # Convert to DataFrame
-        df = pd.DataFrame(input_data)
+        df = expand_categories(df)
+        input_sample = _records_sample(df)
         
         # Apply transformations
         applied_transformations = []
@@ -280,8 +310,8 @@ def transform_data():
             user_id=user_id,
             title=data.get('title', f'Data Transformation - {datetime.now().strftime("%Y-%m-%d %H:%M")}'),
             prep_type='transformation',
-            input_data=input_data[:100],  # Store sample
-            output_data=df.to_dict('records')[:100],  # Store sample
+            input_data=input_sample,  # Store sample
+            output_data=_records_sample(df),  # Store sample
             operations=transformations,
             status='completed'
         )
@@ -289,11 +319,10 @@ def transform_data():
         db.session.add(data_prep)
         db.session.commit()
         
-        return jsonify({
+        return frame_response({
             'success': True,
             'data': {
                 'id': data_prep.id,
-                'transformed_data': df.to_dict('records'),
                 'summary': {
                     'transformations_applied': len([t for t in applied_transformations if t['status'] == 'success']),
                     'transformations_failed': len([t for t in applied_transformations if t['status'] == 'failed']),
@@ -302,20 +331,37 @@ def transform_data():
                 },
                 'transformations': applied_transformations
             }
-        })
+        }, ('data', 'transformed_data'), df)
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to transform data: {str(e)}'}), 500
 
-def analyze_column(series):
-    """Analyze a single column"""
+def _records_sample(df, limit=100):
+    """JSON-safe row sample (NaN -> null, timestamps -> ISO) for DataPrep history records"""
+    return json.loads(df.head(limit).to_json(orient='records', date_format='iso'))
+
+def first_values(series, n):
+    """First ``n`` non-null values, scanning a prefix before falling back to the whole column"""
+    head = series.iloc[:n * 20].dropna()
+    if len(head) >= n or len(series) <= n * 20:
+        return head.head(n)
+    return series.dropna().head(n)
+
+def analyze_column(series, profile=None):
+    """Analyze a single column (missing/distinct counts from the dataset profile when given)"""
+    if profile is not None:
+        missing_count, unique_count = profile.missing[series.name], profile.unique[series.name]
+    else:
+        missing_count, unique_count = int(series.isnull().sum()), int(series.nunique())
     return {
         'data_type': str(series.dtype),
-        'missing_count': series.isnull().sum(),
-        'missing_percentage': (series.isnull().sum() / len(series)) * 100,
-        'unique_count': series.nunique(),
-        'unique_percentage': (series.nunique() / len(series)) * 100,
-        'sample_values': series.dropna().head(5).tolist(),
+        'missing_count': missing_count,
+        'missing_percentage': (missing_count / len(series)) * 100,
+        'unique_count': unique_count,
+        'unique_percentage': (unique_count / len(series)) * 100,
+        'sample_values': first_values(series, 5).tolist(),
         'is_numeric': pd.api.types.is_numeric_dtype(series),
         'is_datetime': pd.api.types.is_datetime64_any_dtype(series)
     }
@@ -347,7 +393,7 @@ def try_convert_to_numeric(series):
     """Check if a text column can be converted to numeric"""
     try:
         # Try to convert a sample
-        sample = series.dropna().head(100)
+        sample = first_values(series, 100)
         converted = pd.to_numeric(sample, errors='coerce')
         success_rate = (converted.notna().sum() / len(sample))
         
@@ -363,7 +409,7 @@ def try_convert_to_datetime(series):
     """Check if a text column can be converted to datetime"""
     try:
         # Try to convert a sample
-        sample = series.dropna().head(100)
+        sample = first_values(series, 100)
         converted = pd.to_datetime(sample, errors='coerce')
         success_rate = (converted.notna().sum() / len(sample))
         
@@ -381,7 +427,7 @@ def apply_cleaning_operation(df, operation):
     column = operation.get('column')
     
     if op_type == 'remove_duplicates':
-        return df.drop_duplicates()
+        return drop_duplicate_rows(df)
     
     elif op_type == 'fill_missing':
         method = operation.get('method', 'mean')
@@ -452,15 +498,13 @@ def smart_validate_data():
     """AI-powered data validation with anomaly detection and quality rules"""
     try:
         data = request.get_json()
-        input_data = data.get('data', [])
         validation_context = data.get('context', {})  # Business context for validation
         
-        if not input_data:
+        # Load stored dataset or inline rows
+        df = frame_from_payload(data)
+        if df is None:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Convert to DataFrame
-        df = pd.DataFrame(input_data)
-        
         # Perform comprehensive validation
         validation_results = {
             'overall_score': 0,
@@ -471,8 +515,10 @@ def smart_validate_data():
             'suggestions': []
         }
         
+        profile = get_profile(df, data.get('dataset_id'))
+
         # 1. Statistical Anomaly Detection
-        anomalies = detect_statistical_anomalies(df)
+        anomalies = detect_statistical_anomalies(df, profile)
         validation_results['anomalies'] = anomalies
         
         # 2. Business Rule Validation
@@ -480,7 +526,7 @@ def smart_validate_data():
         validation_results['business_rules'] = business_rules
         
         # 3. Data Quality Issues
-        quality_issues = detect_quality_issues(df)
+        quality_issues = detect_quality_issues(df, profile)
         validation_results['quality_issues'] = quality_issues
         
         # 4. AI-Powered Insights
@@ -502,17 +548,23 @@ def smart_validate_data():
             'data': validation_results
         })
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to validate data: {str(e)}'}), 500
 
-def detect_statistical_anomalies(df):
+def detect_statistical_anomalies(df, profile=None):
     """Detect statistical anomalies in numeric columns"""
     anomalies = []
+    profile = profile or get_profile(df)
     
-    for col in df.select_dtypes(include=[np.number]).columns:
+    for col in profile.numeric_columns:
+        stats = profile.summary_stats.get(col)
+        if stats is None:
+            continue  # no values at all
         try:
             # Z-score based outliers
-            z_scores = np.abs((df[col] - df[col].mean()) / df[col].std())
+            z_scores = np.abs((df[col] - stats['mean']) / stats['std'])
             outlier_indices = df[z_scores > 3].index.tolist()
             
             if len(outlier_indices) > 0:
@@ -528,8 +580,8 @@ def detect_statistical_anomalies(df):
                 })
             
             # IQR based outliers
-            Q1 = df[col].quantile(0.25)
-            Q3 = df[col].quantile(0.75)
+            Q1 = stats['q25']
+            Q3 = stats['q75']
             IQR = Q3 - Q1
             outlier_mask = (df[col] < (Q1 - 1.5 * IQR)) | (df[col] > (Q3 + 1.5 * IQR))
             iqr_outliers = df[outlier_mask].index.tolist()
@@ -612,13 +664,14 @@ def validate_business_rules(df, context):
     
     return rules
 
-def detect_quality_issues(df):
+def detect_quality_issues(df, profile=None):
     """Detect general data quality issues"""
     issues = []
+    profile = profile or get_profile(df)
     
     # High missing value percentage
     for col in df.columns:
-        missing_pct = (df[col].isnull().sum() / len(df)) * 100
+        missing_pct = (profile.missing[col] / len(df)) * 100
         if missing_pct > 50:
             issues.append({
                 'type': 'high_missing_values',
@@ -637,21 +690,21 @@ def detect_quality_issues(df):
             })
     
     # Low cardinality in text columns
-    for col in df.select_dtypes(include=['object']).columns:
+    for col in profile.categorical_columns:
         if len(df) > 10:  # Only check if we have enough data
-            unique_pct = (df[col].nunique() / len(df)) * 100
+            unique_pct = (profile.unique[col] / len(df)) * 100
             if unique_pct < 5:
                 issues.append({
                     'type': 'low_cardinality',
                     'column': col,
                     'unique_percentage': round(unique_pct, 2),
-                    'unique_values': df[col].value_counts().head(5).to_dict(),
+                    'unique_values': dict(list(profile.top_values[col].items())[:5]),
                     'description': f'Column has very low diversity ({unique_pct:.1f}% unique)',
                     'severity': 'medium'
                 })
     
     # Inconsistent formatting
-    for col in df.select_dtypes(include=['object']).columns:
+    for col in profile.categorical_columns:
         sample_values = df[col].dropna().head(20).tolist()
         if len(sample_values) > 5:
             # Check for inconsistent case
@@ -704,7 +757,7 @@ def generate_ai_validation_insights(df, context):
         }}
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2,
@@ -798,7 +851,7 @@ def generate_ai_suggestions(df, analysis):
         ]
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2
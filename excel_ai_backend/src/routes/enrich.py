@@ -3,19 +3,31 @@ from src.models.user import db
 from src.models.visualization import DataEnrichment
 import pandas as pd
 import re
-import os
-from openai import OpenAI
 from dotenv import load_dotenv
 from datetime import datetime
 import json
+from src.utils.fanout import ENRICH_ROW_TIMEOUT_S, fan_out
+from src.utils.llm_client import chat_completion, get_client
+from src.utils.micro_batch import batch_max_tokens, batch_timeout, run_batches
 
 load_dotenv()
 
 enrich_bp = Blueprint('enrich', __name__)
 
-# Initialize OpenAI client
-api_key = os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=api_key) if api_key and api_key != 'sk-test-key-replace-with-real-key' else None
+# Shared pooled OpenAI client (None when OPENAI_API_KEY is not configured)
+client = get_client()
+
+SUMMARY_LENGTHS = {
+    'short': 'in 1-2 sentences',
+    'medium': 'in 2-4 sentences',
+    'long': 'in 1-2 paragraphs'
+}
+# Expected answer tokens per row (summary plus key points) when summaries are batched
+SUMMARY_OUTPUT_TOKENS = {
+    'short': 80,
+    'medium': 150,
+    'long': 300
+}
 
 @enrich_bp.route('/api/v1/enrich/sentiment', methods=['POST'])
 def analyze_sentiment():
@@ -27,6 +39,7 @@ def analyze_sentiment():
         batch_data = data.get('data', [])
         
         results = []
+        failed = []  # batch rows whose enrichment call failed or timed out
         
         if text_data:
             # Single text analysis
@@ -41,16 +54,16 @@ def analyze_sentiment():
             # Batch analysis
             df = pd.DataFrame(batch_data)
             if text_column in df.columns:
-                for idx, text in df[text_column].items():
-                    if pd.notna(text) and str(text).strip():
-                        sentiment = get_sentiment_analysis(str(text))
-                        results.append({
-                            'index': idx,
-                            'text': str(text)[:100] + '...' if len(str(text)) > 100 else str(text),
-                            'sentiment': sentiment['sentiment'],
-                            'confidence': sentiment['confidence'],
-                            'emotions': sentiment.get('emotions', {})
-                        })
+                enriched, failed = _enrich_rows(df, text_column, lambda text: get_sentiment_analysis(text, strict=True),
+                                                batch=_batch_spec('sentiment'))
+                for idx, text, sentiment in enriched:
+                    results.append({
+                        'index': idx,
+                        'text': text[:100] + '...' if len(text) > 100 else text,
+                        'sentiment': sentiment['sentiment'],
+                        'confidence': sentiment['confidence'],
+                        'emotions': sentiment.get('emotions', {})
+                    })
         else:
             return jsonify({'error': 'No text data provided'}), 400
         
@@ -84,6 +97,7 @@ def analyze_sentiment():
             'data': {
                 'id': enrichment.id,
                 'results': results,
+                'failed': failed,
                 'summary': summary
             }
         })
@@ -102,6 +116,7 @@ def extract_keywords():
         max_keywords = data.get('max_keywords', 10)
         
         results = []
+        failed = []  # batch rows whose enrichment call failed or timed out
         
         if text_data:
             # Single text analysis
@@ -114,14 +129,14 @@ def extract_keywords():
             # Batch analysis
             df = pd.DataFrame(batch_data)
             if text_column in df.columns:
-                for idx, text in df[text_column].items():
-                    if pd.notna(text) and str(text).strip():
-                        keywords = get_keyword_extraction(str(text), max_keywords)
-                        results.append({
-                            'index': idx,
-                            'text': str(text)[:100] + '...' if len(str(text)) > 100 else str(text),
-                            'keywords': keywords
-                        })
+                enriched, failed = _enrich_rows(df, text_column, lambda text: get_keyword_extraction(text, max_keywords, strict=True),
+                                                batch=_batch_spec('keywords', max_keywords=max_keywords))
+                for idx, text, keywords in enriched:
+                    results.append({
+                        'index': idx,
+                        'text': text[:100] + '...' if len(text) > 100 else text,
+                        'keywords': keywords
+                    })
         else:
             return jsonify({'error': 'No text data provided'}), 400
         
@@ -162,6 +177,7 @@ def extract_keywords():
             'data': {
                 'id': enrichment.id,
                 'results': results,
+                'failed': failed,
                 'summary': summary
             }
         })
@@ -185,6 +201,7 @@ def classify_text():
             categories = ['positive', 'negative', 'neutral', 'complaint', 'inquiry', 'compliment']
         
         results = []
+        failed = []  # batch rows whose enrichment call failed or timed out
         
         if text_data:
             # Single text analysis
@@ -197,14 +214,15 @@ def classify_text():
             # Batch analysis
             df = pd.DataFrame(batch_data)
             if text_column in df.columns:
-                for idx, text in df[text_column].items():
-                    if pd.notna(text) and str(text).strip():
-                        classification = get_text_classification(str(text), categories, custom_prompt)
-                        results.append({
-                            'index': idx,
-                            'text': str(text)[:100] + '...' if len(str(text)) > 100 else str(text),
-                            'classification': classification
-                        })
+                # A custom prompt has no fixed answer shape, so it stays one call per row
+                enriched, failed = _enrich_rows(df, text_column, lambda text: get_text_classification(text, categories, custom_prompt, strict=True),
+                                                batch=None if custom_prompt else _batch_spec('classification', categories=categories))
+                for idx, text, classification in enriched:
+                    results.append({
+                        'index': idx,
+                        'text': text[:100] + '...' if len(text) > 100 else text,
+                        'classification': classification
+                    })
         else:
             return jsonify({'error': 'No text data provided'}), 400
         
@@ -241,6 +259,7 @@ def classify_text():
             'data': {
                 'id': enrichment.id,
                 'results': results,
+                'failed': failed,
                 'summary': summary
             }
         })
@@ -259,6 +278,7 @@ def summarize_text():
         summary_length = data.get('summary_length', 'medium')  # short, medium, long
         
         results = []
+        failed = []  # batch rows whose enrichment call failed or timed out
         
         if text_data:
             # Single text analysis
@@ -274,17 +294,17 @@ def summarize_text():
             # Batch analysis
             df = pd.DataFrame(batch_data)
             if text_column in df.columns:
-                for idx, text in df[text_column].items():
-                    if pd.notna(text) and str(text).strip():
-                        summary = get_text_summary(str(text), summary_length)
-                        results.append({
-                            'index': idx,
-                            'original_text': str(text)[:200] + '...' if len(str(text)) > 200 else str(text),
-                            'summary': summary['summary'],
-                            'key_points': summary.get('key_points', []),
-                            'original_length': len(str(text)),
-                            'summary_length': len(summary['summary'])
-                        })
+                enriched, failed = _enrich_rows(df, text_column, lambda text: get_text_summary(text, summary_length, strict=True),
+                                                batch=_batch_spec('summary', length=summary_length))
+                for idx, text, summary in enriched:
+                    results.append({
+                        'index': idx,
+                        'original_text': text[:200] + '...' if len(text) > 200 else text,
+                        'summary': summary['summary'],
+                        'key_points': summary.get('key_points', []),
+                        'original_length': len(text),
+                        'summary_length': len(summary['summary'])
+                    })
         else:
             return jsonify({'error': 'No text data provided'}), 400
         
@@ -321,6 +341,7 @@ def summarize_text():
             'data': {
                 'id': enrichment.id,
                 'results': results,
+                'failed': failed,
                 'summary': summary_stats
             }
         })
@@ -342,6 +363,7 @@ def custom_enrichment():
             return jsonify({'error': 'Custom prompt required'}), 400
         
         results = []
+        failed = []  # batch rows whose enrichment call failed or timed out
         
         if text_data:
             # Single text analysis
@@ -354,14 +376,13 @@ def custom_enrichment():
             # Batch analysis
             df = pd.DataFrame(batch_data)
             if text_column in df.columns:
-                for idx, text in df[text_column].items():
-                    if pd.notna(text) and str(text).strip():
-                        result = get_custom_enrichment(str(text), custom_prompt)
-                        results.append({
-                            'index': idx,
-                            'text': str(text)[:100] + '...' if len(str(text)) > 100 else str(text),
-                            'result': result
-                        })
+                enriched, failed = _enrich_rows(df, text_column, lambda text: get_custom_enrichment(text, custom_prompt, strict=True))
+                for idx, text, result in enriched:
+                    results.append({
+                        'index': idx,
+                        'text': text[:100] + '...' if len(text) > 100 else text,
+                        'result': result
+                    })
         else:
             return jsonify({'error': 'No text data provided'}), 400
         
@@ -385,6 +406,7 @@ def custom_enrichment():
             'data': {
                 'id': enrichment.id,
                 'results': results,
+                'failed': failed,
                 'prompt_used': custom_prompt
             }
         })
@@ -392,7 +414,100 @@ def custom_enrichment():
     except Exception as e:
         return jsonify({'error': f'Failed to perform custom enrichment: {str(e)}'}), 500
 
-def get_sentiment_analysis(text):
+def _enrich_rows(df, text_column, enrich, batch=None):
+    """Enrich the column's non-empty texts; one model call per row, or packed prompts when ``batch`` is given.
+
+    ``batch`` is ``(instructions, validate, output_tokens)`` for :func:`_batch_call`; rows are
+    then packed by token budget (src/utils/micro_batch.py) and rows missing
+    from an answer are re-queued. Otherwise ``enrich(text)`` runs per row,
+    concurrently (src/utils/fanout.py). Returns ``[(index, text, result), ...]``
+    in row order for the rows that succeeded and ``[{'index', 'error'}, ...]``
+    for the ones that failed or timed out.
+    """
+    rows = [(idx, str(text)) for idx, text in df[text_column].items() if pd.notna(text) and str(text).strip()]
+    if batch and client:
+        instructions, validate, output_tokens = batch
+        answers, errors = run_batches(rows, lambda texts: _batch_call(instructions, texts, output_tokens),
+                                      validate, output_tokens)
+        outcomes = [(answers.get(idx), errors.get(idx)) for idx, _ in rows]
+    else:
+        outcomes = fan_out(lambda row: enrich(row[1]), rows)
+    enriched, failed = [], []
+    for (idx, text), (result, error) in zip(rows, outcomes):
+        if error is None:
+            enriched.append((idx, text, result))
+        else:
+            failed.append({'index': idx, 'error': error})
+    return enriched, failed
+
+def _batch_call(instructions, texts, output_tokens):
+    """One prompt for several texts; returns ``{item number: answer object}``.
+
+    ``max_tokens`` and the timeout grow with the number of texts and the
+    expected answer size per text.
+    """
+    items = json.dumps([{'i': i, 'text': text} for i, text in enumerate(texts)], ensure_ascii=False)
+    prompt = f"""
+        {instructions}
+        
+        Items:
+        {items}
+        
+        Return JSON format, with exactly one entry per item:
+        {{"results": [{{"i": item number, ...}}, ...]}}
+        """
+    response = chat_completion(
+        model="gpt-4",
+        messages=[{"role": "user", "content": prompt}],
+        temperature=0.2,
+        max_tokens=batch_max_tokens(len(texts), output_tokens),
+        timeout=batch_timeout(len(texts), output_tokens)
+    )
+    answers = _parse_json(response, ('results',))['results']
+    return {entry['i']: entry for entry in answers if isinstance(entry, dict) and isinstance(entry.get('i'), int)}
+
+def _answer_fields(*required):
+    """Validator for batched answers: the answer object minus its item number, with ``required`` keys present."""
+    def validate(answer):
+        missing = [key for key in required if key not in answer]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        return {key: value for key, value in answer.items() if key != 'i'}
+    return validate
+
+def _answer_keywords(answer):
+    if not isinstance(answer.get('keywords'), list):
+        raise ValueError('keywords is not a list')
+    return answer['keywords']
+
+def _batch_spec(task, max_keywords=10, categories=(), length='medium'):
+    """``(instructions, validate, output_tokens)`` for packing ``task`` rows into shared prompts (see _enrich_rows)."""
+    if task == 'sentiment':
+        return ('Analyze the sentiment of each text and rate its emotions. Each entry: '
+                '{"i": item number, "sentiment": "positive/negative/neutral", "confidence": 0.0-1.0, '
+                '"emotions": {"joy": 0.0-1.0, "anger": 0.0-1.0, "sadness": 0.0-1.0, "fear": 0.0-1.0, "surprise": 0.0-1.0}}',
+                _answer_fields('sentiment', 'confidence'), 70)
+    if task == 'keywords':
+        return (f'Extract the top {max_keywords} most important keywords from each text. Each entry: '
+                '{"i": item number, "keywords": [{"keyword": "example", "relevance": 0.0-1.0}, ...]}',
+                _answer_keywords, 12 * int(max_keywords) + 10)
+    if task == 'classification':
+        return (f'Classify each text into one of these categories: {", ".join(categories)}. Each entry: '
+                '{"i": item number, "category": "selected_category", "confidence": 0.0-1.0, "reasoning": "brief explanation"}',
+                _answer_fields('category', 'confidence'), 60)
+    return (f'Summarize each text {SUMMARY_LENGTHS.get(length, SUMMARY_LENGTHS["medium"])} and extract key points. Each entry: '
+            '{"i": item number, "summary": "your summary here", "key_points": ["point 1", "point 2", ...]}',
+            _answer_fields('summary'), SUMMARY_OUTPUT_TOKENS.get(length, SUMMARY_OUTPUT_TOKENS['medium']))
+
+def _parse_json(response, required=()):
+    """JSON body of a chat response; raises ValueError if a required key is missing."""
+    result = json.loads(response.choices[0].message.content)
+    missing = [key for key in required if not isinstance(result, dict) or key not in result]
+    if missing:
+        raise ValueError(f"Response missing {', '.join(missing)}")
+    return result
+
+def get_sentiment_analysis(text, strict=False):
     """Get sentiment analysis using OpenAI"""
     if not client:
         # Fallback: simple rule-based sentiment
@@ -429,18 +544,21 @@ def get_sentiment_analysis(text):
         }}
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.2
+            temperature=0.2,
+            timeout=ENRICH_ROW_TIMEOUT_S
         )
         
-        return json.loads(response.choices[0].message.content)
+        return _parse_json(response, ('sentiment', 'confidence'))
         
     except Exception as e:
+        if strict:
+            raise
         return {'sentiment': 'neutral', 'confidence': 0.5, 'emotions': {}}
 
-def get_keyword_extraction(text, max_keywords=10):
+def get_keyword_extraction(text, max_keywords=10, strict=False):
     """Extract keywords using OpenAI"""
     if not client:
         # Fallback: simple word frequency
@@ -465,18 +583,21 @@ def get_keyword_extraction(text, max_keywords=10):
         ]
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.2
+            temperature=0.2,
+            timeout=ENRICH_ROW_TIMEOUT_S
         )
         
-        return json.loads(response.choices[0].message.content)
+        return _parse_json(response)
         
     except Exception as e:
+        if strict:
+            raise
         return []
 
-def get_text_classification(text, categories, custom_prompt=''):
+def get_text_classification(text, categories, custom_prompt='', strict=False):
     """Classify text using OpenAI"""
     if not client:
         # Fallback: simple classification
@@ -499,18 +620,21 @@ def get_text_classification(text, categories, custom_prompt=''):
             }}
             """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.2
+            temperature=0.2,
+            timeout=ENRICH_ROW_TIMEOUT_S
         )
         
-        return json.loads(response.choices[0].message.content)
+        return _parse_json(response, ('category', 'confidence'))
         
     except Exception as e:
+        if strict:
+            raise
         return {'category': 'unknown', 'confidence': 0.5}
 
-def get_text_summary(text, length='medium'):
+def get_text_summary(text, length='medium', strict=False):
     """Summarize text using OpenAI"""
     if not client:
         # Fallback: simple truncation
@@ -521,14 +645,8 @@ def get_text_summary(text, length='medium'):
         }
     
     try:
-        length_instructions = {
-            'short': 'in 1-2 sentences',
-            'medium': 'in 2-4 sentences', 
-            'long': 'in 1-2 paragraphs'
-        }
-        
         prompt = f"""
-        Summarize this text {length_instructions.get(length, 'in 2-4 sentences')} and extract key points:
+        Summarize this text {SUMMARY_LENGTHS.get(length, SUMMARY_LENGTHS['medium'])} and extract key points:
         
         "{text}"
         
@@ -539,18 +657,21 @@ def get_text_summary(text, length='medium'):
         }}
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
-            temperature=0.2
+            temperature=0.2,
+            timeout=ENRICH_ROW_TIMEOUT_S
         )
         
-        return json.loads(response.choices[0].message.content)
+        return _parse_json(response, ('summary',))
         
     except Exception as e:
+        if strict:
+            raise
         return {'summary': text[:200] + '...', 'key_points': []}
 
-def get_custom_enrichment(text, prompt):
+def get_custom_enrichment(text, prompt, strict=False):
     """Perform custom enrichment using OpenAI"""
     if not client:
         return f"Processed: {text[:100]}..."
@@ -558,13 +679,16 @@ def get_custom_enrichment(text, prompt):
     try:
         full_prompt = f"{prompt}\n\nText: \"{text}\""
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": full_prompt}],
-            temperature=0.3
+            temperature=0.3,
+            timeout=ENRICH_ROW_TIMEOUT_S
         )
         
         return response.choices[0].message.content
         
     except Exception as e:
+        if strict:
+            raise
         return f"Error processing: {str(e)}"
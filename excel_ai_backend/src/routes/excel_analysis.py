@@ -1,54 +1,46 @@
-from flask import Blueprint, jsonify, request
-import pandas as pd
+from flask import Blueprint, jsonify, request, url_for
 import numpy as np
 import io
 import os
 import time
-from openai import OpenAI
 import json
 from dotenv import load_dotenv
-import random
-from src.routes.auth import token_required
+from src.routes.auth import token_required, get_optional_user
 from src.models.auth import db
 from src.utils.telemetry import TelemetryTracker, estimate_tokens
-from src.utils.model_router import get_model_chain, get_task_params, get_time_budget_seconds
-from src.utils.cache import cache, cache_key
+from src.utils.model_router import get_model_chain, get_task_params
+from src.utils.cache import cache_key
+from src.utils.semantic_cache import cache_scope, get_cached, set_cached
+from src.utils.correlation import (CORRELATION_MATRIX_MAX_COLUMNS, correlation_matrix, matrix_pairs,
+                                   top_correlations)
+from src.utils.dataset_store import dataset_store, frame_from_payload, DatasetNotFoundError
+from src.utils.excel_readers import ExcelReaderError
+from src.utils.profile_cache import get_profile
+from src.utils.sampling import SamplingError, sample_estimates, sample_from_payload
+from src.utils.serialization import frame_response
+from src.utils.ingest import (allow_upload_body, IncrementalValidator, IngestValidationError, MAX_CSV_UPLOAD_MB,
+                              MAX_EXCEL_UPLOAD_MB, MAX_INLINE_DATA_MB, ingest_upload, owner_key,
+                              upload_file_info)
+from src.utils.ingest_jobs import ingest_jobs, JobNotFoundError
+from src.utils.llm_client import get_client
+from src.utils.model_executor import execute_chain
+from src.utils.sse import sse_response, stream_llm, stream_payload, stream_requested
 
 # Load environment variables
 load_dotenv()
 
 excel_bp = Blueprint('excel', __name__)
 
-# Initialize OpenAI client with API key from environment (lazy / defensive)
-api_key = os.getenv('OPENAI_API_KEY')
-if api_key and api_key != 'sk-test-key-replace-with-real-key':
-    client = OpenAI(api_key=api_key)
-else:
-    client = None
-
-# Model resolution logic with preview + fallback chain
-PREFERRED_MODEL = os.getenv('OPENAI_MODEL', 'gpt-5-preview')  # allow override
-FALLBACK_MODELS = [
-    'gpt-5-preview',      # preview target
-    'gpt-4.1-mini',       # fast general
-    'gpt-4o-mini',        # economical
-    'gpt-4o',             # higher quality
-    'gpt-3.5-turbo'       # legacy fallback
-]
-
-def resolve_model(explicit: str | None = None):
-    """Return the first usable model from (explicit -> env -> fallback list)."""
-    if explicit:
-        return explicit
-    # Ensure preferred model is first in list (may already be)
-    ordered = [PREFERRED_MODEL] + [m for m in FALLBACK_MODELS if m != PREFERRED_MODEL]
-    return ordered[0]
-
-def call_openai_with_retry(messages, max_retries=3, model: str | None = None, max_tokens=800, temperature=0.3, time_budget_s=8):
-    """Enhanced OpenAI API call with retry logic and better error handling.
-
-    Supports preview model enablement via OPENAI_MODEL env var (default gpt-5-preview)
-    and graceful fallback through a defined model list.
+# Upper bound for one /datasets/<id>/rows window
+MAX_WINDOW_ROWS = int(os.getenv('MAX_WINDOW_ROWS', 5000))
+
+# Shared pooled OpenAI client (None when OPENAI_API_KEY is not configured)
+client = get_client()
+
+def call_openai_with_retry(messages, model_chain, max_tokens=800, temperature=0.3, time_budget_s=None):
+    """OpenAI call walking the router's model chain with per-tier time budgets and hedging.
+
+    See src/utils/model_executor.py for the fallback and hedging rules.
     """
     if not client:
         return {
@@ -56,148 +48,19 @@ def call_openai_with_retry(messages, max_retries=3, model: str | None = None, ma
             'error': 'OpenAI API not configured. Please set OPENAI_API_KEY environment variable.',
             'fallback': True
         }
-    
-    last_error = None
-    resolved_model = resolve_model(model)
-    attempted_models = []
-    
-    for attempt in range(max_retries):
-        try:
-            response = client.chat.completions.create(
-                model=resolved_model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                timeout=time_budget_s  # time budget per model tier
-            )
-            
-            attempted_models.append(resolved_model)
-            return {
-                'success': True,
-                'content': response.choices[0].message.content,
-                'usage': response.usage.total_tokens if response.usage else 0,
-                'model_used': resolved_model,
-                'models_tried': attempted_models
-            }
-            
-        except Exception as e:
-            last_error = e
-            error_str = str(e).lower()
-            attempted_models.append(resolved_model)
-
-            # If the error indicates an invalid model name, advance to next fallback immediately
-            if any(kw in error_str for kw in ['does not exist', 'invalid model', 'not found']) and attempt < max_retries - 1:
-                # Choose next model in fallback order that hasn't been tried
-                for candidate in FALLBACK_MODELS:
-                    if candidate not in attempted_models:
-                        resolved_model = candidate
-                        break
-                continue
-            
-            # Handle specific error types
-            if 'rate limit' in error_str or 'quota' in error_str:
-                if attempt < max_retries - 1:
-                    # Exponential backoff with jitter for rate limits
-                    delay = (2 ** attempt) + random.uniform(0, 1)
-                    time.sleep(delay)
-                    continue
-                else:
-                    return {
-                        'success': False,
-                        'error': 'OpenAI API rate limit exceeded. Please try again in a few minutes.',
-                        'retry_after': 60
-                    }
-            
-            elif 'timeout' in error_str or 'connection' in error_str:
-                if attempt < max_retries - 1:
-                    time.sleep(1)  # Short delay for connection issues
-                    continue
-                else:
-                    return {
-                        'success': False,
-                        'error': 'OpenAI API connection timeout. Please check your internet connection and try again.',
-                        'retry_after': 10
-                    }
-            
-            elif 'invalid' in error_str or 'authentication' in error_str:
-                return {
-                    'success': False,
-                    'error': 'OpenAI API authentication failed. Please check your API key configuration.',
-                    'fatal': True
-                }
-            
-            else:
-                # Generic error - retry with exponential backoff
-                if attempt < max_retries - 1:
-                    delay = (2 ** attempt)
-                    time.sleep(delay)
-                    continue
-    
-    # All retries failed
-    return {
-        'success': False,
-        'error': f'OpenAI API request failed after {max_retries} attempts (models tried: {", ".join(attempted_models)}): {str(last_error)}',
-        'retry_after': 30,
-        'models_tried': attempted_models
-    }
+    return execute_chain(messages, model_chain, max_tokens=max_tokens, temperature=temperature,
+                         time_budget_s=time_budget_s)
 
 def validate_file_structure(df, filename):
     """Enhanced file validation with detailed error messages"""
-    errors = []
-    warnings = []
-    
-    # Check if DataFrame is empty
-    if df.empty:
-        errors.append(f"File '{filename}' appears to be empty or contains no readable data.")
-        return {'valid': False, 'errors': errors, 'warnings': warnings}
-    
-    # Check for reasonable size limits
-    if len(df) > 100000:  # 100k rows
-        warnings.append(f"Large dataset detected ({len(df):,} rows). Processing may take longer.")
-    
-    if len(df.columns) > 50:  # 50 columns
-        warnings.append(f"Many columns detected ({len(df.columns)}). Consider focusing on specific columns for better analysis.")
-    
-    # Check for completely empty columns
-    empty_columns = df.columns[df.isnull().all()].tolist()
-    if empty_columns:
-        warnings.append(f"Found {len(empty_columns)} completely empty columns: {', '.join(empty_columns[:5])}")
-    
-    # Check for columns with mostly missing data
-    mostly_empty_cols = []
-    for col in df.columns:
-        missing_pct = (df[col].isnull().sum() / len(df)) * 100
-        if missing_pct > 80:
-            mostly_empty_cols.append(f"{col} ({missing_pct:.1f}% missing)")
-    
-    if mostly_empty_cols:
-        warnings.append(f"Columns with >80% missing data: {', '.join(mostly_empty_cols[:3])}")
-    
-    # Check for duplicate column names
-    duplicate_cols = df.columns[df.columns.duplicated()].tolist()
-    if duplicate_cols:
-        errors.append(f"Duplicate column names found: {', '.join(set(duplicate_cols))}")
-    
-    # Check for very long column names
-    long_cols = [col for col in df.columns if len(str(col)) > 100]
-    if long_cols:
-        warnings.append(f"Very long column names detected ({len(long_cols)} columns). This may affect readability.")
-    
-    return {
-        'valid': len(errors) == 0,
-        'errors': errors,
-        'warnings': warnings,
-        'stats': {
-            'rows': len(df),
-            'columns': len(df.columns),
-            'memory_usage': df.memory_usage(deep=True).sum(),
-            'missing_data_pct': (df.isnull().sum().sum() / (len(df) * len(df.columns))) * 100
-        }
-    }
+    validator = IncrementalValidator(filename, df.columns)
+    validator.update(df)
+    return validator.result()
 
 @excel_bp.route('/upload', methods=['POST'])
 def upload_file():
     """Handle file upload and return basic file information with enhanced validation"""
+    allow_upload_body()
     try:
         if 'file' not in request.files:
             return jsonify({'error': 'No file provided. Please select an Excel (.xlsx, .xls) or CSV file.'}), 400
@@ -214,15 +77,16 @@ def upload_file():
                 'error': f'Unsupported file type. Please upload files with extensions: {", ".join(allowed_extensions)}'
             }), 400
         
-        # Validate file size (16MB limit)
+        # Validate file size (per-type limits, see src/utils/ingest.py)
         file.seek(0, 2)  # Seek to end
         file_size = file.tell()
         file.seek(0)  # Reset to beginning
         
-        max_size = 16 * 1024 * 1024  # 16MB
-        if file_size > max_size:
+        is_csv = filename.endswith('.csv')
+        max_mb = MAX_CSV_UPLOAD_MB if is_csv else MAX_EXCEL_UPLOAD_MB
+        if file_size > max_mb * 1024 * 1024:
             return jsonify({
-                'error': f'File size ({file_size / 1024 / 1024:.1f}MB) exceeds the 16MB limit. Please use a smaller file or split your data.'
+                'error': f'File size ({file_size / 1024 / 1024:.1f}MB) exceeds the {max_mb}MB limit. Please use a smaller file or split your data.'
             }), 400
         
         if file_size < 100:  # Less than 100 bytes
@@ -230,80 +94,122 @@ def upload_file():
                 'error': 'File appears to be too small or empty. Please check your file and try again.'
             }), 400
         
-        # Read the file based on its extension with enhanced error handling
+        # Parse, validate and persist so later calls can send dataset_id instead of rows
+        meta = {'filename': file.filename, 'file_size': file_size}
+        user = get_optional_user()
+        owner = owner_key(user.id if user else None, request.remote_addr)
+        
+        # async=1: spool to disk and parse in the background; poll /jobs/<job_id> for progress
+        if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+            job = ingest_jobs.submit(file.stream, file.filename, owner, meta,
+                                     reader=None if is_csv else request.values.get('reader'), file_size=file_size)
+            status_url = url_for('.get_upload_job', job_id=job['job_id'])
+            return jsonify({
+                'success': True,
+                'job_id': job['job_id'],
+                'status': job['status'],
+                'status_url': status_url
+            }), 202, {'Location': status_url}
+        
         try:
-            if filename.endswith('.xlsx') or filename.endswith('.xls'):
+            if is_csv:
                 try:
-                    df = pd.read_excel(file, engine='openpyxl' if filename.endswith('.xlsx') else 'xlrd')
+                    ingested = ingest_upload(file.stream, file.filename, owner, meta)
+                except IngestValidationError:
+                    raise
                 except Exception as e:
                     return jsonify({
-                        'error': f'Failed to read Excel file: {str(e)}. Please ensure the file is not corrupted and try again.'
+                        'error': f'Failed to read CSV file: {str(e)}. Please check the file format and try again.'
                     }), 400
-            elif filename.endswith('.csv'):
+            else:
                 try:
-                    # Try different encodings for CSV files
-                    df = pd.read_csv(file, encoding='utf-8')
-                except UnicodeDecodeError:
-                    file.seek(0)
-                    try:
-                        df = pd.read_csv(file, encoding='latin1')
-                    except Exception as e:
-                        return jsonify({
-                            'error': f'Failed to read CSV file with encoding issues: {str(e)}. Please save your CSV with UTF-8 encoding.'
-                        }), 400
+                    ingested = ingest_upload(file.stream, file.filename, owner, meta,
+                                             reader=request.values.get('reader'), file_size=file_size)
+                except IngestValidationError:
+                    raise
+                except ExcelReaderError as e:
+                    return jsonify({'error': str(e)}), 400
                 except Exception as e:
                     return jsonify({
-                        'error': f'Failed to read CSV file: {str(e)}. Please check the file format and try again.'
+                        'error': f'Failed to read Excel file: {str(e)}. Please ensure the file is not corrupted and try again.'
                     }), 400
-            else:
-                return jsonify({
-                    'error': 'Unsupported file format. Please upload Excel (.xlsx, .xls) or CSV files.'
-                }), 400
-                
-        except Exception as e:
+        except IngestValidationError as e:
             return jsonify({
-                'error': f'Failed to process file: {str(e)}. Please check that your file is valid and not corrupted.'
+                'error': 'File validation failed',
+                'details': e.validation['errors']
             }), 400
         
-        # Enhanced file validation
-        try:
-            validation_result = validate_file_structure(df, file.filename)
-            if not validation_result['valid']:
-                return jsonify({
-                    'error': 'File validation failed',
-                    'details': validation_result['errors']
-                }), 400
-        except Exception as e:
-            return jsonify({'error': f'Error reading file: {str(e)}. Please ensure the file is not corrupted and is in a supported format.'}), 400
+        dataset_id = ingested['dataset_id']
+        file_info = upload_file_info(ingested, file.filename, file_size)
         
-        # Validate DataFrame
-        if df.empty:
-            return jsonify({'error': 'The uploaded file appears to be empty'}), 400
+        response = {
+            'success': True,
+            'dataset_id': dataset_id,
+            'file_info': file_info
+        }
+        # Full rows are still returned by default for older clients; pass include_data=false to skip them.
+        # Large streamed files are never inlined - use dataset_id.
+        if request.values.get('include_data', 'true').lower() not in ('0', 'false', 'no'):
+            if file_size <= MAX_INLINE_DATA_MB * 1024 * 1024:
+                return frame_response(response, ('data',), dataset_store.get(dataset_id))
+            response['data_omitted'] = True
+        return jsonify(response)
         
-        if len(df.columns) == 0:
-            return jsonify({'error': 'The uploaded file has no columns'}), 400
+    except Exception as e:
+        return jsonify({'error': f'Error processing file: {str(e)}'}), 500
+
+@excel_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_upload_job(job_id):
+    """Report progress of an async upload and, once done, its dataset handle"""
+    try:
+        user = get_optional_user()
+        job = ingest_jobs.get(job_id, owner_key(user.id if user else None, request.remote_addr))
+        job.pop('owner', None)
+        if job['bytes_total']:
+            job['progress'] = round(min(job['bytes_read'] / job['bytes_total'], 1.0), 3)
+        job['success'] = job['status'] != 'failed'
+        return jsonify(job)
+    except JobNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'Error reading upload job: {str(e)}'}), 500
+
+@excel_bp.route('/datasets/<dataset_id>/rows', methods=['GET'])
+def get_dataset_rows(dataset_id):
+    """Return one window of a stored dataset so grids can virtualize large sheets"""
+    try:
+        offset = request.args.get('offset', 0, type=int)
+        limit = request.args.get('limit', 100, type=int)
+        if offset < 0 or limit < 1:
+            return jsonify({'error': 'offset must be >= 0 and limit must be >= 1'}), 400
+        limit = min(limit, MAX_WINDOW_ROWS)
         
-        # Basic file information
-        file_info = {
-            'filename': file.filename,
-            'file_size': file_size,
-            'rows': len(df),
-            'columns': len(df.columns),
-            'column_names': df.columns.tolist(),
-            'data_types': df.dtypes.astype(str).to_dict(),
-            'preview': df.head(5).to_dict('records')
-        }
+        meta = dataset_store.meta(dataset_id)
+        # columns=a,b or repeated columns=a&columns=b
+        columns = [c for value in request.args.getlist('columns') for c in value.split(',') if c] or None
+        # sort=col for ascending, sort=-col for descending; comma separated for multiple keys
+        sort = [
+            (key[1:], 'descending') if key.startswith('-') else (key, 'ascending')
+            for value in request.args.getlist('sort') for key in value.split(',') if key
+        ]
+        unknown = [c for c in (columns or []) + [name for name, _ in sort] if c not in meta['columns']]
+        if unknown:
+            return jsonify({'error': f'Unknown columns: {", ".join(unknown)}'}), 400
         
-        # Store the dataframe in session or temporary storage
-        # For now, we'll return the data directly
+        window, total_rows = dataset_store.read_window(dataset_id, offset, limit, columns, sort or None)
         return jsonify({
             'success': True,
-            'file_info': file_info,
-            'data': df.to_dict('records')
+            'dataset_id': dataset_id,
+            'offset': offset,
+            'limit': limit,
+            'total_rows': total_rows,
+            'columns': window.columns.tolist(),
+            'rows': json.loads(window.to_json(orient='records', date_format='iso'))
         })
-        
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
-        return jsonify({'error': f'Error processing file: {str(e)}'}), 500
+        return jsonify({'error': f'Error reading dataset rows: {str(e)}'}), 500
 
 @excel_bp.route('/analyze', methods=['POST'])
 @token_required
@@ -312,14 +218,16 @@ def analyze_data(current_user):
     with TelemetryTracker(current_user.id, 'analysis', '/excel/analyze') as tracker:
         try:
             data = request.json
-            if 'data' not in data:
+            # Load the stored dataset (or fall back to inline rows); sample=true profiles
+            # a seeded sample of large datasets, see src/utils/sampling.py
+            df, sampling = sample_from_payload(data)
+            if df is None:
                 return jsonify({'error': 'No data provided for analysis'}), 400
             
-            # Convert data back to DataFrame
-            df = pd.DataFrame(data['data'])
-            
-            # Generate basic statistics
-            insights = generate_insights(df)
+            # Generate basic statistics (approx=true profiles with sketches, see src/utils/sketches.py)
+            approx = str(data.get('approx', '')).lower() in ('1', 'true', 'yes')
+            profile = get_profile(df, None if sampling else data.get('dataset_id'), approx)
+            insights = generate_insights(df, approx, profile, sampling)
             
             if not current_user.can_query():
                 return jsonify({'error': 'Query limit reached for current plan', 'limit_reached': True}), 429
@@ -332,7 +240,8 @@ def analyze_data(current_user):
             if isinstance(ai_insights, dict) and 'error' not in ai_insights:
                 estimated_tokens = estimate_tokens(str(ai_insights))
                 tracker.set_ai_metadata(
-                    model_used=resolve_model(),
+                    model_used=ai_insights.get('model_used'),
+                    fallback_used=ai_insights.get('fallback_used', False),
                     tokens_used=estimated_tokens
                 )
             
@@ -344,21 +253,27 @@ def analyze_data(current_user):
                 'ai_insights': ai_insights
             })
             
+        except SamplingError as e:
+            return jsonify({'error': str(e)}), 400
+        except DatasetNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
         except Exception as e:
             return jsonify({'error': f'Error analyzing data: {str(e)}'}), 500
 
 @excel_bp.route('/query', methods=['POST'])
 @token_required
 def query_data(current_user):
-    """Handle natural language queries about the data"""
+    """Handle natural language queries about the data (``?stream=1`` streams the answer over SSE)"""
+    if stream_requested():
+        return stream_query(current_user)
     with TelemetryTracker(current_user.id, 'query', '/excel/query') as tracker:
         try:
             data = request.json
-            if 'query' not in data or 'data' not in data:
+            df = frame_from_payload(data)
+            if 'query' not in data or df is None:
                 return jsonify({'error': 'Query and data are required'}), 400
             
             query = data['query']
-            df = pd.DataFrame(data['data'])
             
             if not current_user.can_query():
                 return jsonify({'error': 'Query limit reached for current plan', 'limit_reached': True}), 429
@@ -384,18 +299,75 @@ def query_data(current_user):
                 'fallback_used': ai_resp.get('fallback_used') if isinstance(ai_resp, dict) else False
             })
             
+        except DatasetNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
         except Exception as e:
             return jsonify({'error': f'Error processing query: {str(e)}'}), 500
 
+def query_payload(ai_resp):
+    return {
+        'success': True,
+        'response': ai_resp.get('content'),
+        'model_used': ai_resp.get('model_used'),
+        'fallback_used': ai_resp.get('fallback_used', False)
+    }
+
+def stream_query(current_user):
+    """SSE variant of /query: token events, then the usual JSON payload as the ``done`` event."""
+    started = time.time()
+    try:
+        data = request.json
+        df = frame_from_payload(data)
+        if 'query' not in data or df is None:
+            return jsonify({'error': 'Query and data are required'}), 400
+        if not current_user.can_query():
+            return jsonify({'error': 'Query limit reached for current plan', 'limit_reached': True}), 429
+        if not client:
+            return jsonify({'error': 'AI not configured'}), 503
+        query = data['query']
+        messages, model_chain, params, ckey, scope = build_query_request(df, query)
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'Error processing query: {str(e)}'}), 500
+
+    def record(ai_resp):
+        with TelemetryTracker(current_user.id, 'query', '/excel/query', start_time=started) as tracker:
+            tracker.set_ai_metadata(
+                model_used=ai_resp.get('model_used'),
+                fallback_used=ai_resp.get('fallback_used', False),
+                tokens_used=estimate_tokens(ai_resp.get('content', ''))
+            )
+            tracker.success = not ai_resp.get('error')
+
+    cached = cached_query_result(ckey, query, scope)
+    if cached:
+        record(cached)
+        current_user.increment_usage('query')
+        return stream_payload(query_payload(cached))
+
+    def finish(retry_resp, latency_ms):
+        result = query_result(retry_resp)
+        set_cached('chat_query', ckey, query, scope, result, 3600)
+        record(result)
+        current_user.increment_usage('query')
+        return query_payload(result)
+
+    def failed(retry_resp):
+        record({'content': '', 'error': True, 'models_tried': retry_resp.get('models_tried', [])})
+
+    return sse_response(stream_llm(messages, model_chain, finish, max_tokens=params['max_tokens'],
+                                   temperature=params['temperature'], on_error=failed))
+
 @excel_bp.route('/formulas', methods=['POST'])
 def suggest_formulas():
     """Suggest Excel formulas based on data structure and user intent"""
     try:
         data = request.json
-        if 'data' not in data:
+        df = frame_from_payload(data)
+        if df is None:
             return jsonify({'error': 'No data provided'}), 400
         
-        df = pd.DataFrame(data['data'])
         intent = data.get('intent', 'general analysis')
         
         # Generate formula suggestions
@@ -406,11 +378,22 @@ def suggest_formulas():
             'formulas': formulas
         })
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Error generating formulas: {str(e)}'}), 500
 
-def generate_insights(df):
-    """Generate comprehensive statistical insights from the dataframe"""
+def generate_insights(df, approx=False, profile=None, sampling=None):
+    """Generate comprehensive statistical insights from the dataframe
+
+    Column statistics come from the shared profile cache (see
+    src/utils/profile_cache.py). With approx=True, quartiles, distinct counts
+    and most common values are estimated with mergeable sketches and the error
+    bounds are returned under 'approximation'. When df is a sample (sampling
+    from sample_from_payload), full-dataset estimates with confidence intervals
+    are returned under 'sampling'.
+    """
+    profile = profile or get_profile(df, approx=approx)
     insights = {
         'summary_stats': {},
         'data_quality': {},
@@ -419,87 +402,59 @@ def generate_insights(df):
         'distributions': {}
     }
     
-    # Summary statistics for numeric columns
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
-    for col in numeric_cols:
-        col_data = df[col].dropna()
-        if len(col_data) > 0:
-            insights['summary_stats'][col] = {
-                'count': len(col_data),
-                'mean': float(col_data.mean()),
-                'median': float(col_data.median()),
-                'std': float(col_data.std()),
-                'min': float(col_data.min()),
-                'max': float(col_data.max()),
-                'q25': float(col_data.quantile(0.25)),
-                'q75': float(col_data.quantile(0.75)),
-                'missing_count': int(df[col].isna().sum()),
-                'skewness': float(col_data.skew()) if len(col_data) > 2 else 0,
-                'kurtosis': float(col_data.kurtosis()) if len(col_data) > 3 else 0
-            }
+    # Summary statistics for numeric columns (all columns at once, see src/utils/profiler.py)
+    numeric_cols = profile.numeric_columns
+    insights['summary_stats'] = profile.summary_stats
 
     # Data quality assessment
     insights['data_quality'] = {
-        'total_rows': len(df),
-        'total_columns': len(df.columns),
-        'missing_values': int(df.isna().sum().sum()),
-        'duplicate_rows': int(df.duplicated().sum()),
+        'total_rows': profile.rows,
+        'total_columns': len(profile.columns),
+        'missing_values': sum(profile.missing.values()),
+        'duplicate_rows': profile.duplicate_rows,
         'numeric_columns': len(numeric_cols),
-        'text_columns': len(df.select_dtypes(include=['object']).columns),
-        'memory_usage_mb': round(df.memory_usage(deep=True).sum() / 1024 / 1024, 2),
-        'column_types': df.dtypes.astype(str).to_dict()
+        'text_columns': len(profile.categorical_columns),
+        'memory_usage_mb': round(profile.memory_usage_bytes / 1024 / 1024, 2),
+        'column_types': dict(profile.dtypes)
     }
 
     # Distribution analysis for categorical columns
-    categorical_columns = df.select_dtypes(include=['object', 'category']).columns
-    for col in categorical_columns:
-        if len(df[col].dropna()) > 0:
-            value_counts = df[col].value_counts().head(10)
+    for col in profile.categorical_columns:
+        if profile.non_null(col) > 0:
             insights['distributions'][col] = {
-                'unique_values': int(df[col].nunique()),
-                'most_common': value_counts.to_dict(),
-                'missing_count': int(df[col].isnull().sum())
+                'unique_values': profile.unique[col],
+                'most_common': profile.top_values[col],
+                'missing_count': profile.missing[col]
             }
 
-    # Correlation analysis
+    # Correlation analysis: computed once; wide frames report the strongest pairs only
+    high_corr_pairs = []
     if len(numeric_cols) > 1:
         try:
-            correlation_matrix = df[numeric_cols].corr()
-            insights['correlations'] = correlation_matrix.round(3).to_dict()
+            if len(numeric_cols) <= CORRELATION_MATRIX_MAX_COLUMNS:
+                matrix = correlation_matrix(df, numeric_cols)
+                insights['correlations'] = matrix.round(3).to_dict()
+                high_corr_pairs = [pair for pair in matrix_pairs(matrix, 0.7) if abs(pair['correlation']) > 0.7]
+            else:
+                insights['correlations'] = {}
+                high_corr_pairs = [pair for pair in top_correlations(df, numeric_cols, threshold=0.7)
+                                   if abs(pair['correlation']) > 0.7]
         except:
             insights['correlations'] = {}
 
     # Identify patterns
-    if len(numeric_cols) > 0:
-        # Find columns with high correlation
-        try:
-            corr_matrix = df[numeric_cols].corr()
-            high_corr_pairs = []
-            for i in range(len(corr_matrix.columns)):
-                for j in range(i+1, len(corr_matrix.columns)):
-                    corr_val = corr_matrix.iloc[i, j]
-                    if abs(corr_val) > 0.7 and not pd.isna(corr_val):
-                        high_corr_pairs.append({
-                            'column1': corr_matrix.columns[i],
-                            'column2': corr_matrix.columns[j],
-                            'correlation': float(corr_val)
-                        })
-            
-            if high_corr_pairs:
-                insights['patterns'].append({
-                    'type': 'high_correlation',
-                    'description': 'Found columns with high correlation',
-                    'details': high_corr_pairs
-                })
-        except:
-            pass
+    if high_corr_pairs:
+        insights['patterns'].append({
+            'type': 'high_correlation',
+            'description': 'Found columns with high correlation',
+            'details': high_corr_pairs
+        })
 
     # Detect potential data quality issues
     quality_issues = []
     
     # High missing value columns
-    missing_percentage = (df.isnull().sum() / len(df)) * 100
-    high_missing_cols = missing_percentage[missing_percentage > 20].index.tolist()
+    high_missing_cols = [col for col in profile.columns if profile.rows and profile.missing[col] / profile.rows * 100 > 20]
     if high_missing_cols:
         quality_issues.append(f"High missing values (>20%) in: {', '.join(high_missing_cols)}")
     
@@ -509,34 +464,27 @@ def generate_insights(df):
         quality_issues.append(f"Found {insights['data_quality']['duplicate_rows']} duplicate rows ({duplicate_percentage:.1f}%)")
     
     # Constant columns
-    constant_cols = [col for col in df.columns if df[col].nunique() <= 1]
+    constant_cols = [col for col in profile.columns if profile.unique[col] <= 1]
     if constant_cols:
         quality_issues.append(f"Constant value columns: {', '.join(constant_cols)}")
     
     # Outliers detection (simple IQR method)
-    for col in numeric_cols:
-        if col in insights['summary_stats']:
-            Q1 = insights['summary_stats'][col]['q25']
-            Q3 = insights['summary_stats'][col]['q75']
-            IQR = Q3 - Q1
-            if IQR > 0:
-                lower_bound = Q1 - 1.5 * IQR
-                upper_bound = Q3 + 1.5 * IQR
-                outliers = df[(df[col] < lower_bound) | (df[col] > upper_bound)][col]
-                if len(outliers) > 0:
-                    outlier_percentage = (len(outliers) / len(df)) * 100
-                    if outlier_percentage > 5:  # Only report if >5% outliers
-                        quality_issues.append(f"Potential outliers in {col}: {len(outliers)} values ({outlier_percentage:.1f}%)")
+    for col, outlier_count in profile.outlier_counts.items():
+        if outlier_count > 0:
+            outlier_percentage = (outlier_count / len(df)) * 100
+            if outlier_percentage > 5:  # Only report if >5% outliers
+                quality_issues.append(f"Potential outliers in {col}: {outlier_count} values ({outlier_percentage:.1f}%)")
     
     insights['data_quality']['issues'] = quality_issues
+    if approx:
+        insights['approximation'] = profile.error_bounds
+    if sampling:
+        insights['sampling'] = {**sampling, 'estimates': sample_estimates(df, profile, sampling)}
 
     return insights
 
 def generate_ai_insights(df, basic_insights):
-    """Generate AI-powered insights using OpenAI with retry mechanism"""
-    max_retries = 3
-    retry_delay = 1
-    
+    """Generate AI-powered insights, walking the 'insights' model chain"""
     # Check if OpenAI client is available
     if not client:
         return {
@@ -546,93 +494,88 @@ def generate_ai_insights(df, basic_insights):
             'business_insights': []
         }
     
-    for attempt in range(max_retries):
-        try:
-            # Prepare data summary for AI
-            data_summary = {
-                'columns': df.columns.tolist(),
-                'data_types': df.dtypes.astype(str).to_dict(),
-                'shape': df.shape,
-                'sample_data': df.head(3).to_dict('records'),
-                'basic_insights': basic_insights
+    try:
+        # Prepare data summary for AI
+        data_summary = {
+            'columns': df.columns.tolist(),
+            'data_types': df.dtypes.astype(str).to_dict(),
+            'shape': df.shape,
+            'sample_data': df.head(3).to_dict('records'),
+            'basic_insights': basic_insights
+        }
+        
+        prompt = f"""
+        Analyze this dataset and provide actionable insights:
+        
+        Dataset Summary:
+        {json.dumps(data_summary, indent=2)}
+        
+        Please provide:
+        1. Key findings and trends
+        2. Potential data quality issues
+        3. Recommendations for further analysis
+        4. Business insights (if applicable)
+        
+        Format your response as a JSON object with these keys:
+        - key_findings: array of strings
+        - data_quality_issues: array of strings
+        - recommendations: array of strings
+        - business_insights: array of strings
+        """
+        
+        result = call_openai_with_retry([
+            {"role": "system", "content": "You are a data analyst expert. Provide clear, actionable insights about datasets."},
+            {"role": "user", "content": prompt}
+        ], get_model_chain(None, 'insights'), max_tokens=1000, temperature=0.3)
+    except Exception as e:
+        result = {'success': False, 'error': str(e)}
+    
+    if not result.get('success'):
+        if result.get('fatal'):
+            return {
+                'key_findings': ['AI analysis requires a valid OpenAI API key'],
+                'data_quality_issues': ['API key configuration issue'],
+                'recommendations': ['Please check your OpenAI API key configuration'],
+                'business_insights': []
             }
-            
-            prompt = f"""
-            Analyze this dataset and provide actionable insights:
-            
-            Dataset Summary:
-            {json.dumps(data_summary, indent=2)}
-            
-            Please provide:
-            1. Key findings and trends
-            2. Potential data quality issues
-            3. Recommendations for further analysis
-            4. Business insights (if applicable)
-            
-            Format your response as a JSON object with these keys:
-            - key_findings: array of strings
-            - data_quality_issues: array of strings
-            - recommendations: array of strings
-            - business_insights: array of strings
-            """
-            
-            response = client.chat.completions.create(
-                model=resolve_model(),
-                messages=[
-                    {"role": "system", "content": "You are a data analyst expert. Provide clear, actionable insights about datasets."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=1000,
-                temperature=0.3,
-                timeout=30
-            )
-            
-            # Parse the AI response
-            ai_response = response.choices[0].message.content
-            
-            # Try to parse as JSON, fallback to structured text
-            try:
-                ai_insights = json.loads(ai_response)
-                
-                # Validate the response structure
-                required_keys = ['key_findings', 'data_quality_issues', 'recommendations', 'business_insights']
-                for key in required_keys:
-                    if key not in ai_insights:
-                        ai_insights[key] = []
-                        
-                return ai_insights
-                
-            except json.JSONDecodeError:
-                return {
-                    'key_findings': [ai_response[:500] + "..." if len(ai_response) > 500 else ai_response],
-                    'data_quality_issues': [],
-                    'recommendations': [],
-                    'business_insights': []
-                }
-                
-        except Exception as e:
-            if attempt < max_retries - 1:
-                time.sleep(retry_delay * (2 ** attempt))  # Exponential backoff
-                continue
-            else:
-                error_msg = str(e)
-                if "API key" in error_msg:
-                    return {
-                        'key_findings': ['AI analysis requires a valid OpenAI API key'],
-                        'data_quality_issues': ['API key configuration issue'],
-                        'recommendations': ['Please check your OpenAI API key configuration'],
-                        'business_insights': []
-                    }
-                else:
-                    return {
-                        'key_findings': [f"AI analysis temporarily unavailable: {error_msg}"],
-                        'data_quality_issues': [],
-                        'recommendations': ['Try again later or contact support if the issue persists'],
-                        'business_insights': []
-                    }
+        return {
+            'key_findings': [f"AI analysis temporarily unavailable: {result.get('error')}"],
+            'data_quality_issues': [],
+            'recommendations': ['Try again later or contact support if the issue persists'],
+            'business_insights': []
+        }
+    
+    # Parse the AI response
+    ai_response = result['content']
+    
+    # Try to parse as JSON, fallback to structured text
+    try:
+        ai_insights = json.loads(ai_response)
+        
+        # Validate the response structure
+        required_keys = ['key_findings', 'data_quality_issues', 'recommendations', 'business_insights']
+        for key in required_keys:
+            if key not in ai_insights:
+                ai_insights[key] = []
+        
+    except json.JSONDecodeError:
+        ai_insights = {
+            'key_findings': [ai_response[:500] + "..." if len(ai_response) > 500 else ai_response],
+            'data_quality_issues': [],
+            'recommendations': [],
+            'business_insights': []
+        }
+    
+    # Which tier answered, for telemetry
+    ai_insights['model_used'] = result['model_used']
+    ai_insights['fallback_used'] = result['fallback_used']
+    ai_insights['hedge_won'] = result['hedge_won']
+    return ai_insights
 
-def process_natural_language_query(df, query):
-    """Process natural language queries about the data returning structured info."""
+QUERY_SYSTEM_PROMPT = "You are a helpful data analyst assistant. Provide clear, practical responses about data analysis."
+
+def build_query_request(df, query):
+    """Messages, model chain, task params and cache key for a natural language query."""
     # Prepare context about the data
     data_context = {
         'columns': df.columns.tolist(),
@@ -653,37 +596,53 @@ def process_natural_language_query(df, query):
 
     If the query requires calculations, provide the approach but note that actual calculations would need to be performed on the full dataset.
     """
+    task = 'chat_query'
+    model_chain = get_model_chain(None, task)
+    messages = [
+        {"role": "system", "content": QUERY_SYSTEM_PROMPT},
+        {"role": "user", "content": prompt}
+    ]
+    ckey = cache_key(task, {'query': query, 'columns': data_context['columns']}, model_chain)
+    # Similar questions about the same columns may share an answer (semantic cache tier)
+    scope = cache_scope(task, {'columns': data_context['columns']}, model_chain, data_context['columns'])
+    return messages, model_chain, get_task_params(task), ckey, scope
+
+def cached_query_result(ckey, query, scope):
+    cached = get_cached('chat_query', ckey, query, scope)
+    if cached:
+        return {
+            'content': cached['content'],
+            'model_used': cached['model_used'],
+            'models_tried': cached.get('models_tried', []),
+            'fallback_used': cached.get('fallback_used', False)
+        }
+    return None
+
+def query_result(retry_resp):
+    """Cacheable query result from a successful chain response."""
+    return {
+        'content': retry_resp.get('content'),
+        'model_used': retry_resp.get('model_used'),
+        'models_tried': retry_resp.get('models_tried', []),
+        'fallback_used': retry_resp.get('fallback_used', False),
+        'hedge_won': retry_resp.get('hedge_won', False)
+    }
+
+def process_natural_language_query(df, query):
+    """Process natural language queries about the data returning structured info."""
     # Router + cache + retry helper for fallback visibility
     if client:
         try:
-            task = 'chat_query'
-            model_chain = get_model_chain(None, task)
-            params = get_task_params(task)
-            ckey = cache_key(task, {'query': query, 'columns': data_context['columns']}, model_chain)
-            cached = cache.get(ckey)
+            messages, model_chain, params, ckey, scope = build_query_request(df, query)
+            cached = cached_query_result(ckey, query, scope)
             if cached:
-                return {
-                    'content': cached['content'],
-                    'model_used': cached['model_used'],
-                    'models_tried': cached.get('models_tried', []),
-                    'fallback_used': cached.get('fallback_used', False)
-                }
+                return cached
 
-            retry_resp = call_openai_with_retry([
-                {"role": "system", "content": "You are a helpful data analyst assistant. Provide clear, practical responses about data analysis."},
-                {"role": "user", "content": prompt}
-            ], max_retries=3, max_tokens=params['max_tokens'], temperature=params['temperature'], time_budget_s=get_time_budget_seconds(model_chain[0]))
+            retry_resp = call_openai_with_retry(messages, model_chain, max_tokens=params['max_tokens'],
+                                                temperature=params['temperature'])
             if retry_resp.get('success'):
-                models_tried = retry_resp.get('models_tried', [])
-                model_used = retry_resp.get('model_used')
-                fallback_used = bool(models_tried and model_used and model_used != models_tried[0])
-                result = {
-                    'content': retry_resp.get('content'),
-                    'model_used': model_used,
-                    'models_tried': models_tried,
-                    'fallback_used': fallback_used
-                }
-                cache.set(ckey, result, 3600)
+                result = query_result(retry_resp)
+                set_cached('chat_query', ckey, query, scope, result, 3600)
                 return result
             else:
                 return {
@@ -4,6 +4,16 @@ import numpy as np
 from datetime import datetime
 import re
 from typing import Dict, List, Any, Optional
+from src.utils.dataset_store import dataset_store, frame_from_payload, DatasetNotFoundError
+from src.utils.excel_readers import ExcelReaderError
+from src.utils.ingest import IngestValidationError, allow_upload_body, ingest_upload, owner_key
+from src.routes.auth import get_optional_user
+from src.utils.compaction import expand_categories
+from src.utils.correlation import (CORRELATION_MATRIX_MAX_COLUMNS, METHODS as CORRELATION_METHODS,
+                                   correlation_matrix, matrix_pairs, top_correlations)
+from src.utils.duplicates import NEAR_DUPLICATE_THRESHOLD, drop_duplicate_rows, near_duplicates
+from src.utils.parallel_profile import map_columns, use_parallel
+from src.utils.profile_cache import get_profile, DatasetProfile
 
 features_bp = Blueprint('features', __name__)
 
@@ -17,34 +27,58 @@ def data_cleaning():
     Automated Data Cleaning Feature
     Analyzes uploaded data and suggests/applies cleaning operations
     """
+    allow_upload_body()
     try:
-        if 'file' not in request.files:
-            return jsonify({'error': 'No file provided'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
-        
-        # Read the file
-        if file.filename.endswith('.csv'):
-            df_original = pd.read_csv(file)
-        elif file.filename.endswith(('.xlsx', '.xls')):
-            df_original = pd.read_excel(file)
+        dataset_id = request.values.get('dataset_id')
+        if dataset_id:
+            # Previously uploaded dataset - skip re-parsing the file
+            df_original = expand_categories(dataset_store.get(dataset_id))
         else:
-            return jsonify({'error': 'Unsupported file format'}), 400
-        
-        # Perform data quality analysis
-        quality_issues = analyze_data_quality(df_original)
+            if 'file' not in request.files:
+                return jsonify({'error': 'No file provided'}), 400
+            
+            file = request.files['file']
+            if file.filename == '':
+                return jsonify({'error': 'No file selected'}), 400
+            
+            if not file.filename.lower().endswith(('.csv', '.xlsx', '.xls')):
+                return jsonify({'error': 'Unsupported file format'}), 400
+            
+            # Parse and store the file, or reuse the stored parse of identical bytes
+            user = get_optional_user()
+            try:
+                ingested = ingest_upload(file.stream, file.filename, owner_key(user.id if user else None, request.remote_addr),
+                                         {'filename': file.filename}, reader=request.values.get('reader'))
+            except IngestValidationError as e:
+                return jsonify({'error': 'File validation failed', 'details': e.validation['errors']}), 400
+            except ExcelReaderError as e:
+                return jsonify({'error': str(e)}), 400
+            dataset_id = ingested['dataset_id']
+            df_original = expand_categories(dataset_store.get(dataset_id))
+        
+        # Perform data quality analysis (approx=true uses quantile sketches for outlier bounds)
+        approx = request.values.get('approx', '').lower() in ('1', 'true', 'yes')
+        near_threshold = None
+        if request.values.get('near_duplicates', '').lower() in ('1', 'true', 'yes'):
+            try:
+                near_threshold = float(request.values.get('near_duplicate_threshold', NEAR_DUPLICATE_THRESHOLD))
+            except ValueError:
+                near_threshold = -1
+            if not 0 < near_threshold <= 1:
+                return jsonify({'error': 'near_duplicate_threshold must be a number in (0, 1]'}), 400
+        profile = get_profile(df_original, dataset_id, approx)
+        quality_issues = analyze_data_quality(df_original, approx, profile, near_threshold)
         
         # Generate cleaning suggestions
         cleaning_suggestions = generate_cleaning_suggestions(df_original, quality_issues)
         
         # Apply automatic cleaning (safe operations only)
-        df_cleaned, applied_operations = apply_safe_cleaning(df_original, cleaning_suggestions)
+        df_cleaned, applied_operations = apply_safe_cleaning(df_original, cleaning_suggestions, profile)
         
         # Prepare response with before/after comparison
         response = {
             'success': True,
+            'dataset_id': dataset_id,
             'original_data': {
                 'rows': len(df_original),
                 'columns': len(df_original.columns),
@@ -65,11 +99,16 @@ def data_cleaning():
         
         return jsonify(response)
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Data cleaning failed: {str(e)}'}), 500
 
-def analyze_data_quality(df: pd.DataFrame) -> Dict[str, Any]:
-    """Analyze data quality issues in the DataFrame"""
+def analyze_data_quality(df: pd.DataFrame, approx: bool = False,
+                         profile: Optional[DatasetProfile] = None,
+                         near_threshold: Optional[float] = None) -> Dict[str, Any]:
+    """Analyze data quality issues in the DataFrame (near-duplicate rows too when near_threshold is given)"""
+    profile = profile or get_profile(df, approx=approx)
     issues = {
         'missing_values': {},
         'duplicates': {},
@@ -80,25 +119,27 @@ def analyze_data_quality(df: pd.DataFrame) -> Dict[str, Any]:
     }
     
     # Missing values analysis
-    missing_counts = df.isnull().sum()
+    missing_counts = {col: count for col, count in profile.missing.items() if count > 0}
     issues['missing_values'] = {
-        'total_missing': int(missing_counts.sum()),
-        'by_column': missing_counts[missing_counts > 0].to_dict(),
-        'percentage_by_column': ((missing_counts / len(df)) * 100)[missing_counts > 0].round(2).to_dict()
+        'total_missing': sum(missing_counts.values()),
+        'by_column': missing_counts,
+        'percentage_by_column': {col: round(count / len(df) * 100, 2) for col, count in missing_counts.items()}
     }
     
     # Duplicate rows
-    duplicate_count = df.duplicated().sum()
+    duplicate_count = profile.duplicate_rows
     issues['duplicates'] = {
         'count': int(duplicate_count),
         'percentage': round((duplicate_count / len(df)) * 100, 2)
     }
+    if near_threshold is not None:
+        issues['near_duplicates'] = near_duplicates(df, near_threshold, profile.duplicate_positions)
     
     # Data type issues
     issues['data_types'] = analyze_data_types(df)
     
     # Outliers (for numeric columns)
-    issues['outliers'] = detect_outliers(df)
+    issues['outliers'] = detect_outliers(df, profile)
     
     # Text inconsistencies
     issues['inconsistencies'] = detect_text_inconsistencies(df)
@@ -116,16 +157,14 @@ def analyze_data_quality(df: pd.DataFrame) -> Dict[str, Any]:
         'total_issues_detected': total_issues,
         'data_quality_score': max(0, 100 - (total_issues / len(df)) * 10)  # Simple scoring
     }
+    if approx:
+        issues['approximation'] = profile.error_bounds
     
     return issues
 
-def analyze_data_types(df: pd.DataFrame) -> Dict[str, Any]:
-    """Analyze and suggest data type improvements"""
-    suggestions = {
-        'current_types': df.dtypes.astype(str).to_dict(),
-        'suggested_conversions': {}
-    }
-    
+def suggest_type_conversions(df: pd.DataFrame) -> Dict[str, Any]:
+    """Per-column type conversion suggestions (run per column partition on wide frames)"""
+    conversions = {}
     for column in df.columns:
         col_data = df[column].dropna()
         if len(col_data) == 0:
@@ -136,7 +175,7 @@ def analyze_data_types(df: pd.DataFrame) -> Dict[str, Any]:
         confidence = 0
         
         # Check if object column could be numeric
-        if current_type == 'object':
+        if current_type in ('object', 'category'):
             try:
                 # Try to convert to numeric
                 pd.to_numeric(col_data, errors='raise')
@@ -156,27 +195,37 @@ def analyze_data_types(df: pd.DataFrame) -> Dict[str, Any]:
                         confidence = 80
         
         if suggested_type and confidence > 70:
-            suggestions['suggested_conversions'][column] = {
+            conversions[column] = {
                 'from': current_type,
                 'to': suggested_type,
                 'confidence': confidence
             }
     
-    return suggestions
+    return conversions
 
-def detect_outliers(df: pd.DataFrame) -> Dict[str, List]:
-    """Detect outliers in numeric columns using IQR method"""
-    outliers = {}
+def analyze_data_types(df: pd.DataFrame) -> Dict[str, Any]:
+    """Analyze and suggest data type improvements"""
+    parts = map_columns(df, suggest_type_conversions) if use_parallel(df) else None
+    conversions = {}
+    for part in parts if parts is not None else [suggest_type_conversions(df)]:
+        conversions.update(part)
     
-    numeric_columns = df.select_dtypes(include=[np.number]).columns
+    return {
+        'current_types': df.dtypes.astype(str).to_dict(),
+        'suggested_conversions': {col: conversions[col] for col in df.columns if col in conversions}
+    }
+
+def detect_outliers(df: pd.DataFrame, profile: Optional[DatasetProfile] = None) -> Dict[str, List]:
+    """Detect outliers in numeric columns using IQR method (quartiles from the dataset profile)"""
+    outliers = {}
+    profile = profile or get_profile(df)
     
-    for column in numeric_columns:
-        col_data = df[column].dropna()
-        if len(col_data) < 4:  # Need at least 4 values for quartiles
+    for column in profile.numeric_columns:
+        if profile.non_null(column) < 4:  # Need at least 4 values for quartiles
             continue
         
-        Q1 = col_data.quantile(0.25)
-        Q3 = col_data.quantile(0.75)
+        Q1 = profile.summary_stats[column]['q25']
+        Q3 = profile.summary_stats[column]['q75']
         IQR = Q3 - Q1
         
         lower_bound = Q1 - 1.5 * IQR
@@ -194,51 +243,83 @@ def detect_outliers(df: pd.DataFrame) -> Dict[str, List]:
     
     return outliers
 
+# Formats told apart in phone/email/date columns, checked in this order
+_TEXT_FORMATS = (
+    ('phone_dash', re.compile(r'\d{3}-\d{3}-\d{4}')),
+    ('phone_paren', re.compile(r'\(\d{3}\)\s\d{3}-\d{4}')),
+)
+# Offending values returned per issue
+INCONSISTENCY_SAMPLES = 5
+
+
+def _issue(mask: np.ndarray, text: np.ndarray, counts: np.ndarray) -> Dict[str, Any]:
+    """Row count and most frequent offending values for a mask over unique values"""
+    offenders = np.flatnonzero(mask)
+    top = offenders[np.argsort(-counts[offenders], kind='stable')[:INCONSISTENCY_SAMPLES]]
+    return {'count': int(counts[offenders].sum()), 'samples': text[top].tolist()}
+
+
 def detect_text_inconsistencies(df: pd.DataFrame) -> Dict[str, Any]:
-    """Detect text formatting inconsistencies"""
+    """Detect text formatting inconsistencies
+
+    Each column is factorized once and the checks run over its unique values
+    with numpy's vectorized string functions; every issue reports the number of
+    affected rows and the most frequent offenders under 'by_issue'.
+    """
     inconsistencies = {
         'columns_with_issues': [],
-        'details': {}
+        'details': {},
+        'by_issue': {}
     }
     
-    text_columns = df.select_dtypes(include=['object']).columns
+    text_columns = df.select_dtypes(include=['object', 'category']).columns
     
     for column in text_columns:
-        col_data = df[column].dropna().astype(str)
-        if len(col_data) == 0:
+        codes, uniques = pd.factorize(df[column])
+        if len(uniques) == 0:
             continue
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+        text = np.asarray(uniques).astype(str)
         
-        issues = []
+        issues = {}
         
         # Check for mixed case
-        has_upper = any(val.isupper() for val in col_data if val.isalpha())
-        has_lower = any(val.islower() for val in col_data if val.isalpha())
-        has_title = any(val.istitle() for val in col_data if val.isalpha())
+        alpha = np.strings.isalpha(text)
+        upper = alpha & np.strings.isupper(text)
+        lower = alpha & np.strings.islower(text)
+        title = alpha & np.strings.istitle(text)
         
-        if sum([has_upper, has_lower, has_title]) > 1:
-            issues.append('mixed_case')
+        if sum([upper.any(), lower.any(), title.any()]) > 1:
+            styles = {'upper': upper, 'lower': lower, 'title': title & ~upper}
+            rows = {style: int(counts[mask].sum()) for style, mask in styles.items()}
+            dominant = max(rows, key=rows.get)
+            issues['mixed_case'] = {**_issue(alpha & ~styles[dominant], text, counts), 'styles': rows}
         
         # Check for leading/trailing whitespace
-        if any(val != val.strip() for val in col_data):
-            issues.append('whitespace')
+        padded = np.strings.strip(text) != text
+        if padded.any():
+            issues['whitespace'] = _issue(padded, text, counts)
         
         # Check for inconsistent formatting (e.g., phone numbers, emails)
         if column.lower() in ['phone', 'email', 'date']:
-            formats = set()
-            for val in col_data[:50]:  # Check first 50 values
-                if '@' in val:  # Email pattern
-                    formats.add('email')
-                elif re.match(r'\d{3}-\d{3}-\d{4}', val):  # Phone pattern
-                    formats.add('phone_dash')
-                elif re.match(r'\(\d{3}\)\s\d{3}-\d{4}', val):  # Phone pattern
-                    formats.add('phone_paren')
+            formats = np.where(np.strings.find(text, '@') >= 0, 'email', '').astype(object)
+            for name, pattern in _TEXT_FORMATS:
+                pending = np.flatnonzero(formats == '')
+                matched = pd.Series(text[pending]).str.match(pattern).to_numpy()
+                formats[pending[matched]] = name
+            found = {name: int(counts[formats == name].sum()) for name in ['email', *dict(_TEXT_FORMATS)]}
+            found = {name: rows for name, rows in found.items() if rows}
             
-            if len(formats) > 1:
-                issues.append('inconsistent_format')
+            if len(found) > 1:
+                dominant = max(found, key=found.get)
+                issues['inconsistent_format'] = {
+                    **_issue((formats != '') & (formats != dominant), text, counts), 'formats': found
+                }
         
         if issues:
             inconsistencies['columns_with_issues'].append(column)
-            inconsistencies['details'][column] = issues
+            inconsistencies['details'][column] = list(issues)
+            inconsistencies['by_issue'][column] = issues
     
     return inconsistencies
 
@@ -311,7 +392,8 @@ def generate_cleaning_suggestions(df: pd.DataFrame, quality_issues: Dict) -> Lis
     
     return suggestions
 
-def apply_safe_cleaning(df: pd.DataFrame, suggestions: List[Dict]) -> tuple:
+def apply_safe_cleaning(df: pd.DataFrame, suggestions: List[Dict],
+                        profile: Optional[DatasetProfile] = None) -> tuple:
     """Apply only safe cleaning operations automatically"""
     df_cleaned = df.copy()
     applied_operations = []
@@ -321,7 +403,9 @@ def apply_safe_cleaning(df: pd.DataFrame, suggestions: List[Dict]) -> tuple:
             try:
                 if suggestion['type'] == 'remove_duplicates':
                     initial_rows = len(df_cleaned)
-                    df_cleaned = df_cleaned.drop_duplicates()
+                    # The profile's duplicate positions hold while no earlier operation changed the rows
+                    unchanged = profile is not None and not applied_operations
+                    df_cleaned = drop_duplicate_rows(df_cleaned, profile.duplicate_positions if unchanged else None)
                     removed_rows = initial_rows - len(df_cleaned)
                     applied_operations.append({
                         'operation': 'Removed duplicate rows',
@@ -378,10 +462,10 @@ def chart_builder():
     try:
         data = request.get_json()
         
-        if not data or 'dataset' not in data:
+        dataset = frame_from_payload(data, 'dataset')
+        if dataset is None:
             return jsonify({'error': 'Dataset is required'}), 400
         
-        dataset = data['dataset']
         chart_type = data.get('chart_type', 'auto')
         columns = data.get('columns', [])
         options = data.get('options', {})
@@ -402,17 +486,19 @@ def chart_builder():
         
         return jsonify(response)
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Chart builder failed: {str(e)}'}), 500
 
-def generate_chart_configurations(dataset: List[Dict], chart_type: str, columns: List[str], options: Dict) -> Dict:
+def generate_chart_configurations(dataset: List[Dict] | pd.DataFrame, chart_type: str, columns: List[str], options: Dict) -> Dict:
     """Generate chart configurations based on data and preferences"""
     df = pd.DataFrame(dataset)
     
     if chart_type == 'auto':
         # Auto-detect best chart type
         numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-        categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
         
         if len(numeric_cols) >= 2:
             chart_type = 'scatter'
@@ -464,7 +550,7 @@ def generate_chart_configurations(dataset: List[Dict], chart_type: str, columns:
     
     return config
 
-def prepare_chart_data(dataset: List[Dict], config: Dict) -> Dict:
+def prepare_chart_data(dataset: List[Dict] | pd.DataFrame, config: Dict) -> Dict:
     """Prepare data in the format required for chart rendering"""
     df = pd.DataFrame(dataset)
     chart_type = config['type']
@@ -474,7 +560,7 @@ def prepare_chart_data(dataset: List[Dict], config: Dict) -> Dict:
         y_col = config['y_axis']
         
         # Group and aggregate if necessary
-        if df[x_col].dtype == 'object':
+        if df[x_col].dtype in ('object', 'category'):
             grouped = df.groupby(x_col)[y_col].mean().reset_index()
             data = [{'x': row[x_col], 'y': row[y_col]} for _, row in grouped.iterrows()]
         else:
@@ -516,13 +602,13 @@ def prepare_chart_data(dataset: List[Dict], config: Dict) -> Dict:
         }
     }
 
-def generate_chart_recommendations(dataset: List[Dict], columns: List[str]) -> List[Dict]:
+def generate_chart_recommendations(dataset: List[Dict] | pd.DataFrame, columns: List[str]) -> List[Dict]:
     """Generate chart type recommendations based on data characteristics"""
     df = pd.DataFrame(dataset)
     recommendations = []
     
     numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
     datetime_cols = df.select_dtypes(include=['datetime64']).columns.tolist()
     
     # Time series recommendation
@@ -536,16 +622,10 @@ def generate_chart_recommendations(dataset: List[Dict], columns: List[str]) -> L
     
     # Correlation analysis
     if len(numeric_cols) >= 2:
-        corr_matrix = df[numeric_cols].corr()
-        high_corr_pairs = []
-        for i in range(len(numeric_cols)):
-            for j in range(i+1, len(numeric_cols)):
-                corr = abs(corr_matrix.iloc[i, j])
-                if corr > 0.5:
-                    high_corr_pairs.append((numeric_cols[i], numeric_cols[j], corr))
-        
-        if high_corr_pairs:
-            best_pair = max(high_corr_pairs, key=lambda x: x[2])
+        strongest = top_correlations(df, numeric_cols, threshold=0.5, k=1)
+        if strongest and abs(strongest[0]['correlation']) > 0.5:
+            pair = strongest[0]
+            best_pair = (pair['column1'], pair['column2'], abs(pair['correlation']))
             recommendations.append({
                 'type': 'scatter',
                 'reason': f'Strong correlation ({best_pair[2]:.2f}) between {best_pair[0]} and {best_pair[1]}',
@@ -599,7 +679,9 @@ def templates():
             
             if action == 'apply':
                 template_id = data.get('template_id')
-                user_data = data.get('data', [])
+                user_data = frame_from_payload(data)
+                if user_data is None:
+                    user_data = []
                 
                 if not template_id:
                     return jsonify({'error': 'Template ID is required'}), 400
@@ -619,6 +701,8 @@ def templates():
             else:
                 return jsonify({'error': 'Invalid action'}), 400
                 
+        except DatasetNotFoundError as e:
+            return jsonify({'error': str(e)}), 404
         except Exception as e:
             return jsonify({'error': f'Template operation failed: {str(e)}'}), 500
 
@@ -722,7 +806,7 @@ def get_category_description(category: str) -> str:
     }
     return descriptions.get(category, 'Custom analysis templates')
 
-def apply_template(template_id: str, user_data: List[Dict]) -> Dict:
+def apply_template(template_id: str, user_data: List[Dict] | pd.DataFrame) -> Dict:
     """Apply a template to user data"""
     templates = {t['id']: t for t in get_template_library()}
     
@@ -867,7 +951,7 @@ def generate_template_charts(template: Dict, df: pd.DataFrame) -> List[Dict]:
             charts.append({
                 'type': 'bar',
                 'title': f'{template["name"]} - Category Breakdown',
-                'x_axis': template['required_columns'][2] if len(template['required_columns']) > 2 else df.select_dtypes(include=['object']).columns[0],
+                'x_axis': template['required_columns'][2] if len(template['required_columns']) > 2 else df.select_dtypes(include=['object', 'category']).columns[0],
                 'y_axis': template['required_columns'][1]
             })
     
@@ -900,14 +984,15 @@ def get_chart_recommendations():
     """Get AI-powered chart recommendations for dataset"""
     try:
         data = request.get_json()
-        dataset = data.get('dataset', [])
+        dataset = frame_from_payload(data, 'dataset')
         columns = data.get('columns', [])
         
-        if not dataset:
+        if dataset is None:
             return jsonify({'error': 'Dataset is required'}), 400
         
-        recommendations = generate_ai_chart_recommendations(dataset, columns)
-        insights = generate_data_insights(dataset)
+        profile = get_profile(dataset, data.get('dataset_id'))
+        recommendations = generate_ai_chart_recommendations(dataset, columns, profile)
+        insights = generate_data_insights(dataset, profile)
         alternatives = generate_alternative_charts(dataset, columns)
         
         return jsonify({
@@ -917,17 +1002,21 @@ def get_chart_recommendations():
             'alternatives': alternatives
         })
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to get recommendations: {str(e)}'}), 500
 
-def generate_ai_chart_recommendations(dataset: List[Dict], columns: List[str]) -> List[Dict]:
+def generate_ai_chart_recommendations(dataset: List[Dict] | pd.DataFrame, columns: List[str],
+                                      profile: Optional[DatasetProfile] = None) -> List[Dict]:
     """Generate AI-powered chart recommendations with detailed analysis"""
     df = pd.DataFrame(dataset)
+    profile = profile or get_profile(df)
     recommendations = []
     
     # Analyze data characteristics
-    numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+    numeric_cols = profile.numeric_columns
+    categorical_cols = profile.categorical_columns
     date_cols = []
     
     # Detect date columns
@@ -974,16 +1063,12 @@ def generate_ai_chart_recommendations(dataset: List[Dict], columns: List[str]) -
     # Correlation analysis recommendations
     if data_patterns['has_correlation_potential']:
         # Calculate correlation strength
-        corr_matrix = df[numeric_cols].corr()
         max_corr = 0
         best_pair = (numeric_cols[0], numeric_cols[1] if len(numeric_cols) > 1 else numeric_cols[0])
-        
-        for i in range(len(numeric_cols)):
-            for j in range(i+1, len(numeric_cols)):
-                corr_val = abs(corr_matrix.iloc[i, j])
-                if corr_val > max_corr:
-                    max_corr = corr_val
-                    best_pair = (numeric_cols[i], numeric_cols[j])
+        strongest = top_correlations(df, numeric_cols, k=1)
+        if strongest and strongest[0]['correlation'] != 0:
+            max_corr = abs(strongest[0]['correlation'])
+            best_pair = (strongest[0]['column1'], strongest[0]['column2'])
         
         confidence = min(95, 60 + (max_corr * 35))  # Scale correlation to confidence
         
@@ -1001,10 +1086,10 @@ def generate_ai_chart_recommendations(dataset: List[Dict], columns: List[str]) -
     if data_patterns['has_categories'] and len(numeric_cols) >= 1:
         # Check cardinality of categorical columns
         best_cat_col = categorical_cols[0]
-        min_cardinality = df[categorical_cols[0]].nunique()
+        min_cardinality = profile.unique[categorical_cols[0]]
         
         for col in categorical_cols:
-            cardinality = df[col].nunique()
+            cardinality = profile.unique[col]
             if 2 <= cardinality <= 12 and cardinality < min_cardinality:  # Ideal range for visualization
                 best_cat_col = col
                 min_cardinality = cardinality
@@ -1052,9 +1137,10 @@ def generate_ai_chart_recommendations(dataset: List[Dict], columns: List[str]) -
     recommendations.sort(key=lambda x: x['confidence'], reverse=True)
     return recommendations[:6]  # Return top 6 recommendations
 
-def generate_data_insights(dataset: List[Dict]) -> str:
+def generate_data_insights(dataset: List[Dict] | pd.DataFrame, profile: Optional[DatasetProfile] = None) -> str:
     """Generate AI insights about the dataset"""
     df = pd.DataFrame(dataset)
+    profile = profile or get_profile(df)
     
     insights = []
     
@@ -1065,17 +1151,17 @@ def generate_data_insights(dataset: List[Dict]) -> str:
         insights.append(f"Small dataset with {len(df)} rows - statistical patterns may be limited")
     
     # Data quality insights
-    missing_pct = (df.isnull().sum().sum() / (len(df) * len(df.columns))) * 100
+    missing_pct = (sum(profile.missing.values()) / (len(df) * len(df.columns))) * 100
     if missing_pct > 10:
         insights.append(f"Dataset has {missing_pct:.1f}% missing values - consider data cleaning")
     
     # Column insights
-    numeric_cols = df.select_dtypes(include=[np.number]).columns
+    numeric_cols = profile.numeric_columns
     if len(numeric_cols) >= 3:
         insights.append("Multiple numeric variables detected - excellent for correlation and multi-dimensional analysis")
     
     # Cardinality insights
-    high_cardinality_cols = [col for col in df.columns if df[col].nunique() > len(df) * 0.8]
+    high_cardinality_cols = [col for col in df.columns if profile.unique[col] > len(df) * 0.8]
     if high_cardinality_cols:
         insights.append(f"High cardinality columns detected ({', '.join(high_cardinality_cols[:2])}) - may need grouping for visualization")
     
@@ -1493,7 +1579,7 @@ def create_visualizations(file_path):
     
     # Get numeric and categorical columns
     numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
-    categorical_cols = df.select_dtypes(include=['object']).columns.tolist()
+    categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
     
     # Create multiple visualizations
     fig, axes = plt.subplots(2, 2, figsize=(15, 12))
@@ -1785,21 +1871,19 @@ def predictive_analytics():
     try:
         data = request.get_json()
         
-        if not data or 'dataset' not in data:
+        df = frame_from_payload(data, 'dataset')
+        if df is None:
             return jsonify({'error': 'Dataset is required'}), 400
         
-        dataset = data['dataset']
         analysis_type = data.get('type', 'forecast')
         target_column = data.get('target_column')
         time_column = data.get('time_column')
         horizon = data.get('horizon', 12)  # Default 12 periods ahead
         
-        df = pd.DataFrame(dataset)
-        
         if analysis_type == 'forecast':
             result = generate_forecast(df, target_column, time_column, horizon)
         elif analysis_type == 'correlation':
-            result = analyze_correlations(df)
+            result = analyze_correlations(df, str(data.get('method', 'pearson')).lower())
         elif analysis_type == 'trends':
             result = analyze_trends(df, target_column, time_column)
         elif analysis_type == 'anomaly':
@@ -1818,6 +1902,8 @@ def predictive_analytics():
             'confidence_level': result.get('confidence', 'medium')
         })
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Predictive analytics failed: {str(e)}'}), 500
 
@@ -1870,38 +1956,46 @@ def generate_forecast(df: pd.DataFrame, target_col: str, time_col: str, horizon:
         'methodology': 'Moving Average with Trend Projection'
     }
 
-def analyze_correlations(df: pd.DataFrame) -> Dict:
-    """Analyze correlations between variables"""
+def analyze_correlations(df: pd.DataFrame, method: str = 'pearson') -> Dict:
+    """Analyze correlations between variables
+
+    Wide frames (more than CORRELATION_MATRIX_MAX_COLUMNS numeric columns) are
+    correlated block by block: the full matrix is omitted and only the
+    CORRELATION_TOP_K strongest pairs are returned.
+    """
     numeric_cols = df.select_dtypes(include=[np.number]).columns.tolist()
     
     if len(numeric_cols) < 2:
         return {'error': 'Need at least 2 numeric columns for correlation analysis'}
+    if method not in CORRELATION_METHODS:
+        return {'error': f"Correlation method must be one of: {', '.join(CORRELATION_METHODS)}"}
     
-    correlation_matrix = df[numeric_cols].corr()
-    
-    # Find strongest correlations
-    correlations = []
-    for i in range(len(numeric_cols)):
-        for j in range(i+1, len(numeric_cols)):
-            corr_value = correlation_matrix.iloc[i, j]
-            if not pd.isna(corr_value):
-                correlations.append({
-                    'variable1': numeric_cols[i],
-                    'variable2': numeric_cols[j],
-                    'correlation': round(float(corr_value), 3),
-                    'strength': get_correlation_strength(abs(corr_value)),
-                    'direction': 'positive' if corr_value > 0 else 'negative'
-                })
-    
-    # Sort by absolute correlation strength
-    correlations.sort(key=lambda x: abs(x['correlation']), reverse=True)
-    
-    return {
-        'correlation_matrix': correlation_matrix.round(3).to_dict(),
+    if len(numeric_cols) <= CORRELATION_MATRIX_MAX_COLUMNS:
+        matrix = correlation_matrix(df, numeric_cols, method=method)
+        pairs = matrix_pairs(matrix)
+    else:
+        matrix = None
+        pairs = top_correlations(df, numeric_cols, method=method)
+    
+    # Pairs come sorted by absolute correlation strength
+    correlations = [{
+        'variable1': pair['column1'],
+        'variable2': pair['column2'],
+        'correlation': round(pair['correlation'], 3),
+        'strength': get_correlation_strength(abs(pair['correlation'])),
+        'direction': 'positive' if pair['correlation'] > 0 else 'negative'
+    } for pair in pairs]
+    
+    result = {
+        'method': method,
+        'correlation_matrix': matrix.round(3).to_dict() if matrix is not None else {},
         'strong_correlations': [c for c in correlations if abs(c['correlation']) > 0.5],
         'all_correlations': correlations,
         'insights': generate_correlation_insights(correlations)
     }
+    if matrix is None:
+        result['truncated'] = True
+    return result
 
 def get_correlation_strength(corr_value: float) -> str:
     """Classify correlation strength"""
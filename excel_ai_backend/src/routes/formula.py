@@ -1,90 +1,34 @@
 from flask import Blueprint, jsonify, request
-import os
 import json
 import time
-import random
-from openai import OpenAI
 from dotenv import load_dotenv
 from src.models.auth import User, db, FormulaInteraction
 from src.routes.auth import token_required
 from src.utils.telemetry import estimate_tokens
-from src.utils.model_router import get_model_chain, get_time_budget_seconds, get_task_params
+from src.utils.model_router import get_model_chain, get_task_params
 from src.utils.cache import cache, cache_key
+from src.utils.semantic_cache import cache_scope, get_cached, set_cached
+from src.utils.llm_client import get_client
+from src.utils.model_executor import execute_chain
+from src.utils.sse import sse_response, stream_llm, stream_payload, stream_requested
 
 load_dotenv()
 
 formula_bp = Blueprint('formula', __name__)
 
-# OpenAI client (defensive init)
-api_key = os.getenv('OPENAI_API_KEY')
-if api_key and api_key != 'sk-test-key-replace-with-real-key':
-    client = OpenAI(api_key=api_key)
-else:
-    client = None
-
-PREFERRED_MODEL = os.getenv('OPENAI_MODEL', 'gpt-5-preview')
-FALLBACK_MODELS = [
-    'gpt-5-preview',
-    'gpt-4.1-mini',
-    'gpt-4o-mini',
-    'gpt-4o',
-    'gpt-3.5-turbo'
-]
-
-def resolve_model(explicit: str | None = None):
-    if explicit:
-        return explicit
-    ordered = [PREFERRED_MODEL] + [m for m in FALLBACK_MODELS if m != PREFERRED_MODEL]
-    return ordered[0]
-
-def call_openai_with_retry(messages, max_retries=3, model: str | None = None, max_tokens=800, temperature=0.2, time_budget_s=8):
+# Shared pooled OpenAI client (None when OPENAI_API_KEY is not configured)
+client = get_client()
+
+def call_openai_with_retry(messages, model_chain, max_tokens=800, temperature=0.2, time_budget_s=None):
+    """Walk the router's model chain with per-tier time budgets and hedging (src/utils/model_executor.py)."""
     if not client:
         return {
             'success': False,
             'error': 'OpenAI API not configured',
             'fatal': True
         }
-
-    last_error = None
-    resolved_model = resolve_model(model)
-    attempted = []
-    for attempt in range(max_retries):
-        try:
-            response = client.chat.completions.create(
-                model=resolved_model,
-                messages=messages,
-                max_tokens=max_tokens,
-                temperature=temperature,
-                timeout=time_budget_s
-            )
-            return {
-                'success': True,
-                'content': response.choices[0].message.content,
-                'model_used': resolved_model,
-                'usage': response.usage.total_tokens if response.usage else None,
-                'models_tried': [resolved_model]
-            }
-        except Exception as e:
-            err = str(e).lower()
-            last_error = e
-            attempted.append(resolved_model)
-            if any(k in err for k in ['invalid model', 'does not exist']) and attempt < max_retries - 1:
-                for cand in FALLBACK_MODELS:
-                    if cand not in attempted:
-                        resolved_model = cand
-                        break
-                continue
-            if 'rate limit' in err and attempt < max_retries - 1:
-                time.sleep((2 ** attempt) + random.uniform(0, 1))
-                continue
-            if ('timeout' in err or 'connection' in err) and attempt < max_retries - 1:
-                time.sleep(1)
-                continue
-    return {
-        'success': False,
-        'error': f'Failed after {max_retries} attempts: {last_error}',
-        'models_tried': attempted
-    }
+    return execute_chain(messages, model_chain, max_tokens=max_tokens, temperature=temperature,
+                         time_budget_s=time_budget_s)
 
 def parse_json_safely(raw: str, fallback_key: str):
     try:
@@ -151,7 +95,7 @@ def _detect_referenced_columns(text: str):
             cleaned.append(candidate)
     
     # Remove duplicates while preserving order
-    return list(dict.fromkeys(cleaned)[:50])
+    return list(dict.fromkeys(cleaned))[:50]
 
 def _platform_guidance(platform: str):
     """Enhanced platform-specific guidance with detailed function recommendations"""
@@ -232,8 +176,14 @@ IMPORTANT: Only reference available columns exactly as provided. If user descrip
         'platform': platform,
         'examples': examples
     }, model_chain)
+    # Reworded descriptions for the same columns/platform/examples may share an answer (semantic cache tier)
+    scope = cache_scope(task, {
+        'columns': columns,
+        'platform': platform,
+        'examples': examples
+    }, model_chain, columns)
 
-    cached = cache.get(ckey)
+    cached = get_cached(task, ckey, description, scope)
     if cached:
         return jsonify({
             'success': True,
@@ -247,7 +197,7 @@ IMPORTANT: Only reference available columns exactly as provided. If user descrip
     result = call_openai_with_retry([
         {"role": "system", "content": system_msg},
         {"role": "user", "content": user_prompt}
-    ], max_tokens=params['max_tokens'], temperature=params['temperature'], time_budget_s=get_time_budget_seconds(model_chain[0]) )
+    ], model_chain, max_tokens=params['max_tokens'], temperature=params['temperature'])
     latency_ms = int((time.time() - start_time) * 1000)
 
     fallback_used = False
@@ -305,7 +255,7 @@ IMPORTANT: Only reference available columns exactly as provided. If user descrip
         'fallback_used': fallback_used
     }
     # cache result
-    cache.set(ckey, {
+    set_cached(task, ckey, description, scope, {
         'data': response_payload['data'],
         'model_used': response_payload['model_used'],
         'fallback_used': response_payload['fallback_used']
@@ -364,71 +314,77 @@ simplified_alternative (string) - if shorter equivalent exists, else null
     }, model_chain)
     cached = cache.get(ckey)
     if cached:
-        return jsonify({'success': True, 'data': cached['data'], 'model_used': cached['model_used'], 'fallback_used': cached.get('fallback_used', False)})
+        response = {'success': True, 'data': cached['data'], 'model_used': cached['model_used'], 'fallback_used': cached.get('fallback_used', False)}
+        return stream_payload(response) if stream_requested() else jsonify(response)
 
-    # Track timing for telemetry
-    start_time = time.time()
-    result = call_openai_with_retry([
+    def finish(result, latency_ms):
+        # Calculate tokens for telemetry
+        tokens_used = result.get('usage') or estimate_tokens(result['content'])
+
+        parsed = parse_json_safely(result['content'], 'raw')
+        fallback_used = False
+        tried = result.get('models_tried', [])
+        if tried and tried[0] != result['model_used']:
+            fallback_used = True
+
+        # Enhanced validation for explain endpoint
+        parsed_columns = _detect_referenced_columns(formula)
+        validation_info = {'invalid_columns': [], 'suggestions': {}, 'warnings': []}
+        if context_cols:
+            invalid_cols, suggestions = _validate_columns(parsed_columns, context_cols)
+            validation_info['invalid_columns'] = invalid_cols
+            validation_info['suggestions'] = suggestions
+        
+            if invalid_cols:
+                warnings = []
+                for col in invalid_cols:
+                    if col in suggestions:
+                        warnings.append(f"Referenced column '{col}' not found. Did you mean '{suggestions[col]}'?")
+                    else:
+                        warnings.append(f"Referenced column '{col}' not available in your dataset.")
+                validation_info['warnings'] = warnings
+
+        data = {
+            'steps': parsed.get('steps', []),
+            'purpose': parsed.get('purpose'),
+            'optimization_suggestions': parsed.get('optimization_suggestions', []),
+            'edge_cases': parsed.get('edge_cases', []),
+            'simplified_alternative': parsed.get('simplified_alternative'),
+            'validation': validation_info  # Add validation info
+        }
+        interaction = FormulaInteraction(
+            user_id=current_user.id,
+            interaction_type='explain',
+            input_payload=payload,
+            output_payload=data,
+            model_used=result.get('model_used'),
+            fallback_used=fallback_used,
+            latency_ms=latency_ms,
+            tokens_used=tokens_used,
+            success=True
+        )
+        db.session.add(interaction)
+        current_user.increment_usage('query')
+        db.session.commit()
+        cache.set(ckey, {'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used}, 86400)
+        return {'success': True, 'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used}
+
+    messages = [
         {"role": "system", "content": system_msg},
         {"role": "user", "content": user_prompt}
-    ], max_tokens=params['max_tokens'], temperature=params['temperature'], time_budget_s=get_time_budget_seconds(model_chain[0]))
-    latency_ms = int((time.time() - start_time) * 1000)
-
-    if not result['success']:
-        return jsonify({'success': False, 'error': result.get('error', 'Unknown error')}), 500
+    ]
+    if stream_requested():
+        return sse_response(stream_llm(messages, model_chain, finish, max_tokens=params['max_tokens'],
+                                       temperature=params['temperature']))
 
-    # Calculate tokens for telemetry
-    tokens_used = result.get('usage') or estimate_tokens(result['content'])
+    # Track timing for telemetry
+    start_time = time.time()
+    result = call_openai_with_retry(messages, model_chain, max_tokens=params['max_tokens'], temperature=params['temperature'])
+    latency_ms = int((time.time() - start_time) * 1000)
 
-    parsed = parse_json_safely(result['content'], 'raw')
-    fallback_used = False
     if not result['success']:
         return jsonify({'success': False, 'error': result.get('error', 'Unknown error')}), 500
-    tried = result.get('models_tried', [])
-    if tried and tried[0] != result['model_used']:
-        fallback_used = True
-
-    # Enhanced validation for explain endpoint
-    parsed_columns = _detect_referenced_columns(formula)
-    validation_info = {'invalid_columns': [], 'suggestions': {}, 'warnings': []}
-    if context_cols:
-        invalid_cols, suggestions = _validate_columns(parsed_columns, context_cols)
-        validation_info['invalid_columns'] = invalid_cols
-        validation_info['suggestions'] = suggestions
-        
-        if invalid_cols:
-            warnings = []
-            for col in invalid_cols:
-                if col in suggestions:
-                    warnings.append(f"Referenced column '{col}' not found. Did you mean '{suggestions[col]}'?")
-                else:
-                    warnings.append(f"Referenced column '{col}' not available in your dataset.")
-            validation_info['warnings'] = warnings
-
-    data = {
-        'steps': parsed.get('steps', []),
-        'purpose': parsed.get('purpose'),
-        'optimization_suggestions': parsed.get('optimization_suggestions', []),
-        'edge_cases': parsed.get('edge_cases', []),
-        'simplified_alternative': parsed.get('simplified_alternative'),
-        'validation': validation_info  # Add validation info
-    }
-    interaction = FormulaInteraction(
-        user_id=current_user.id,
-        interaction_type='explain',
-        input_payload=payload,
-        output_payload=data,
-        model_used=result.get('model_used'),
-        fallback_used=fallback_used,
-        latency_ms=latency_ms,
-        tokens_used=tokens_used,
-        success=True
-    )
-    db.session.add(interaction)
-    current_user.increment_usage('query')
-    db.session.commit()
-    cache.set(ckey, {'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used}, 86400)
-    return jsonify({'success': True, 'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used})
+    return jsonify(finish(result, latency_ms))
 
 @formula_bp.route('/debug', methods=['POST'])
 @token_required
@@ -468,72 +424,77 @@ notes (array) - any additional helpful notes
     }, model_chain)
     cached = cache.get(ckey)
     if cached:
-        return jsonify({'success': True, 'data': cached['data'], 'model_used': cached['model_used'], 'fallback_used': cached.get('fallback_used', False)})
+        response = {'success': True, 'data': cached['data'], 'model_used': cached['model_used'], 'fallback_used': cached.get('fallback_used', False)}
+        return stream_payload(response) if stream_requested() else jsonify(response)
 
-    # Track timing for telemetry
-    start_time = time.time()
-    result = call_openai_with_retry([
+    def finish(result, latency_ms):
+        # Calculate tokens for telemetry
+        tokens_used = result.get('usage') or estimate_tokens(result['content'])
+
+        parsed = parse_json_safely(result['content'], 'raw')
+        fallback_used = False
+        tried = result.get('models_tried', [])
+        if tried and tried[0] != result['model_used']:
+            fallback_used = True
+
+        # Enhanced validation for debug endpoint
+        parsed_columns = _detect_referenced_columns(formula)
+        validation_info = {'invalid_columns': [], 'suggestions': {}, 'warnings': []}
+        if sample_context:
+            invalid_cols, suggestions = _validate_columns(parsed_columns, sample_context)
+            validation_info['invalid_columns'] = invalid_cols
+            validation_info['suggestions'] = suggestions
+        
+            if invalid_cols:
+                warnings = []
+                for col in invalid_cols:
+                    if col in suggestions:
+                        warnings.append(f"Referenced column '{col}' not found. Did you mean '{suggestions[col]}'?")
+                    else:
+                        warnings.append(f"Referenced column '{col}' not available in your dataset.")
+                validation_info['warnings'] = warnings
+
+        data = {
+            'likely_issues': parsed.get('likely_issues', []),
+            'fixes': parsed.get('fixes', []),
+            'diagnostic_steps': parsed.get('diagnostic_steps', []),
+            'optimized_formula': parsed.get('optimized_formula'),
+            'notes': parsed.get('notes', []),
+            'validation': validation_info  # Add validation info
+        }
+        interaction = FormulaInteraction(
+            user_id=current_user.id,
+            interaction_type='debug',
+            input_payload=payload,
+            output_payload=data,
+            model_used=result.get('model_used'),
+            fallback_used=fallback_used,
+            latency_ms=latency_ms,
+            tokens_used=tokens_used,
+            success=True
+        )
+        db.session.add(interaction)
+        current_user.increment_usage('query')
+        db.session.commit()
+        cache.set(ckey, {'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used}, 86400)
+        return {'success': True, 'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used}
+
+    messages = [
         {"role": "system", "content": system_msg},
         {"role": "user", "content": user_prompt}
-    ], max_tokens=params['max_tokens'], temperature=params['temperature'], time_budget_s=get_time_budget_seconds(model_chain[0]))
+    ]
+    if stream_requested():
+        return sse_response(stream_llm(messages, model_chain, finish, max_tokens=params['max_tokens'],
+                                       temperature=params['temperature']))
+
+    # Track timing for telemetry
+    start_time = time.time()
+    result = call_openai_with_retry(messages, model_chain, max_tokens=params['max_tokens'], temperature=params['temperature'])
     latency_ms = int((time.time() - start_time) * 1000)
 
     if not result['success']:
         return jsonify({'success': False, 'error': result.get('error', 'Unknown error')}), 500
-
-    # Calculate tokens for telemetry
-    tokens_used = result.get('usage') or estimate_tokens(result['content'])
-
-    parsed = parse_json_safely(result['content'], 'raw')
-    fallback_used = False
-    if not result['success']:
-        return jsonify({'success': False, 'error': result.get('error', 'Unknown error')}), 500
-    tried = result.get('models_tried', [])
-    if tried and tried[0] != result['model_used']:
-        fallback_used = True
-
-    # Enhanced validation for debug endpoint
-    parsed_columns = _detect_referenced_columns(formula)
-    validation_info = {'invalid_columns': [], 'suggestions': {}, 'warnings': []}
-    if sample_context:
-        invalid_cols, suggestions = _validate_columns(parsed_columns, sample_context)
-        validation_info['invalid_columns'] = invalid_cols
-        validation_info['suggestions'] = suggestions
-        
-        if invalid_cols:
-            warnings = []
-            for col in invalid_cols:
-                if col in suggestions:
-                    warnings.append(f"Referenced column '{col}' not found. Did you mean '{suggestions[col]}'?")
-                else:
-                    warnings.append(f"Referenced column '{col}' not available in your dataset.")
-            validation_info['warnings'] = warnings
-
-    data = {
-        'likely_issues': parsed.get('likely_issues', []),
-        'fixes': parsed.get('fixes', []),
-        'diagnostic_steps': parsed.get('diagnostic_steps', []),
-        'optimized_formula': parsed.get('optimized_formula'),
-        'notes': parsed.get('notes', []),
-        'validation': validation_info  # Add validation info
-    }
-    interaction = FormulaInteraction(
-        user_id=current_user.id,
-        interaction_type='debug',
-        input_payload=payload,
-        output_payload=data,
-        model_used=result.get('model_used'),
-        fallback_used=fallback_used,
-        latency_ms=latency_ms,
-        tokens_used=tokens_used,
-        success=True
-    )
-    db.session.add(interaction)
-    current_user.increment_usage('query')
-    db.session.commit()
-    cache.set(ckey, {'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used}, 86400)
-    return jsonify({'success': True, 'data': data, 'model_used': result.get('model_used'), 'fallback_used': fallback_used})
-
+    return jsonify(finish(result, latency_ms))
 
 @formula_bp.route('/batch-generate', methods=['POST'])
 @token_required
@@ -613,6 +574,7 @@ def batch_generate_formulas(current_user):
                 
                 ai_resp = call_openai_with_retry(
                     messages=messages,
+                    model_chain=get_model_chain(current_user, 'formula_generate'),
                     max_tokens=get_task_params('formula_generate')['max_tokens'],
                     temperature=get_task_params('formula_generate')['temperature'],
                     time_budget_s=6  # Shorter timeout for batch
@@ -3,7 +3,9 @@ import pandas as pd
 import requests
 import re
 from urllib.parse import urlparse, parse_qs
-import io
+
+from src.utils.ingest import read_csv_bytes
+from src.utils.serialization import frame_response
 
 google_sheets_bp = Blueprint('google_sheets', __name__)
 
@@ -31,7 +33,7 @@ def analyze_google_sheets_url():
         from .excel_analysis import generate_insights, generate_ai_insights
         
         # Generate insights using existing analysis pipeline
-        insights = generate_insights(df)
+        insights = generate_insights(df, approx=str(data.get('approx', '')).lower() in ('1', 'true', 'yes'))
         ai_insights = generate_ai_insights(df, insights)
         
         # Basic file information
@@ -45,13 +47,12 @@ def analyze_google_sheets_url():
             'preview': df.head(5).to_dict('records')
         }
         
-        return jsonify({
+        return frame_response({
             'success': True,
             'file_info': file_info,
-            'data': df.to_dict('records'),
             'insights': insights,
             'ai_insights': ai_insights
-        })
+        }, ('data',), df)
         
     except Exception as e:
         return jsonify({'error': f'Error analyzing Google Sheets: {str(e)}'}), 500
@@ -161,9 +162,8 @@ def download_and_parse_csv(csv_url):
         
         # Check if response contains CSV data
         if response.headers.get('content-type', '').startswith('text/csv') or 'text/plain' in response.headers.get('content-type', ''):
-            # Parse CSV data
-            csv_data = io.StringIO(response.text)
-            df = pd.read_csv(csv_data)
+            # Parse CSV data (encoding and dialect sniffed from the raw bytes)
+            df = read_csv_bytes(response.content)
             
             # Basic validation
             if df.empty:
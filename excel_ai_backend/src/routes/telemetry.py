@@ -4,6 +4,8 @@ from flask import Blueprint, jsonify, request
 from src.routes.auth import token_required
 from src.models.auth import db, TelemetryMetric, User, FormulaInteraction, ChatMessage, ChatConversation
 from src.utils.telemetry import get_telemetry_summary
+from src.utils.llm_client import call_stats
+from src.utils.semantic_cache import cache_stats
 from datetime import datetime, timedelta
 from sqlalchemy import func
 
@@ -178,6 +180,8 @@ def health_check():
                 'recent_errors_1h': recent_errors,
                 'success_rate_1h': success_rate
             },
+            'llm': call_stats(),
+            'semantic_cache': cache_stats(),
             'version': '1.0.0'
         })
         
@@ -1,10 +1,12 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
 from src.models.visualization import ToolGeneration
+from src.utils.duplicates import duplicate_mask
+from src.utils.ingest import CSV_SNIFF_BYTES, csv_read_kwargs, sniff_csv
+from src.utils.llm_client import chat_completion, get_client
+import io
 import pandas as pd
 import re
-import os
-from openai import OpenAI
 from dotenv import load_dotenv
 from datetime import datetime
 import json
@@ -15,9 +17,8 @@ load_dotenv()
 
 tools_bp = Blueprint('tools', __name__)
 
-# Initialize OpenAI client
-api_key = os.getenv('OPENAI_API_KEY')
-client = OpenAI(api_key=api_key) if api_key and api_key != 'sk-test-key-replace-with-real-key' else None
+# Shared pooled OpenAI client (None when OPENAI_API_KEY is not configured)
+client = get_client()
 
 @tools_bp.route('/api/v1/tools/excel-formula', methods=['POST'])
 def generate_excel_formula():
@@ -389,7 +390,7 @@ def create_excel_formula_with_ai(description, columns, example_data):
         }}
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2
@@ -430,7 +431,7 @@ def create_sql_query_with_ai(description, table_schema, database_type):
         }}
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2
@@ -471,7 +472,7 @@ def create_vba_script_with_ai(description, workbook_context):
         }}
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2
@@ -489,42 +490,16 @@ def create_vba_script_with_ai(description, workbook_context):
 def convert_text_to_structured_excel_data(text_data, delimiter):
     """Convert text to structured data"""
     try:
-        lines = text_data.strip().split('\n')
-        
-        # Auto-detect delimiter if needed
-        if delimiter == 'auto':
-            # Try common delimiters
-            delimiters = [',', '\t', ';', '|', ' ']
-            best_delimiter = ','
-            best_score = 0
-            
-            for delim in delimiters:
-                # Count consistency of splits across lines
-                split_counts = [len(line.split(delim)) for line in lines[:5]]
-                if len(set(split_counts)) == 1 and split_counts[0] > 1:
-                    best_delimiter = delim
-                    break
-            
-            delimiter = best_delimiter
-        
-        # Split data
-        structured_data = []
-        columns = []
-        
-        for i, line in enumerate(lines):
-            if line.strip():
-                parts = [part.strip() for part in line.split(delimiter)]
-                
-                if i == 0:
-                    # Assume first line is headers
-                    columns = parts or [f'Column_{j+1}' for j in range(len(parts))]
-                else:
-                    # Data rows
-                    row_data = {}
-                    for j, value in enumerate(parts):
-                        column_name = columns[j] if j < len(columns) else f'Column_{j+1}'
-                        row_data[column_name] = value
-                    structured_data.append(row_data)
+        # Delimiter, quoting and header row are sniffed by the shared CSV ingest code
+        data = text_data.strip().encode('utf-8')
+        dialect = sniff_csv(data[:CSV_SNIFF_BYTES], None if delimiter == 'auto' else delimiter)
+        df = pd.read_csv(io.BytesIO(data), dtype=str, keep_default_na=False, skipinitialspace=True,
+                         on_bad_lines='skip', **csv_read_kwargs(dialect))
+        df.columns = [str(c).strip() for c in df.columns]
+        df = df.apply(lambda col: col.str.strip())
+        structured_data = df.to_dict('records')
+        columns = list(df.columns)
+        delimiter = dialect['delimiter']
         
         if not columns:
             columns = ['Column_1']
@@ -572,7 +547,7 @@ def create_regex_pattern_with_ai(description, test_strings):
         }}
         """
         
-        response = client.chat.completions.create(
+        response = chat_completion(
             model="gpt-4",
             messages=[{"role": "user", "content": prompt}],
             temperature=0.2
@@ -1098,9 +1073,10 @@ def intelligent_data_formatting(raw_data, formatting_rules, target_format):
                 pass
     
     # 5. Remove duplicate rows
-    duplicates_before = df.duplicated().sum()
+    duplicates = duplicate_mask(df)
+    duplicates_before = int(duplicates.sum())
     if duplicates_before > 0:
-        df.drop_duplicates(inplace=True)
+        df.drop(index=df.index[duplicates], inplace=True)
         transformations_applied.append(f"Removed {duplicates_before} duplicate rows")
         issues_found.append(f"Found {duplicates_before} duplicate rows")
     
@@ -1119,7 +1095,7 @@ def intelligent_data_formatting(raw_data, formatting_rules, target_format):
     quality_factors.append(missing_score)
     
     # Duplicate factor (0-25 points)
-    duplicate_ratio = df.duplicated().sum() / len(df) if len(df) > 0 else 0
+    duplicate_ratio = 0  # duplicate rows were removed in step 5
     duplicate_score = max(0, 25 - (duplicate_ratio * 100))
     quality_factors.append(duplicate_score)
     
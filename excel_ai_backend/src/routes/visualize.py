@@ -1,6 +1,9 @@
 from flask import Blueprint, request, jsonify
 from src.models.user import db
 from src.models.visualization import Visualization
+from src.utils.correlation import correlation_matrix
+from src.utils.dataset_store import frame_from_payload, DatasetNotFoundError
+from src.utils.profile_cache import get_profile
 import json
 import pandas as pd
 import plotly.graph_objects as go
@@ -20,7 +23,9 @@ def create_visualization():
         # Extract parameters
         title = data.get('title', 'Untitled Chart')
         chart_type = data.get('chart_type', 'bar')
-        chart_data = data.get('data', [])
+        chart_data = frame_from_payload(data)
+        if chart_data is None:
+            chart_data = pd.DataFrame()
         config = data.get('config', {})
         user_id = data.get('user_id', 1)  # TODO: Get from auth
         
@@ -38,7 +43,7 @@ def create_visualization():
             title=title,
             chart_type=chart_type,
             chart_config=config,
-            data_preview=chart_data[:10] if len(chart_data) > 10 else chart_data
+            data_preview=json.loads(chart_data.head(10).to_json(orient='records', date_format='iso'))
         )
         
         db.session.add(visualization)
@@ -54,6 +59,8 @@ def create_visualization():
             }
         })
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to create visualization: {str(e)}'}), 500
 
@@ -115,20 +122,19 @@ def suggest_chart_type():
     """AI-powered chart type suggestion based on data"""
     try:
         data = request.get_json()
-        chart_data = data.get('data', [])
         
-        if not chart_data:
+        # Load stored dataset or inline rows
+        df = frame_from_payload(data)
+        if df is None:
             return jsonify({'error': 'No data provided'}), 400
         
-        # Convert to DataFrame for analysis
-        df = pd.DataFrame(chart_data)
-        
         suggestions = []
         
-        # Analyze data structure
-        numeric_cols = df.select_dtypes(include=['number']).columns.tolist()
-        categorical_cols = df.select_dtypes(include=['object', 'category']).columns.tolist()
-        datetime_cols = df.select_dtypes(include=['datetime']).columns.tolist()
+        # Analyze data structure (shared with Analyze/Prep through the profile cache)
+        profile = get_profile(df, data.get('dataset_id'))
+        numeric_cols = profile.numeric_columns
+        categorical_cols = profile.categorical_columns
+        datetime_cols = profile.datetime_columns
         
         # Generate suggestions based on data structure
         if len(datetime_cols) > 0 and len(numeric_cols) > 0:
@@ -180,6 +186,8 @@ def suggest_chart_type():
             }
         })
         
+    except DatasetNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
     except Exception as e:
         return jsonify({'error': f'Failed to analyze data: {str(e)}'}), 500
 
@@ -253,7 +261,7 @@ def create_chart(data, chart_type, config):
             # Use correlation matrix for numeric data
             numeric_df = df.select_dtypes(include=['number'])
             if len(numeric_df.columns) > 1:
-                corr_matrix = numeric_df.corr()
+                corr_matrix = correlation_matrix(numeric_df)
                 fig = px.imshow(corr_matrix, title=config.get('title', 'Correlation Heatmap'))
             else:
                 return {'error': 'Heatmap requires at least 2 numeric columns'}
@@ -0,0 +1,149 @@
+"""Dtype compaction for stored datasets.
+
+Run once on ingest, after the Parquet file is written:
+
+* numeric-looking text columns ("1,200", " 42 ") are parsed to numbers;
+* low-cardinality text columns become ``category`` (Arrow dictionary);
+* floats become float32 only when float32 round-trips them exactly.
+
+Integers stay int64: NumPy 2 raises (or silently wraps) on arithmetic that
+overflows a narrow integer dtype, so narrower stored ints would break every
+consumer that computes on the data.
+
+The plan is built one column at a time and the file is rewritten one row group
+at a time, so memory stays bounded for streamed uploads.
+"""
+
+import os
+import re
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# A text column becomes a category when distinct values are at most this share of its rows
+CATEGORY_MAX_RATIO = 0.5
+
+_NUMERIC_TEXT = re.compile(r'^[+-]?(\d+|\d{1,3}(,\d{3})+)(\.\d+)?([eE][+-]?\d+)?$')
+_LEADING_ZERO = re.compile(r'^[+-]?0\d')
+_DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+
+def parse_numeric_text(series: pd.Series) -> Optional[pd.Series]:
+    """Parse a text column whose every value looks numeric; None if any does not.
+
+    Codes with leading zeros (zip codes, account numbers) are left as text.
+    """
+    values = series.dropna()
+    if values.empty or not all(isinstance(v, str) for v in values):
+        return None
+    stripped = values.str.strip()
+    if not stripped.str.match(_NUMERIC_TEXT).all() or stripped.str.match(_LEADING_ZERO).any():
+        return None
+    parsed = pd.to_numeric(series.str.strip().str.replace(',', '', regex=False), errors='coerce')
+    if (parsed.isna() != series.isna()).any():
+        return None
+    return parsed
+
+
+def _numeric_type(series: pd.Series) -> pa.DataType:
+    if pd.api.types.is_integer_dtype(series):
+        return pa.int64()
+    values = series.to_numpy(dtype=np.float64)
+    if np.array_equal(values.astype(np.float32).astype(np.float64), values, equal_nan=True):
+        return pa.float32()
+    return pa.float64()
+
+
+def _plan_column(series: pd.Series) -> Optional[tuple[str, pa.DataType]]:
+    """Return ``(action, arrow_type)`` for a column, or None to leave it alone."""
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_datetime64_any_dtype(series):
+        return None
+    if pd.api.types.is_numeric_dtype(series):
+        target = _numeric_type(series)
+        return ('cast', target) if target not in (pa.int64(), pa.float64()) else None
+    if series.dtype != object:
+        return None
+
+    parsed = parse_numeric_text(series)
+    if parsed is not None:
+        return 'parse', _numeric_type(parsed)
+
+    non_null = series.dropna()
+    if len(non_null) and all(isinstance(v, str) for v in non_null):
+        if non_null.nunique() <= CATEGORY_MAX_RATIO * len(series):
+            return 'category', _DICTIONARY
+    return None
+
+
+def _apply(column: pa.ChunkedArray, action: str, target: pa.DataType) -> pa.Array:
+    if action == 'parse':
+        return pa.array(parse_numeric_text(column.to_pandas()), from_pandas=True).cast(target)
+    return column.cast(target)
+
+
+def compact_parquet(path: str) -> dict[str, Any]:
+    """Compact a Parquet dataset in place and return a memory report.
+
+    The report has ``before_bytes``/``after_bytes`` (in-memory pandas size) and a
+    ``columns`` map of ``{name: {'from': dtype, 'to': dtype}}`` for changed columns.
+    """
+    parquet = pq.ParquetFile(path)
+    schema = parquet.schema_arrow
+    plans, changes = {}, {}
+    before_bytes = after_bytes = 0
+
+    for name in schema.names:
+        series = parquet.read(columns=[name]).column(0).to_pandas()
+        before = int(series.memory_usage(deep=True, index=False))
+        plan = _plan_column(series)
+        before_bytes += before
+        if plan is None:
+            after_bytes += before
+            continue
+        compacted = _apply(pa.chunked_array([pa.array(series, from_pandas=True)]), *plan).to_pandas()
+        after_bytes += int(compacted.memory_usage(deep=True, index=False))
+        plans[name] = plan
+        changes[name] = {'from': str(series.dtype), 'to': str(compacted.dtype)}
+
+    if plans:
+        target_schema = pa.schema([
+            pa.field(field.name, plans[field.name][1] if field.name in plans else field.type)
+            for field in schema
+        ])
+        tmp_path = path + '.compact'
+        try:
+            with pq.ParquetWriter(tmp_path, target_schema, compression='zstd') as writer:
+                for i in range(parquet.metadata.num_row_groups):
+                    group = parquet.read_row_group(i)
+                    arrays = [
+                        _apply(group.column(field.name), *plans[field.name]) if field.name in plans
+                        else group.column(field.name)
+                        for field in schema
+                    ]
+                    writer.write_table(pa.Table.from_arrays(arrays, schema=target_schema))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    return {
+        'before_bytes': before_bytes,
+        'after_bytes': after_bytes,
+        'saved_pct': round((1 - after_bytes / before_bytes) * 100, 1) if before_bytes else 0.0,
+        'columns': changes,
+    }
+
+
+def expand_categories(df: pd.DataFrame) -> pd.DataFrame:
+    """Turn category columns back into object columns before in-place edits.
+
+    Cleaning and transform steps assign new values (fillna, replace) that a
+    categorical column would reject.
+    """
+    categorical = [col for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)]
+    if not categorical:
+        return df
+    return df.astype({col: object for col in categorical})
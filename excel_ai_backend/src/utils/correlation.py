@@ -0,0 +1,140 @@
+"""Vectorized correlation engine.
+
+Numeric columns are copied once into a float64 block and correlated with
+matrix products instead of per-pair loops. Missing values are handled
+pairwise, as ``DataFrame.corr`` does: every pair uses the rows where both
+columns have a value. Columns are centred on their own mean first, so the
+pairwise sums stay numerically close to pandas' two-pass result.
+
+``correlation_matrix`` returns the full matrix for narrow frames. For wide
+frames ``top_correlations`` walks the matrix in ``CORRELATION_BLOCK_COLUMNS``
+square tiles and keeps only the strongest pairs, so a 1,000+ column matrix is
+never materialized or serialized.
+
+``method='spearman'`` correlates per-column average ranks. That is exactly
+pandas' result for columns without missing values; with missing values pandas
+re-ranks every pair's common rows, which this engine does not.
+"""
+
+import heapq
+import os
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.utils.profiler import _float_block
+
+CORRELATION_BLOCK_COLUMNS = int(os.getenv('CORRELATION_BLOCK_COLUMNS', 256))
+# Wider frames report top pairs only, not the full matrix
+CORRELATION_MATRIX_MAX_COLUMNS = int(os.getenv('CORRELATION_MATRIX_MAX_COLUMNS', 100))
+# Pairs kept by top_correlations when no k is given
+CORRELATION_TOP_K = 1000
+
+METHODS = ('pearson', 'spearman')
+
+
+class _Prepared:
+    """A column block ready for correlation: centred values (0 where missing) plus the mask."""
+
+    def __init__(self, block: np.ndarray, method: str):
+        if method == 'spearman':
+            block = pd.DataFrame(block).rank().to_numpy(dtype=np.float64)
+        missing = np.isnan(block)
+        self.has_missing = bool(missing.any())
+        self.present = (~missing).astype(np.float64)
+        values = np.where(missing, 0.0, block)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = values.sum(axis=0) / self.present.sum(axis=0)
+        values -= np.nan_to_num(mean)
+        values[missing] = 0.0
+        self.values = values
+        self.squares = values * values
+
+
+def _tile(a: _Prepared, b: _Prepared) -> np.ndarray:
+    """Correlations between the columns of ``a`` (rows) and ``b`` (columns)."""
+    products = a.values.T @ b.values
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if not (a.has_missing or b.has_missing):
+            # Centred on the exact column means, so no mean correction is needed
+            scale = np.sqrt(np.outer(a.squares.sum(axis=0), b.squares.sum(axis=0)))
+            result = products / scale
+        else:
+            count = a.present.T @ b.present
+            sum_a = a.values.T @ b.present
+            sum_b = a.present.T @ b.values
+            covariance = products - sum_a * sum_b / count
+            variance_a = a.squares.T @ b.present - sum_a * sum_a / count
+            variance_b = a.present.T @ b.squares - sum_b * sum_b / count
+            result = covariance / np.sqrt(variance_a * variance_b)
+    # Zero variance (or too few common rows) leaves no correlation, as in pandas
+    result[~np.isfinite(result)] = np.nan
+    return np.clip(result, -1.0, 1.0)
+
+
+def _check_method(method: str):
+    if method not in METHODS:
+        raise ValueError(f"Unknown correlation method '{method}' (use {' or '.join(METHODS)})")
+
+
+def correlation_matrix(df: pd.DataFrame, columns: Optional[Sequence] = None,
+                       method: str = 'pearson') -> pd.DataFrame:
+    """``df[columns].corr(method)`` for numeric ``columns`` (all numeric columns by default)."""
+    _check_method(method)
+    columns = list(df.select_dtypes(include=[np.number]).columns if columns is None else columns)
+    prepared = _Prepared(_float_block(df, columns), method)
+    return pd.DataFrame(_tile(prepared, prepared), index=columns, columns=columns)
+
+
+def matrix_pairs(matrix: pd.DataFrame, threshold: float = 0.0, k: Optional[int] = None) -> list[dict[str, Any]]:
+    """Upper-triangle pairs of a correlation matrix with ``|r| >= threshold``, strongest first."""
+    values = matrix.to_numpy()
+    rows, cols = np.triu_indices(len(values), k=1)
+    return _ranked(values[rows, cols], rows, cols, list(matrix.columns), threshold, k)
+
+
+def _ranked(values: np.ndarray, rows: np.ndarray, cols: np.ndarray, columns: list,
+            threshold: float, k: Optional[int]) -> list[dict[str, Any]]:
+    strength = np.abs(values)
+    keep = np.flatnonzero(strength >= threshold)  # NaN never passes
+    # Stable sort keeps equally strong pairs in matrix order
+    keep = keep[np.argsort(-strength[keep], kind='stable')][:k]
+    return [
+        {'column1': columns[rows[i]], 'column2': columns[cols[i]], 'correlation': float(values[i])}
+        for i in keep
+    ]
+
+
+def top_correlations(df: pd.DataFrame, columns: Optional[Sequence] = None, method: str = 'pearson',
+                     threshold: float = 0.0, k: Optional[int] = CORRELATION_TOP_K,
+                     block_columns: int = CORRELATION_BLOCK_COLUMNS) -> list[dict[str, Any]]:
+    """The ``k`` strongest pairs with ``|r| >= threshold``, computed tile by tile.
+
+    Memory is bounded by two column blocks and one ``block_columns`` square
+    tile, however many columns there are. ``k=None`` keeps every pair.
+    """
+    _check_method(method)
+    columns = list(df.select_dtypes(include=[np.number]).columns if columns is None else columns)
+    block_columns = max(block_columns, 1)
+
+    def block(start: int) -> _Prepared:
+        return _Prepared(_float_block(df, columns[start:start + block_columns]), method)
+
+    candidates: list[tuple[float, dict]] = []
+    for start_a in range(0, len(columns), block_columns):
+        block_a = block(start_a)
+        for start_b in range(start_a, len(columns), block_columns):
+            tile = _tile(block_a, block_a if start_b == start_a else block(start_b))
+            if start_b == start_a:
+                rows, cols = np.triu_indices(tile.shape[0], k=1)
+            else:
+                rows, cols = np.indices(tile.shape).reshape(2, -1)
+            for pair in _ranked(tile[rows, cols], rows + start_a, cols + start_b, columns, threshold, k):
+                candidates.append((abs(pair['correlation']), pair))
+            if k is not None and len(candidates) > 4 * k:
+                candidates = heapq.nlargest(k, candidates, key=lambda item: item[0])
+
+    # Strongest first; ties keep the order the pairs were found in
+    candidates.sort(key=lambda item: -item[0])
+    return [pair for _, pair in candidates[:k]]
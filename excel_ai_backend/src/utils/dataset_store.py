@@ -0,0 +1,355 @@
+"""Server-side dataset store.
+
+Uploaded sheets are written once as Parquet files and referenced afterwards by a
+``dataset_id``, so analysis endpoints no longer need the full row list
+round-tripped through JSON on every call.
+
+``dataset_store`` holds ad-hoc uploads (TTL + per-owner quota). ``connector_store``
+backs saved connector datasets: no expiry, no eviction, memory-mapped reads.
+"""
+
+import glob
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Iterator, Optional
+
+import numpy as np
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+DEFAULT_STORE_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'database', 'datasets')
+DEFAULT_TTL_SECONDS = int(os.getenv('DATASET_TTL_SECONDS', 86400))
+DEFAULT_QUOTA_BYTES = int(os.getenv('DATASET_QUOTA_MB', 1024)) * 1024 * 1024
+SORT_CACHE_SIZE = 16
+
+_ID_PATTERN = re.compile(r'^[a-f0-9]{32}$')
+
+
+class DatasetNotFoundError(LookupError):
+    """Raised when a dataset_id is unknown or has expired."""
+
+    def __init__(self, dataset_id: str):
+        super().__init__(f"Dataset '{dataset_id}' not found or expired. Please upload the file again.")
+        self.dataset_id = dataset_id
+
+
+def _prepare_for_parquet(df: pd.DataFrame) -> pd.DataFrame:
+    """Return a frame Parquet can store: string column names, no mixed-type object columns."""
+    out = df.copy(deep=False)
+    out.columns = [str(c) for c in out.columns]
+    for col in out.columns:
+        if out[col].dtype != 'object':
+            continue
+        try:
+            pa.array(out[col], from_pandas=True)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed types (e.g. numbers and text in one Excel column) - keep as text
+            out[col] = out[col].map(lambda v: v if v is None or (isinstance(v, float) and v != v) else str(v))
+    return out.reset_index(drop=True)
+
+
+class DatasetStore:
+    """Parquet-backed dataset storage with a JSON metadata sidecar per dataset."""
+
+    def __init__(self, root: Optional[str] = None, ttl_seconds: Optional[int] = DEFAULT_TTL_SECONDS,
+                 quota_bytes: Optional[int] = DEFAULT_QUOTA_BYTES, memory_map: bool = False):
+        self.root = root or os.getenv('DATASET_STORE_DIR', DEFAULT_STORE_DIR)
+        self.ttl_seconds = ttl_seconds
+        self.quota_bytes = quota_bytes
+        self.memory_map = memory_map
+        self._index_lock = threading.Lock()
+        # (dataset_id, sort spec) -> row order, so paging through a sorted grid sorts once
+        self._sort_orders: OrderedDict = OrderedDict()
+        self._sort_lock = threading.Lock()
+
+    def _paths(self, dataset_id: str) -> tuple[str, str]:
+        if not dataset_id or not _ID_PATTERN.match(str(dataset_id)):
+            raise DatasetNotFoundError(str(dataset_id))
+        base = os.path.join(self.root, dataset_id)
+        return base + '.parquet', base + '.json'
+
+    def _now(self) -> float:
+        return time.time()
+
+    def reserve(self) -> tuple[str, str]:
+        """Allocate a dataset_id and return it with the Parquet path to write.
+
+        The dataset stays invisible until :meth:`commit` writes its metadata, so a
+        writer that fails half way leaves nothing readable behind.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        dataset_id = uuid.uuid4().hex
+        data_path, _ = self._paths(dataset_id)
+        return dataset_id, data_path
+
+    def commit(self, dataset_id: str, meta: Optional[dict] = None) -> dict[str, Any]:
+        """Write the metadata sidecar for a reserved dataset and return it."""
+        data_path, meta_path = self._paths(dataset_id)
+        schema = pq.read_schema(data_path)
+        record = {
+            'dataset_id': dataset_id,
+            'created_at': self._now(),
+            'expires_at': self._now() + self.ttl_seconds if self.ttl_seconds else None,
+            'rows': int(pq.ParquetFile(data_path).metadata.num_rows),
+            'columns': list(schema.names),
+            'dtypes': schema.empty_table().to_pandas().dtypes.astype(str).to_dict(),
+            'bytes': os.path.getsize(data_path),
+        }
+        record.update(meta or {})
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(record, f, default=str)
+        return record
+
+    def put(self, df: pd.DataFrame, meta: Optional[dict] = None) -> str:
+        """Persist a DataFrame and return its new dataset_id."""
+        dataset_id, data_path = self.reserve()
+        stored = _prepare_for_parquet(df)
+        stored.to_parquet(data_path, engine='pyarrow', compression='zstd', index=False)
+        self.commit(dataset_id, meta)
+        return dataset_id
+
+    def meta(self, dataset_id: str) -> dict[str, Any]:
+        """Return the metadata record, raising DatasetNotFoundError if missing/expired."""
+        data_path, meta_path = self._paths(dataset_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            raise DatasetNotFoundError(dataset_id)
+
+        expires_at = record.get('expires_at')
+        if expires_at and self._now() > expires_at:
+            self.delete(dataset_id)
+            raise DatasetNotFoundError(dataset_id)
+        if not os.path.exists(data_path):
+            raise DatasetNotFoundError(dataset_id)
+        return record
+
+    def touch(self, dataset_id: str):
+        """Mark a dataset as recently used (the sidecar mtime drives LRU eviction)."""
+        _, meta_path = self._paths(dataset_id)
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+
+    def get(self, dataset_id: str, columns: Optional[list[str]] = None) -> pd.DataFrame:
+        """Load a stored dataset (optionally only some columns)."""
+        self.meta(dataset_id)
+        self.touch(dataset_id)
+        data_path, _ = self._paths(dataset_id)
+        return pd.read_parquet(data_path, engine='pyarrow', columns=columns, memory_map=self.memory_map)
+
+    def iter_batches(self, dataset_id: str, batch_size: int = 65536,
+                     columns: Optional[list[str]] = None) -> Iterator[pd.DataFrame]:
+        """Stream a stored dataset as DataFrames of at most ``batch_size`` rows."""
+        self.meta(dataset_id)
+        self.touch(dataset_id)
+        data_path, _ = self._paths(dataset_id)
+        parquet = pq.ParquetFile(data_path, memory_map=self.memory_map)
+        for batch in parquet.iter_batches(batch_size=batch_size, columns=columns):
+            yield batch.to_pandas()
+
+    def _sort_order(self, dataset_id: str, parquet: pq.ParquetFile, sort: list[tuple[str, str]]) -> np.ndarray:
+        key = (dataset_id, tuple(sort))
+        with self._sort_lock:
+            order = self._sort_orders.get(key)
+            if order is not None:
+                self._sort_orders.move_to_end(key)
+                return order
+
+        keys = parquet.read(columns=list(dict.fromkeys(name for name, _ in sort)))
+        # Category (dictionary) columns sort by their values, not their codes
+        keys = pa.table([
+            col.cast(col.type.value_type) if pa.types.is_dictionary(col.type) else col for col in keys.columns
+        ], names=keys.column_names)
+        order = pc.sort_indices(keys, sort_keys=sort, null_placement='at_end').to_numpy()
+        with self._sort_lock:
+            self._sort_orders[key] = order
+            while len(self._sort_orders) > SORT_CACHE_SIZE:
+                self._sort_orders.popitem(last=False)
+        return order
+
+    def read_window(self, dataset_id: str, offset: int = 0, limit: int = 100,
+                    columns: Optional[list[str]] = None,
+                    sort: Optional[list[tuple[str, str]]] = None) -> tuple[pd.DataFrame, int]:
+        """Return rows ``[offset, offset + limit)`` and the dataset's total row count.
+
+        ``sort`` is a list of ``(column, 'ascending' | 'descending')``. Unsorted
+        windows only read the row groups that overlap the slice; sorted windows read
+        the sort keys once (the order is cached) and then the projected columns.
+        """
+        self.meta(dataset_id)
+        self.touch(dataset_id)
+        data_path, _ = self._paths(dataset_id)
+        parquet = pq.ParquetFile(data_path, memory_map=self.memory_map)
+        total = parquet.metadata.num_rows
+        stop = min(offset + limit, total)
+        if offset >= stop:
+            return parquet.schema_arrow.empty_table().select(columns or parquet.schema_arrow.names).to_pandas(), total
+
+        if sort:
+            indices = self._sort_order(dataset_id, parquet, sort)[offset:stop]
+            table = parquet.read(columns=columns).take(pa.array(indices))
+        else:
+            groups, first_row, start = [], None, 0
+            for i in range(parquet.metadata.num_row_groups):
+                end = start + parquet.metadata.row_group(i).num_rows
+                if end > offset and start < stop:
+                    groups.append(i)
+                    if first_row is None:
+                        first_row = start
+                start = end
+            table = parquet.read_row_groups(groups, columns=columns)
+            table = table.slice(offset - first_row, stop - offset)
+        return table.to_pandas(), total
+
+    def _index_path(self, owner: str) -> str:
+        return os.path.join(self.root, 'index', hashlib.sha256(owner.encode('utf-8')).hexdigest()[:32] + '.json')
+
+    def _load_index(self, owner: str) -> dict[str, str]:
+        try:
+            with open(self._index_path(owner), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self, owner: str, index: dict[str, str]):
+        path = self._index_path(owner)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(index, f)
+        os.replace(path + '.tmp', path)
+
+    def find_content(self, owner: str, content_key: str) -> Optional[str]:
+        """Return the owner's live dataset_id for ``content_key`` (e.g. a SHA-256), if any."""
+        with self._index_lock:
+            index = self._load_index(owner)
+            dataset_id = index.get(content_key)
+            if not dataset_id:
+                return None
+            if self.exists(dataset_id):
+                self.touch(dataset_id)
+                return dataset_id
+            del index[content_key]
+            self._save_index(owner, index)
+            return None
+
+    def register_content(self, owner: str, content_key: str, dataset_id: str) -> list[str]:
+        """Index a dataset under ``content_key`` for ``owner`` and enforce the byte quota.
+
+        The owner's least recently used datasets are deleted until their stored
+        bytes fit ``quota_bytes``; the new dataset itself is never evicted.
+        Returns the evicted dataset_ids.
+        """
+        with self._index_lock:
+            index = self._load_index(owner)
+            index[content_key] = dataset_id
+
+            live, total = [], 0
+            for key, entry_id in list(index.items()):
+                try:
+                    size = int(self.meta(entry_id).get('bytes', 0))
+                    last_used = os.path.getmtime(self._paths(entry_id)[1])
+                except (DatasetNotFoundError, OSError):
+                    del index[key]
+                    continue
+                live.append((last_used, size, key, entry_id))
+                total += size
+
+            evicted = []
+            if self.quota_bytes:
+                for _, size, key, entry_id in sorted(live):
+                    if total <= self.quota_bytes:
+                        break
+                    if entry_id == dataset_id:
+                        continue
+                    self.delete(entry_id)
+                    del index[key]
+                    total -= size
+                    evicted.append(entry_id)
+
+            self._save_index(owner, index)
+            return evicted
+
+    def exists(self, dataset_id: str) -> bool:
+        try:
+            self.meta(dataset_id)
+            return True
+        except DatasetNotFoundError:
+            return False
+
+    def _sidecar_path(self, dataset_id: str, name: str) -> str:
+        data_path, _ = self._paths(dataset_id)
+        return data_path[:-len('.parquet')] + '.' + name
+
+    def write_sidecar(self, dataset_id: str, name: str, payload: bytes):
+        """Store extra bytes (e.g. a profile state) next to a dataset; removed with it."""
+        self.meta(dataset_id)
+        path = self._sidecar_path(dataset_id, name)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(payload)
+        os.replace(path + '.tmp', path)
+
+    def read_sidecar(self, dataset_id: str, name: str) -> Optional[bytes]:
+        try:
+            with open(self._sidecar_path(dataset_id, name), 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def delete(self, dataset_id: str):
+        with self._sort_lock:
+            for key in [k for k in self._sort_orders if k[0] == dataset_id]:
+                del self._sort_orders[key]
+        base = self._paths(dataset_id)[0][:-len('.parquet')]
+        for path in glob.glob(base + '.*'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def purge_expired(self) -> int:
+        """Delete expired datasets; returns how many were removed."""
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            dataset_id = name[:-5]
+            if not self.exists(dataset_id):
+                removed += 1
+        return removed
+
+
+dataset_store = DatasetStore()
+connector_store = DatasetStore(
+    os.getenv('CONNECTOR_STORE_DIR') or os.path.join(dataset_store.root, 'connectors'),
+    ttl_seconds=None, quota_bytes=None, memory_map=True,
+)
+
+
+def frame_from_payload(payload: Optional[dict], key: str = 'data') -> Optional[pd.DataFrame]:
+    """Resolve a request's DataFrame from ``dataset_id`` or inline rows under ``key``.
+
+    Returns None when neither is present so callers keep their own 400 message.
+    """
+    if not payload:
+        return None
+    dataset_id = payload.get('dataset_id')
+    if dataset_id:
+        return dataset_store.get(dataset_id)
+    rows = payload.get(key)
+    if rows:
+        return pd.DataFrame(rows)
+    return None
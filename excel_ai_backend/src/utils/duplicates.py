@@ -0,0 +1,227 @@
+"""Hash-based duplicate and near-duplicate row detection.
+
+Exact duplicates: every row is hashed once (``pd.util.hash_pandas_object``).
+Only rows whose hash repeats can be duplicates, so ``df.duplicated()`` runs on
+those candidates alone. That keeps the result exactly pandas' (hash collisions
+are ruled out by the comparison) while the common case - few or no duplicates -
+costs one hashing pass. The dataset profile keeps the duplicate positions, so
+counting and removing duplicates reuse that pass.
+
+Near duplicates (``near_duplicates=true``): rows that differ only in case or
+whitespace, or in a few fields. Each row becomes a set of ``(column, normalized
+value)`` tokens; MinHash signatures estimate the Jaccard similarity of two rows
+and LSH banding buckets rows whose signatures agree on a whole band. Only rows
+sharing a bucket are compared, so there is no O(n^2) pairwise pass.
+"""
+
+import os
+from typing import Any, Optional
+
+import numpy as np
+import pandas as pd
+
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv('NEAR_DUPLICATE_THRESHOLD', 0.8))
+MINHASH_PERMUTATIONS = 64
+# Rows hashed per MinHash block; bounds the rows x columns uint64 scratch arrays
+MINHASH_BLOCK_ROWS = 65536
+# Near-duplicate groups returned as examples
+NEAR_DUPLICATE_EXAMPLES = 10
+
+_GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: a well-spread 64-bit hash of each value."""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def row_hashes(df: pd.DataFrame) -> Optional[np.ndarray]:
+    """One uint64 hash per row, or None if a value is unhashable (e.g. lists in JSON rows).
+
+    Equal rows (as ``df.duplicated`` compares them) always hash equally.
+    """
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for i in range(len(df.columns)):
+        series = df.iloc[:, i]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind == 'f':
+            series = series + 0.0  # 0.0 and -0.0 are equal but hash differently; this turns -0.0 into 0.0
+        try:
+            column_hashes = pd.util.hash_pandas_object(series, index=False).to_numpy()
+        except TypeError:
+            return None
+        hashes = _mix(hashes ^ column_hashes)
+    return hashes
+
+
+def duplicate_mask(df: pd.DataFrame, hashes: Optional[np.ndarray] = None) -> np.ndarray:
+    """Boolean mask of rows repeating an earlier row - the same result as ``df.duplicated()``."""
+    if hashes is None:
+        hashes = row_hashes(df)
+    if hashes is None:
+        return df.duplicated().to_numpy()
+    candidates = pd.Series(hashes).duplicated(keep=False).to_numpy()
+    mask = np.zeros(len(df), dtype=bool)
+    if candidates.any():
+        # Rows sharing a hash are compared by value, so a collision never counts as a duplicate
+        mask[candidates] = df[candidates].duplicated().to_numpy()
+    return mask
+
+
+def drop_duplicate_rows(df: pd.DataFrame, positions: Optional[np.ndarray] = None) -> pd.DataFrame:
+    """``df.drop_duplicates()``, reusing known duplicate row ``positions`` when given."""
+    if positions is None:
+        return df[~duplicate_mask(df)]
+    keep = np.ones(len(df), dtype=bool)
+    keep[positions] = False
+    return df[keep]
+
+
+def _normalize_text(values: np.ndarray) -> np.ndarray:
+    """Lower-cased, stripped text with runs of spaces collapsed."""
+    values = np.strings.lower(np.strings.strip(values))
+    doubled = np.strings.find(values, '  ') >= 0
+    while doubled.any():
+        values[doubled] = np.strings.replace(values[doubled], '  ', ' ')
+        doubled[doubled] = np.strings.find(values[doubled], '  ') >= 0
+    return values
+
+
+def _row_tokens(df: pd.DataFrame) -> np.ndarray:
+    """rows x columns uint64 tokens of (column, normalized value); text is compared case- and space-insensitively."""
+    tokens = np.empty((len(df), len(df.columns)), dtype=np.uint64)
+    # Per-column salts; array multiplication wraps modulo 2**64 without the scalar overflow warning
+    salts = np.arange(1, len(df.columns) + 1, dtype=np.uint64) * _GOLDEN
+    for i in range(len(df.columns)):
+        series = df.iloc[:, i]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in 'biufmM':
+            hashes = pd.util.hash_array(series.to_numpy())
+        else:
+            # Only the distinct values are normalized and hashed, which keeps repetitive columns cheap
+            codes, uniques = pd.factorize(series)
+            uniques = np.asarray(uniques)
+            if uniques.dtype.kind not in 'biufcmM':
+                uniques = _normalize_text(uniques.astype(str))
+            hashes = np.append(pd.util.hash_array(uniques), np.uint64(0))[codes]  # code -1 (missing) -> 0
+        tokens[:, i] = _mix(hashes ^ salts[i])
+    return tokens
+
+
+def minhash_signatures(df: pd.DataFrame, permutations: int = MINHASH_PERMUTATIONS,
+                       seed: int = 0) -> np.ndarray:
+    """rows x permutations MinHash signatures over each row's ``(column, normalized value)`` tokens.
+
+    Only the top 16 bits of each minimum are kept (b-bit MinHash): unrelated
+    minima agree by chance 1 in 65536 times, and signatures are 4x smaller to
+    compare.
+    """
+    rng = np.random.default_rng(seed)
+    # Tokens are already mixed, so h(t) = (t ^ b) * a (a odd: a bijection) is enough per permutation
+    a = rng.integers(1, 2 ** 63, permutations, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    b = rng.integers(0, 2 ** 63, permutations, dtype=np.uint64)
+    signatures = np.empty((len(df), permutations), dtype=np.uint16)
+    for start in range(0, len(df), MINHASH_BLOCK_ROWS):
+        tokens = np.asfortranarray(_row_tokens(df.iloc[start:start + MINHASH_BLOCK_ROWS]))
+        minimum, scratch = np.empty((2, len(tokens)), dtype=np.uint64)
+        for j in range(permutations):
+            np.multiply(np.bitwise_xor(tokens[:, 0], b[j], out=minimum), a[j], out=minimum)
+            for c in range(1, tokens.shape[1]):
+                np.multiply(np.bitwise_xor(tokens[:, c], b[j], out=scratch), a[j], out=scratch)
+                np.minimum(minimum, scratch, out=minimum)
+            signatures[start:start + len(tokens), j] = minimum >> np.uint64(48)
+    return signatures
+
+
+def lsh_bands(threshold: float, permutations: int = MINHASH_PERMUTATIONS) -> int:
+    """Fewest bands whose LSH cut-off ``(1 / bands) ** (1 / rows_per_band)`` is at most ``threshold - 0.2``.
+
+    Keeping the cut-off well below the threshold means rows at the threshold
+    share a bucket almost surely; extra candidates are filtered by their
+    estimated similarity.
+    """
+    options = [bands for bands in range(1, permutations + 1) if permutations % bands == 0]
+    below = [bands for bands in options if (1 / bands) ** (bands / permutations) <= threshold - 0.2]
+    return min(below) if below else permutations
+
+
+def _components(count: int, left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    """Connected-component labels (smallest member position) of ``count`` nodes joined by edges."""
+    labels = np.arange(count)
+    while True:
+        joined = np.minimum(labels[left], labels[right])
+        updated = labels.copy()
+        np.minimum.at(updated, left, joined)
+        np.minimum.at(updated, right, joined)
+        updated = updated[updated]  # pointer jumping
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def near_duplicates(df: pd.DataFrame, threshold: float = NEAR_DUPLICATE_THRESHOLD,
+                    exclude: Optional[np.ndarray] = None) -> dict[str, Any]:
+    """Groups of rows with estimated Jaccard similarity >= ``threshold`` (MinHash + LSH).
+
+    ``exclude`` lists row positions to leave out - pass the exact duplicate
+    positions so only rows that are similar but not identical are reported. ``rows`` counts the rows a near-duplicate removal would drop
+    (all but the first row of each group); examples list row positions.
+    The band count follows the threshold (see :func:`lsh_bands`): 0.8 uses 16
+    bands of 4 hashes, which put rows with similarity 0.8 in a shared bucket
+    with > 99.9% probability.
+    """
+    bands = lsh_bands(threshold)
+    positions = np.arange(len(df)) if exclude is None else np.setdiff1d(np.arange(len(df)), exclude)
+    result = {
+        'rows': 0, 'groups': 0, 'threshold': threshold, 'examples': [],
+        'method': 'minhash_lsh', 'permutations': MINHASH_PERMUTATIONS, 'bands': bands
+    }
+    if len(positions) < 2 or len(df.columns) == 0:
+        return result
+
+    signatures = minhash_signatures(df.iloc[positions])
+    width = signatures.shape[1] // bands
+    pairs = []
+    for band in range(bands):
+        # Four 16-bit minima pack into one uint64; wider bands are hashed together
+        block = np.ascontiguousarray(signatures[:, band * width:(band + 1) * width])
+        words = block.view(np.uint64) if width % 4 == 0 else block.astype(np.uint64)
+        keys = words[:, 0]
+        for j in range(1, words.shape[1]):
+            keys = _mix(keys ^ words[:, j])  # a rare key collision only adds a candidate pair
+        # Pair every row with the first row of its bucket; components link the rest
+        buckets, _ = pd.factorize(keys)
+        first = np.full(buckets.max() + 1, len(buckets))
+        np.minimum.at(first, buckets, np.arange(len(buckets)))
+        first = first[buckets]
+        members = np.flatnonzero(first != np.arange(len(first)))
+        pairs.append(members * len(first) + first[members])
+    # Rows often share a bucket in several bands; compare each pair once
+    pairs = np.sort(np.concatenate(pairs))
+    pairs = pairs[np.concatenate([[True], pairs[1:] != pairs[:-1]])]
+    left, right = np.divmod(pairs, len(positions))
+    similar = np.empty(len(pairs), dtype=bool)
+    for start in range(0, len(pairs), MINHASH_BLOCK_ROWS):
+        end = start + MINHASH_BLOCK_ROWS
+        agree = (signatures[left[start:end]] == signatures[right[start:end]]).mean(axis=1)
+        similar[start:end] = agree >= threshold
+    left, right = left[similar], right[similar]
+    if not len(left):
+        return result
+
+    labels = _components(len(positions), left, right)
+    sizes = np.bincount(labels, minlength=len(labels))
+    groups = np.flatnonzero(sizes > 1)
+    result['groups'] = int(len(groups))
+    result['rows'] = int((sizes[groups] - 1).sum())
+    for label in groups[np.argsort(-sizes[groups], kind='stable')[:NEAR_DUPLICATE_EXAMPLES]]:
+        members = np.flatnonzero(labels == label)
+        similarity = (signatures[members[1:]] == signatures[members[0]]).mean(axis=1)
+        result['examples'].append({
+            'rows': positions[members[:5]].tolist(),
+            'size': int(len(members)),
+            'min_similarity': round(float(similarity.min()), 3)
+        })
+    return result
@@ -0,0 +1,155 @@
+"""Excel reader backends.
+
+``openpyxl``        pandas' default engine; builds the full workbook DOM.
+``openpyxl_stream`` openpyxl ``read_only`` mode with ``iter_rows``; yields
+                    DataFrame chunks so memory stays bounded by the chunk size.
+``calamine``        Rust-based reader (``python-calamine``); much faster, only
+                    used when installed.
+``xlrd``            legacy ``.xls`` reader; only used when installed.
+
+Callers pick a backend per request (``reader=`` form field) or let
+:func:`select_reader` choose one from the file extension and size.
+"""
+
+import importlib.util
+import os
+from typing import BinaryIO, Iterator, Optional
+
+import pandas as pd
+
+EXCEL_STREAM_THRESHOLD_MB = int(os.getenv('EXCEL_STREAM_THRESHOLD_MB', 8))
+EXCEL_CHUNK_ROWS = int(os.getenv('EXCEL_CHUNK_ROWS', 50000))
+
+
+def _installed(module: str) -> bool:
+    return importlib.util.find_spec(module) is not None
+
+
+class ExcelReaderError(ValueError):
+    """Raised when the requested/required reader backend cannot be used."""
+
+
+# name -> (extensions it can read, whether it yields chunks, dependency module)
+READERS = {
+    'openpyxl': (('.xlsx',), False, 'openpyxl'),
+    'openpyxl_stream': (('.xlsx',), True, 'openpyxl'),
+    'calamine': (('.xlsx', '.xls'), False, 'python_calamine'),
+    'xlrd': (('.xls',), False, 'xlrd'),
+}
+
+
+def available_readers() -> list[str]:
+    return [name for name, (_, _, module) in READERS.items() if _installed(module)]
+
+
+def _extension(filename: str) -> str:
+    return os.path.splitext(filename.lower())[1]
+
+
+def is_streaming(reader: str) -> bool:
+    return READERS[reader][1]
+
+
+def select_reader(filename: str, file_size: int = 0, requested: Optional[str] = None) -> str:
+    """Choose a backend for ``filename``.
+
+    An explicit ``requested`` backend wins if it is installed and supports the
+    extension (ExcelReaderError otherwise). By default calamine is preferred when
+    installed; without it large ``.xlsx`` files use the read-only streaming mode.
+    """
+    ext = _extension(filename)
+    available = available_readers()
+    if requested:
+        if requested not in READERS:
+            raise ExcelReaderError(f"Unknown Excel reader '{requested}'. Available: {', '.join(available)}")
+        if requested not in available:
+            raise ExcelReaderError(f"Excel reader '{requested}' is not installed. Available: {', '.join(available)}")
+        if ext not in READERS[requested][0]:
+            raise ExcelReaderError(f"Excel reader '{requested}' cannot read {ext} files")
+        return requested
+
+    if 'calamine' in available:
+        return 'calamine'
+    if ext == '.xls':
+        if 'xlrd' in available:
+            return 'xlrd'
+        raise ExcelReaderError('Reading .xls files requires python-calamine or xlrd. Please save the file as .xlsx or CSV.')
+    if file_size > EXCEL_STREAM_THRESHOLD_MB * 1024 * 1024:
+        return 'openpyxl_stream'
+    return 'openpyxl'
+
+
+def _header_names(values: tuple) -> list[str]:
+    """Name header cells the way pandas does: blanks become 'Unnamed: i'."""
+    return [f'Unnamed: {i}' if v is None or str(v).strip() == '' else str(v) for i, v in enumerate(values)]
+
+
+def _dedupe(names: list[str]) -> list[str]:
+    """Mirror pandas' duplicate header renaming ('a', 'a.1', ...)."""
+    seen, out = {}, []
+    for name in names:
+        if name in seen:
+            seen[name] += 1
+            candidate = f'{name}.{seen[name]}'
+            while candidate in seen:
+                seen[name] += 1
+                candidate = f'{name}.{seen[name]}'
+            seen[candidate] = 0
+            out.append(candidate)
+        else:
+            seen[name] = 0
+            out.append(name)
+    return out
+
+
+def iter_excel_chunks(source: BinaryIO, chunk_rows: int = EXCEL_CHUNK_ROWS) -> tuple[list[str], Iterator[pd.DataFrame]]:
+    """Stream the first sheet of an ``.xlsx`` in read-only mode.
+
+    Returns ``(raw_header, chunks)``. Fully blank rows are skipped, as read-only
+    mode often reports a larger sheet dimension than the data actually uses.
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    rows = workbook.worksheets[0].iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        workbook.close()
+        return [], iter(())
+
+    # Trailing empty header cells are formatting noise, not columns
+    width = len(header)
+    while width and (header[width - 1] is None or str(header[width - 1]).strip() == ''):
+        width -= 1
+    raw_header = ['' if v is None else str(v) for v in header[:width]]
+    columns = _dedupe(_header_names(header[:width]))
+
+    def chunks():
+        try:
+            batch = []
+            for row in rows:
+                row = row[:width]
+                if all(v is None for v in row):
+                    continue
+                if len(row) < width:
+                    row = row + (None,) * (width - len(row))
+                batch.append(row)
+                if len(batch) >= chunk_rows:
+                    yield pd.DataFrame.from_records(batch, columns=columns)
+                    batch = []
+            if batch:
+                yield pd.DataFrame.from_records(batch, columns=columns)
+        finally:
+            workbook.close()
+
+    return raw_header, chunks()
+
+
+def read_excel(source: BinaryIO, filename: str, reader: Optional[str] = None, file_size: int = 0) -> pd.DataFrame:
+    """Read the first sheet into one DataFrame with the selected backend."""
+    reader = select_reader(filename, file_size, reader)
+    if is_streaming(reader):
+        _, chunks = iter_excel_chunks(source)
+        frames = list(chunks)
+        return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+    return pd.read_excel(source, engine=reader)
@@ -0,0 +1,62 @@
+"""Bounded-concurrency fan-out for per-row work (enrichment LLM calls).
+
+``fan_out(fn, items)`` runs ``fn(item)`` on up to ``ENRICH_CONCURRENCY``
+threads and returns one ``(result, error)`` pair per item, in item order. A
+row that raises, or runs longer than ``ENRICH_ROW_TIMEOUT_S`` from the moment
+it started, gets an error string instead of a result; the other rows are
+unaffected, so callers can report partial failures. Wall time scales with
+``len(items) / concurrency`` instead of ``len(items)``.
+
+A timed-out call cannot be interrupted; its thread finishes in the background
+and the late result is discarded. Per-model limits in ``llm_client`` still
+apply across all concurrent fan-outs.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Optional, Sequence
+
+ENRICH_CONCURRENCY = int(os.getenv('ENRICH_CONCURRENCY', 8))
+ENRICH_ROW_TIMEOUT_S = float(os.getenv('ENRICH_ROW_TIMEOUT_S', 30))
+
+
+def fan_out(fn: Callable[[Any], Any], items: Sequence, concurrency: int = ENRICH_CONCURRENCY,
+            timeout_s: float = ENRICH_ROW_TIMEOUT_S) -> list[tuple[Any, Optional[str]]]:
+    """``[(fn(item), None) or (None, error), ...]`` for ``items``, in order."""
+    outcomes: list[tuple[Any, Optional[str]]] = [(None, None)] * len(items)
+    if not items:
+        return outcomes
+    started: dict[int, float] = {}
+    lock = threading.Lock()
+
+    def run(position: int):
+        with lock:
+            started[position] = time.monotonic()
+        return fn(items[position])
+
+    pool = ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(items))), thread_name_prefix='fan-out')
+    try:
+        pending = {pool.submit(run, position): position for position in range(len(items))}
+        while pending:
+            now = time.monotonic()
+            with lock:
+                deadlines = [started[p] + timeout_s for p in pending.values() if p in started]
+            done, _ = wait(pending, timeout=max(min(deadlines) - now, 0.0) if deadlines else timeout_s,
+                           return_when=FIRST_COMPLETED)
+            for future in done:
+                position = pending.pop(future)
+                try:
+                    outcomes[position] = (future.result(), None)
+                except Exception as e:
+                    outcomes[position] = (None, f'{type(e).__name__}: {e}')
+            # Rows past their deadline are reported and no longer waited for
+            now = time.monotonic()
+            with lock:
+                expired = [f for f, p in pending.items() if p in started and now - started[p] >= timeout_s]
+            for future in expired:
+                outcomes[pending.pop(future)] = (None, f'Timed out after {timeout_s:g}s')
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    return outcomes
@@ -0,0 +1,528 @@
+"""Upload ingestion: chunked CSV/Excel streaming with incremental validation.
+
+CSV files (and workbooks read with a streaming backend, see excel_readers) are
+parsed in chunks and written to the dataset store chunk by chunk, so worker
+memory is bounded by the chunk size rather than the file size. Validation stats
+are accumulated as chunks arrive and structural problems (duplicate headers, no
+data) abort the upload after the header or first chunk instead of after a full
+parse.
+"""
+
+import codecs
+import csv
+import hashlib
+import io
+import os
+import re
+import shutil
+from typing import Any, BinaryIO, Callable, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from flask import request
+
+from src.utils.compaction import compact_parquet
+from src.utils.dataset_store import DatasetStore, dataset_store, _prepare_for_parquet
+from src.utils.excel_readers import is_streaming, iter_excel_chunks, read_excel, select_reader
+from src.utils.profile_state import ProfileState, save_state, state_for
+
+CSV_CHUNK_ROWS = int(os.getenv('CSV_CHUNK_ROWS', 50000))
+MAX_EXCEL_UPLOAD_MB = int(os.getenv('MAX_EXCEL_UPLOAD_MB', 200))
+MAX_CSV_UPLOAD_MB = int(os.getenv('MAX_CSV_UPLOAD_MB', 4096))
+# Uploads above this size never get their rows echoed back in the response
+MAX_INLINE_DATA_MB = int(os.getenv('MAX_INLINE_DATA_MB', 16))
+# Request body limit of the upload routes (see allow_upload_body); per-type limits are enforced by the routes
+MAX_UPLOAD_BYTES = max(MAX_EXCEL_UPLOAD_MB, MAX_CSV_UPLOAD_MB) * 1024 * 1024
+
+# Called with the number of rows parsed so far, after each chunk
+ProgressCallback = Callable[[int], None]
+
+# Encoding, delimiter, quoting and header row are sniffed from this many leading bytes
+CSV_SNIFF_BYTES = int(os.getenv('CSV_SNIFF_BYTES', 64 * 1024))
+CSV_DELIMITERS = ',;\t|'
+_BOMS = ((codecs.BOM_UTF8, 'utf-8-sig'), (codecs.BOM_UTF16_LE, 'utf-16'), (codecs.BOM_UTF16_BE, 'utf-16'))
+_NUMBER = re.compile(r'^\s*[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?\s*$')
+# Shrink stored dtypes (categories, lossless float32, numeric text) after each upload
+COMPACT_ON_INGEST = os.getenv('COMPACT_ON_INGEST', 'true').lower() == 'true'
+
+
+class IngestValidationError(ValueError):
+    """Raised when an upload fails structural validation."""
+
+    def __init__(self, validation: dict):
+        super().__init__('; '.join(validation.get('errors', [])) or 'File validation failed')
+        self.validation = validation
+
+
+class IncrementalValidator:
+    """Builds upload validation stats one chunk at a time."""
+
+    def __init__(self, filename: str, columns: Iterable, raw_header: Optional[list[str]] = None):
+        self.filename = filename
+        self.columns = [str(c) for c in columns]
+        self.rows = 0
+        self.chunks = 0
+        self.memory_usage = 0
+        self._nulls = np.zeros(len(self.columns), dtype=np.int64)
+
+        # pandas renames repeated headers to "name.1", so check the raw header when we have it
+        header = raw_header if raw_header is not None else self.columns
+        seen, duplicates = set(), []
+        for name in header:
+            name = str(name).strip()
+            if not name:
+                continue
+            if name in seen and name not in duplicates:
+                duplicates.append(name)
+            seen.add(name)
+        self.duplicate_headers = duplicates
+
+    def header_errors(self) -> list[str]:
+        errors = []
+        if not self.columns:
+            errors.append(f"File '{self.filename}' has no columns.")
+        if self.duplicate_headers:
+            errors.append(f"Duplicate column names found: {', '.join(self.duplicate_headers)}")
+        return errors
+
+    def update(self, chunk: pd.DataFrame):
+        self.rows += len(chunk)
+        self.chunks += 1
+        self.memory_usage += int(chunk.memory_usage(deep=True).sum())
+        if len(chunk):
+            self._nulls += chunk.isnull().to_numpy().sum(axis=0)
+
+    def null_counts(self) -> dict[str, int]:
+        return {col: int(n) for col, n in zip(self.columns, self._nulls)}
+
+    def result(self) -> dict[str, Any]:
+        errors = self.header_errors()
+        warnings = []
+
+        if self.rows == 0:
+            errors.append(f"File '{self.filename}' appears to be empty or contains no readable data.")
+            return {'valid': False, 'errors': errors, 'warnings': warnings}
+
+        if self.rows > 100000:
+            warnings.append(f"Large dataset detected ({self.rows:,} rows). Processing may take longer.")
+
+        if len(self.columns) > 50:
+            warnings.append(f"Many columns detected ({len(self.columns)}). Consider focusing on specific columns for better analysis.")
+
+        empty_columns = [col for col, n in zip(self.columns, self._nulls) if n == self.rows]
+        if empty_columns:
+            warnings.append(f"Found {len(empty_columns)} completely empty columns: {', '.join(empty_columns[:5])}")
+
+        mostly_empty_cols = []
+        for col, n in zip(self.columns, self._nulls):
+            missing_pct = (n / self.rows) * 100
+            if missing_pct > 80:
+                mostly_empty_cols.append(f"{col} ({missing_pct:.1f}% missing)")
+        if mostly_empty_cols:
+            warnings.append(f"Columns with >80% missing data: {', '.join(mostly_empty_cols[:3])}")
+
+        long_cols = [col for col in self.columns if len(col) > 100]
+        if long_cols:
+            warnings.append(f"Very long column names detected ({len(long_cols)} columns). This may affect readability.")
+
+        total_cells = self.rows * len(self.columns)
+        return {
+            'valid': len(errors) == 0,
+            'errors': errors,
+            'warnings': warnings,
+            'stats': {
+                'rows': self.rows,
+                'columns': len(self.columns),
+                'memory_usage': self.memory_usage,
+                'missing_data_pct': float(self._nulls.sum() / total_cells * 100) if total_cells else 0.0,
+                'duplicate_headers': self.duplicate_headers,
+                'chunks': self.chunks,
+            }
+        }
+
+
+def _detect_encoding(sample: bytes) -> str:
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+    try:
+        sample.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError as e:
+        # The sample may end part way through a multi-byte character
+        if e.start >= len(sample) - 3:
+            return 'utf-8'
+    try:
+        sample.decode('cp1252')
+        return 'cp1252'
+    except UnicodeDecodeError:
+        return 'latin1'
+
+
+def sniff_csv(sample: bytes, delimiter: Optional[str] = None) -> dict[str, Any]:
+    """Detect encoding, delimiter, quoting and header row from the first bytes of a file.
+
+    Leading title lines (a single non-empty cell, as report exports often have)
+    are skipped. A header is assumed unless the first row looks like data. Pass
+    ``delimiter`` to force one instead of sniffing it.
+    """
+    encoding = _detect_encoding(sample)
+    lines = sample.decode(encoding, errors='replace').lstrip('\ufeff').splitlines()
+    if len(sample) >= CSV_SNIFF_BYTES and len(lines) > 1:
+        lines = lines[:-1]  # probably cut short
+    text = '\n'.join(lines)
+
+    quotechar = '"'
+    if not delimiter:
+        try:
+            dialect = csv.Sniffer().sniff(text, delimiters=CSV_DELIMITERS)
+            delimiter, quotechar = dialect.delimiter, dialect.quotechar or '"'
+        except csv.Error:
+            delimiter = ','
+
+    rows = list(csv.reader(io.StringIO(text), delimiter=delimiter, quotechar=quotechar))
+    filled = [sum(1 for cell in row if cell.strip()) for row in rows]
+    skiprows = 0
+    if any(n >= 2 for n in filled):
+        while skiprows < len(rows) and filled[skiprows] < 2:
+            skiprows += 1
+
+    first = rows[skiprows] if skiprows < len(rows) else []
+    header = True
+    if first and any(_NUMBER.match(cell) for cell in first):
+        try:
+            header = csv.Sniffer().has_header('\n'.join(lines[skiprows:]))
+        except csv.Error:
+            header = True
+    columns = [cell.strip() for cell in first] if header else [f'Column_{i + 1}' for i in range(len(first))]
+
+    return {
+        'encoding': encoding,
+        'delimiter': delimiter,
+        'quotechar': quotechar,
+        'skiprows': skiprows,
+        'header': header,
+        'raw_header': columns,
+    }
+
+
+def csv_read_kwargs(dialect: dict[str, Any]) -> dict[str, Any]:
+    """pandas.read_csv arguments for a sniffed dialect (C parser, single pass)."""
+    kwargs = {
+        'encoding': dialect['encoding'],
+        # A bad byte past the sniffed sample is replaced rather than forcing a re-parse
+        'encoding_errors': 'replace',
+        'sep': dialect['delimiter'],
+        'quotechar': dialect['quotechar'],
+        'skiprows': dialect['skiprows'] or None,
+    }
+    if not dialect['header']:
+        kwargs['header'] = None
+        kwargs['names'] = dialect['raw_header']
+    return kwargs
+
+
+def read_csv_bytes(data: bytes, delimiter: Optional[str] = None, **overrides) -> pd.DataFrame:
+    """Sniff and parse an in-memory CSV (e.g. a download) in one pass."""
+    dialect = sniff_csv(data[:CSV_SNIFF_BYTES], delimiter)
+    return pd.read_csv(io.BytesIO(data), **dict(csv_read_kwargs(dialect), **overrides))
+
+
+def _unify_type(types: list[pa.DataType]) -> pa.DataType:
+    """Pick one Arrow type for a column whose inferred type differs between chunks."""
+    types = [t for t in types if not pa.types.is_null(t)]
+    if not types:
+        return pa.null()
+    if all(t == types[0] for t in types):
+        return types[0]
+    # Compacted files store categories as dictionaries and narrow integers
+    types = [t.value_type if pa.types.is_dictionary(t) else t for t in types]
+    if all(t == types[0] for t in types):
+        return types[0]
+    if all(pa.types.is_integer(t) for t in types):
+        return pa.int64()
+    if all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in types):
+        return pa.float64()
+    return pa.string()
+
+
+def _merge_parts(part_paths: list[str], data_path: str):
+    """Combine Parquet files into one, copying them a row group at a time."""
+    schemas = [pq.read_schema(p).remove_metadata() for p in part_paths]
+    names = schemas[0].names
+    target = pa.schema([
+        pa.field(name, _unify_type([s.field(name).type for s in schemas])) for name in names
+    ])
+    with pq.ParquetWriter(data_path, target, compression='zstd') as writer:
+        for path in part_paths:
+            parquet = pq.ParquetFile(path)
+            for i in range(parquet.num_row_groups):
+                table = parquet.read_row_group(i, columns=names).replace_schema_metadata(None)
+                writer.write_table(table.select(names).cast(target))
+
+
+def _check_header(filename: str, raw_header: list[str]) -> IncrementalValidator:
+    """Reject duplicate/missing headers before any data rows are parsed."""
+    header_check = IncrementalValidator(filename, raw_header, raw_header)
+    errors = header_check.header_errors()
+    if errors:
+        raise IngestValidationError({'valid': False, 'errors': errors, 'warnings': []})
+    return header_check
+
+
+def _spool_chunks(chunks: Iterable[pd.DataFrame], filename: str, raw_header: list[str],
+                  data_path: str, progress: Optional[ProgressCallback] = None,
+                  state: Optional[ProfileState] = None) -> tuple[dict, pd.DataFrame]:
+    """Validate and write DataFrame chunks to ``data_path``; returns (validation, preview).
+
+    ``state``, if given, is updated with every chunk.
+    """
+    header_check = _check_header(filename, raw_header)
+
+    parts_dir = data_path + '.parts'
+    os.makedirs(parts_dir, exist_ok=True)
+    try:
+        validator, preview, part_paths = None, None, []
+        for chunk in chunks:
+            if validator is None:
+                validator = IncrementalValidator(filename, chunk.columns, raw_header)
+                preview = chunk.head(10)
+            validator.update(chunk)
+            if state is not None:
+                state.update(chunk)
+            part_path = os.path.join(parts_dir, f'{len(part_paths):06d}.parquet')
+            _prepare_for_parquet(chunk).to_parquet(part_path, engine='pyarrow', compression='lz4', index=False)
+            part_paths.append(part_path)
+            if progress:
+                progress(validator.rows)
+
+        if validator is None or validator.rows == 0:
+            raise IngestValidationError(header_check.result())
+
+        validation = validator.result()
+        if not validation['valid']:
+            raise IngestValidationError(validation)
+        _merge_parts(part_paths, data_path)
+        validation['null_counts'] = validator.null_counts()
+        return validation, preview
+    finally:
+        shutil.rmtree(parts_dir, ignore_errors=True)
+
+
+def _stream_csv(stream: BinaryIO, filename: str, dialect: dict, data_path: str,
+                chunk_rows: int, progress: Optional[ProgressCallback] = None,
+                state: Optional[ProfileState] = None) -> tuple[dict, pd.DataFrame]:
+    raw_header = dialect['raw_header']
+    _check_header(filename, raw_header)
+    chunks = pd.read_csv(stream, chunksize=chunk_rows, **csv_read_kwargs(dialect))
+    return _spool_chunks(chunks, filename, raw_header, data_path, progress, state)
+
+
+def _publish(store: DatasetStore, dataset_id: str, data_path: str, meta: Optional[dict],
+             validation: dict, preview: pd.DataFrame) -> dict[str, Any]:
+    """Compact the written file, commit its metadata and build the ingest result."""
+    memory = None
+    if COMPACT_ON_INGEST:
+        try:
+            memory = compact_parquet(data_path)
+        except Exception:
+            # Compaction is an optimisation; keep the uncompacted file rather than fail the upload
+            memory = None
+    record = store.commit(dataset_id, dict(meta or {}, memory=memory, validation=validation))
+    return {'dataset_id': dataset_id, 'meta': record, 'validation': validation, 'preview': preview,
+            'memory': memory}
+
+
+def stream_csv_to_store(stream: BinaryIO, filename: str, meta: Optional[dict] = None,
+                        store: DatasetStore = dataset_store,
+                        chunk_rows: int = CSV_CHUNK_ROWS,
+                        progress: Optional[ProgressCallback] = None,
+                        state: Optional[ProfileState] = None) -> dict[str, Any]:
+    """Parse a CSV in chunks straight into the dataset store.
+
+    Returns ``{'dataset_id', 'meta', 'validation', 'preview', 'memory'}`` where
+    ``preview`` is the first rows of the file as a DataFrame and ``memory`` is the
+    compaction report (see compaction.compact_parquet). Raises IngestValidationError for
+    structurally invalid files; parse errors propagate from pandas. ``progress`` is
+    called with the running row count after each chunk; ``state`` (a ProfileState)
+    is updated with each chunk.
+    """
+    start = stream.tell()
+    dialect = sniff_csv(stream.read(CSV_SNIFF_BYTES))
+    stream.seek(start)
+
+    dataset_id, data_path = store.reserve()
+    try:
+        validation, preview = _stream_csv(stream, filename, dialect, data_path, chunk_rows, progress, state)
+    except Exception:
+        store.delete(dataset_id)
+        raise
+    meta = dict(meta or {}, encoding=dialect['encoding'], delimiter=dialect['delimiter'])
+    return _publish(store, dataset_id, data_path, meta, validation, preview)
+
+
+def ingest_frame(df: pd.DataFrame, filename: str, meta: Optional[dict] = None,
+                 store: DatasetStore = dataset_store, state: Optional[ProfileState] = None) -> dict[str, Any]:
+    """Validate an already-parsed frame (e.g. from Excel) and store it.
+
+    Same return shape as :func:`stream_csv_to_store`.
+    """
+    _check_header(filename, list(df.columns))
+    validator = IncrementalValidator(filename, df.columns)
+    validator.update(df)
+    validation = validator.result()
+    if not validation['valid']:
+        raise IngestValidationError(validation)
+    validation['null_counts'] = validator.null_counts()
+    if state is not None:
+        state.update(df)
+
+    dataset_id, data_path = store.reserve()
+    try:
+        _prepare_for_parquet(df).to_parquet(data_path, engine='pyarrow', compression='zstd', index=False)
+    except Exception:
+        store.delete(dataset_id)
+        raise
+    return _publish(store, dataset_id, data_path, meta, validation, df.head(10))
+
+
+def ingest_excel(stream: BinaryIO, filename: str, meta: Optional[dict] = None, reader: Optional[str] = None,
+                 file_size: int = 0, store: DatasetStore = dataset_store,
+                 progress: Optional[ProgressCallback] = None,
+                 state: Optional[ProfileState] = None) -> dict[str, Any]:
+    """Read the first sheet of a workbook with the selected backend and store it.
+
+    Streaming backends go through the same chunked path as CSV; the others parse
+    the sheet in one go. ExcelReaderError is raised for an unusable ``reader``.
+    """
+    reader = select_reader(filename, file_size, reader)
+    meta = dict(meta or {}, reader=reader)
+    if not is_streaming(reader):
+        df = read_excel(stream, filename, reader)
+        if progress:
+            progress(len(df))
+        return ingest_frame(df, filename, meta, store, state)
+
+    dataset_id, data_path = store.reserve()
+    try:
+        raw_header, chunks = iter_excel_chunks(stream)
+        validation, preview = _spool_chunks(chunks, filename, raw_header, data_path, progress, state)
+    except Exception:
+        store.delete(dataset_id)
+        raise
+    return _publish(store, dataset_id, data_path, meta, validation, preview)
+
+
+def append_datasets(store: DatasetStore, base_id: str, appended_id: str, state: ProfileState,
+                    meta: Optional[dict] = None) -> dict[str, Any]:
+    """Store ``base_id``'s rows followed by ``appended_id``'s as a new dataset.
+
+    Stored datasets are immutable (caches key on their id), so the result gets a
+    new dataset_id. ``state`` must already describe all rows of the result (the
+    base state merged with the appended one); it is saved next to the new
+    dataset so nothing is re-profiled. Raises IngestValidationError when the
+    columns differ. Returns the same shape as :func:`stream_csv_to_store`.
+    """
+    base, appended = store.meta(base_id), store.meta(appended_id)
+    if list(base['columns']) != list(appended['columns']):
+        raise IngestValidationError({'valid': False, 'warnings': [], 'errors': [
+            f"Appended columns {appended['columns']} do not match the dataset's columns {base['columns']}"
+        ]})
+
+    dataset_id, data_path = store.reserve()
+    try:
+        _merge_parts([store._paths(base_id)[0], store._paths(appended_id)[0]], data_path)
+    except Exception:
+        store.delete(dataset_id)
+        raise
+    validation = dict(appended.get('validation') or {}, null_counts={
+        str(col): column.nulls for col, column in state.columns.items()
+    })
+    preview, _ = store.read_window(base_id, 0, 10)
+    result = _publish(store, dataset_id, data_path, meta, validation, preview)
+    save_state(store, dataset_id, state)
+    result['profile_state'] = state
+    return result
+
+
+def allow_upload_body():
+    """Raise the request body limit to ``MAX_UPLOAD_BYTES`` for the current request only.
+
+    Upload routes call this before reading ``request.files``; every other
+    endpoint keeps the app-wide ``MAX_CONTENT_LENGTH``.
+    """
+    request.max_content_length = MAX_UPLOAD_BYTES
+
+
+def owner_key(user_id: Optional[int] = None, remote_addr: Optional[str] = None) -> str:
+    """Quota/dedupe bucket for an upload: the user, or the client address when anonymous."""
+    return f'user:{user_id}' if user_id else f'anon:{remote_addr or "unknown"}'
+
+
+def hash_stream(stream: BinaryIO, block_size: int = 1024 * 1024) -> str:
+    """SHA-256 of the rest of ``stream``; the position is restored afterwards."""
+    start = stream.tell()
+    digest = hashlib.sha256()
+    for block in iter(lambda: stream.read(block_size), b''):
+        digest.update(block)
+    stream.seek(start)
+    return digest.hexdigest()
+
+
+def ingest_upload(stream: BinaryIO, filename: str, owner: str, meta: Optional[dict] = None,
+                  reader: Optional[str] = None, file_size: int = 0,
+                  store: DatasetStore = dataset_store,
+                  progress: Optional[ProgressCallback] = None,
+                  profile: bool = False) -> dict[str, Any]:
+    """Ingest a CSV/Excel upload, reusing the owner's earlier parse of identical bytes.
+
+    The raw bytes are hashed first; on a hit the stored dataset and its saved
+    validation/memory report are returned without parsing (``cached`` is True).
+    Otherwise the file is parsed, indexed under its hash and the owner's byte
+    quota is enforced (``evicted`` lists datasets removed to make room).
+    With ``profile`` the dataset's ProfileState is built while parsing, saved
+    next to it and returned as ``profile_state``.
+    """
+    ext = os.path.splitext(filename.lower())[1]
+    content_key = hash_stream(stream) + ext + (f':{reader}' if reader else '')
+
+    dataset_id = store.find_content(owner, content_key)
+    if dataset_id:
+        record = store.meta(dataset_id)
+        preview, _ = store.read_window(dataset_id, 0, 10)
+        return {'dataset_id': dataset_id, 'meta': record, 'validation': record.get('validation'),
+                'preview': preview, 'memory': record.get('memory'), 'cached': True, 'evicted': [],
+                'profile_state': state_for(store, dataset_id) if profile else None}
+
+    meta = dict(meta or {}, owner=owner, content_hash=content_key)
+    state = ProfileState() if profile else None
+    if ext == '.csv':
+        result = stream_csv_to_store(stream, filename, meta, store, progress=progress, state=state)
+    else:
+        result = ingest_excel(stream, filename, meta, reader, file_size, store, progress, state)
+    if state is not None:
+        save_state(store, result['dataset_id'], state)
+    result['profile_state'] = state
+    result['cached'] = False
+    result['evicted'] = store.register_content(owner, content_key, result['dataset_id'])
+    return result
+
+
+def upload_file_info(ingested: dict[str, Any], filename: str, file_size: int) -> dict[str, Any]:
+    """The ``file_info`` block of an upload response for an :func:`ingest_upload` result."""
+    stored = ingested['meta']
+    return {
+        'filename': filename,
+        'file_size': file_size,
+        'dataset_id': ingested['dataset_id'],
+        'rows': stored['rows'],
+        'columns': len(stored['columns']),
+        'column_names': stored['columns'],
+        'data_types': stored['dtypes'],
+        'preview': ingested['preview'].head(5).to_dict('records'),
+        'warnings': ingested['validation']['warnings'],
+        'memory': ingested['memory'],
+        'cached': ingested['cached']
+    }
@@ -0,0 +1,201 @@
+"""Background ingestion jobs.
+
+``/excel/upload?async=1`` spools the upload to disk and returns a job id right
+away; parsing, validation and compaction run in a process pool so request
+workers stay free. Job state is a JSON file next to the spooled upload, written
+by the worker process as chunks are parsed, so any web worker can answer a
+``/excel/jobs/<id>`` poll.
+"""
+
+import json
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, BinaryIO, Optional
+
+from src.utils.dataset_store import DatasetStore, dataset_store, _ID_PATTERN
+from src.utils.excel_readers import ExcelReaderError
+from src.utils.ingest import IngestValidationError, ingest_upload, upload_file_info
+
+INGEST_JOB_WORKERS = int(os.getenv('INGEST_JOB_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+# Finished job records are kept this long for late polls
+JOB_TTL_SECONDS = int(os.getenv('INGEST_JOB_TTL_SECONDS', 3600))
+# Progress is written at most this often (plus once per finished job)
+PROGRESS_INTERVAL_SECONDS = 0.5
+
+FINISHED = ('done', 'failed')
+
+
+class JobNotFoundError(LookupError):
+    """Raised when a job id is unknown, expired or belongs to another owner."""
+
+    def __init__(self, job_id: str):
+        super().__init__(f"Upload job '{job_id}' not found or expired.")
+        self.job_id = job_id
+
+
+def _job_path(root: str, job_id: str) -> str:
+    if not job_id or not _ID_PATTERN.match(str(job_id)):
+        raise JobNotFoundError(str(job_id))
+    return os.path.join(root, job_id + '.json')
+
+
+def _write_state(path: str, state: dict):
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(state, f, default=str)
+    os.replace(path + '.tmp', path)
+
+
+def _update(path: str, **fields) -> dict[str, Any]:
+    # Only the worker writes a running job, so read-modify-write needs no lock
+    with open(path, 'r', encoding='utf-8') as f:
+        state = json.load(f)
+    state.update(fields, updated_at=time.time())
+    _write_state(path, state)
+    return state
+
+
+def _run_job(jobs_root: str, job_id: str, store_root: str, ttl_seconds: Optional[int],
+             quota_bytes: Optional[int], filename: str, owner: str, meta: dict,
+             reader: Optional[str], file_size: int) -> str:
+    """Worker-process entry point: ingest the spooled upload and record the outcome."""
+    path = _job_path(jobs_root, job_id)
+    upload_path = os.path.join(jobs_root, job_id + '.upload')
+    store = DatasetStore(store_root, ttl_seconds, quota_bytes)
+    _update(path, status='running', started_at=time.time())
+
+    try:
+        with open(upload_path, 'rb') as f:
+            last_write = 0.0
+
+            def progress(rows: int):
+                nonlocal last_write
+                now = time.monotonic()
+                if now - last_write >= PROGRESS_INTERVAL_SECONDS:
+                    _update(path, rows_parsed=rows, bytes_read=min(f.tell(), file_size))
+                    last_write = now
+
+            ingested = ingest_upload(f, filename, owner, meta, reader=reader, file_size=file_size,
+                                     store=store, progress=progress)
+        _update(path, status='done', finished_at=time.time(), dataset_id=ingested['dataset_id'],
+                rows_parsed=ingested['meta']['rows'], bytes_read=file_size,
+                file_info=upload_file_info(ingested, filename, file_size))
+    except IngestValidationError as e:
+        _update(path, status='failed', finished_at=time.time(), error='File validation failed',
+                details=e.validation['errors'])
+    except ExcelReaderError as e:
+        _update(path, status='failed', finished_at=time.time(), error=str(e))
+    except Exception as e:
+        _update(path, status='failed', finished_at=time.time(), error=f'Failed to read file: {str(e)}')
+    finally:
+        if os.path.exists(upload_path):
+            os.remove(upload_path)
+    return job_id
+
+
+class IngestJobs:
+    """Spools uploads and runs :func:`ingest_upload` for them in a process pool."""
+
+    def __init__(self, store: DatasetStore = dataset_store, root: Optional[str] = None,
+                 workers: int = INGEST_JOB_WORKERS, ttl_seconds: int = JOB_TTL_SECONDS):
+        self.store = store
+        self._root = root
+        self.workers = workers
+        self.ttl_seconds = ttl_seconds
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+
+    @property
+    def root(self) -> str:
+        # Resolved lazily so it follows the store directory
+        return self._root or os.path.join(self.store.root, 'jobs')
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # spawn, not fork: forking a threaded web server can deadlock the child
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            return self._pool
+
+    def submit(self, stream: BinaryIO, filename: str, owner: str, meta: Optional[dict] = None,
+               reader: Optional[str] = None, file_size: int = 0) -> dict[str, Any]:
+        """Spool ``stream`` to disk, queue it for parsing and return the job record."""
+        os.makedirs(self.root, exist_ok=True)
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        path = _job_path(self.root, job_id)
+        with open(os.path.join(self.root, job_id + '.upload'), 'wb') as f:
+            for block in iter(lambda: stream.read(1024 * 1024), b''):
+                f.write(block)
+
+        now = time.time()
+        state = {
+            'job_id': job_id,
+            'status': 'queued',
+            'owner': owner,
+            'filename': filename,
+            'bytes_total': file_size,
+            'bytes_read': 0,
+            'rows_parsed': 0,
+            'dataset_id': None,
+            'created_at': now,
+            'updated_at': now,
+        }
+        _write_state(path, state)
+
+        future = self._executor().submit(
+            _run_job, self.root, job_id, self.store.root, self.store.ttl_seconds, self.store.quota_bytes,
+            filename, owner, dict(meta or {}), reader, file_size,
+        )
+        future.add_done_callback(lambda done: self._on_done(job_id, done))
+        return state
+
+    def _on_done(self, job_id: str, future):
+        # The worker records its own errors; this only catches crashed/killed processes
+        if future.exception() is None:
+            return
+        try:
+            path = _job_path(self.root, job_id)
+            if self.get(job_id)['status'] not in FINISHED:
+                _update(path, status='failed', finished_at=time.time(),
+                        error=f'Upload worker failed: {future.exception()}')
+        except (JobNotFoundError, OSError):
+            pass
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> dict[str, Any]:
+        """Return the job record; JobNotFoundError if unknown or owned by someone else."""
+        path = _job_path(self.root, job_id)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            raise JobNotFoundError(job_id)
+        if owner is not None and state.get('owner') != owner:
+            raise JobNotFoundError(job_id)
+        return state
+
+    def purge_expired(self) -> int:
+        """Delete finished job records older than the TTL; returns how many were removed."""
+        if not os.path.isdir(self.root):
+            return 0
+        removed = 0
+        cutoff = time.time() - self.ttl_seconds
+        for name in os.listdir(self.root):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    state = json.load(f)
+                if state.get('status') in FINISHED and state.get('updated_at', 0) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except (OSError, ValueError):
+                continue
+        return removed
+
+
+ingest_jobs = IngestJobs()
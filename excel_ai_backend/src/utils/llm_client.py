@@ -0,0 +1,234 @@
+"""Shared, pooled OpenAI client.
+
+Every blueprint used to build its own ``OpenAI`` client (``openai_helper`` even
+built one per call), so each module held a separate connection pool and a new
+client paid DNS + TLS setup again. ``get_client()`` returns one process-wide
+client over a keep-alive ``httpx`` pool sized by the ``LLM_*`` settings, so
+routes issuing dozens of calls per request (enrichment, formula batches) reuse
+warm connections.
+
+``chat_completion`` is the one way to call the chat API: it caps in-flight
+calls per model (``LLM_MODEL_CONCURRENCY``, overridable per model with
+``LLM_MODEL_LIMITS=gpt-4o=4,gpt-4o-mini=16``) and records queue wait and call
+latency per model; ``call_stats()`` reports them, and ``latency_percentile``
+feeds the hedging delay in ``model_executor``.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Optional
+
+import httpx
+from openai import DefaultHttpxClient, OpenAI
+
+logger = logging.getLogger(__name__)
+
+LLM_MAX_CONNECTIONS = int(os.getenv('LLM_MAX_CONNECTIONS', 32))
+LLM_KEEPALIVE_CONNECTIONS = int(os.getenv('LLM_KEEPALIVE_CONNECTIONS', 16))
+# Idle connections are kept this long before being closed
+LLM_KEEPALIVE_EXPIRY_S = float(os.getenv('LLM_KEEPALIVE_EXPIRY_S', 60))
+LLM_CONNECT_TIMEOUT_S = float(os.getenv('LLM_CONNECT_TIMEOUT_S', 5))
+# Default in-flight calls per model; LLM_MODEL_LIMITS overrides single models
+LLM_MODEL_CONCURRENCY = int(os.getenv('LLM_MODEL_CONCURRENCY', 8))
+# How long a call waits for a free slot before failing with LLMQueueTimeout
+LLM_QUEUE_TIMEOUT_S = float(os.getenv('LLM_QUEUE_TIMEOUT_S', 30))
+
+# Recent successful call latencies kept per model for latency_percentile
+LATENCY_WINDOW = 200
+
+_PLACEHOLDER_KEY = 'sk-test-key-replace-with-real-key'
+
+
+class LLMQueueTimeout(TimeoutError):
+    """No concurrency slot for the model freed up within LLM_QUEUE_TIMEOUT_S."""
+
+
+def _parse_model_limits(spec: str) -> dict[str, int]:
+    limits = {}
+    for item in spec.split(','):
+        model, _, limit = item.partition('=')
+        if model.strip() and limit.strip().isdigit():
+            limits[model.strip()] = max(int(limit), 1)
+    return limits
+
+
+MODEL_LIMITS = _parse_model_limits(os.getenv('LLM_MODEL_LIMITS', ''))
+
+_client: Optional[OpenAI] = None
+_client_lock = threading.Lock()
+_slots: dict[str, threading.BoundedSemaphore] = {}
+_stats: dict[str, dict[str, Any]] = {}
+_latencies: dict[str, deque] = {}
+_stats_lock = threading.Lock()
+
+
+def get_client() -> Optional[OpenAI]:
+    """The shared client, or None when no real OPENAI_API_KEY is configured."""
+    global _client
+    api_key = os.getenv('OPENAI_API_KEY')
+    if not api_key or api_key == _PLACEHOLDER_KEY:
+        return None
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS,
+                                        max_keepalive_connections=LLM_KEEPALIVE_CONNECTIONS,
+                                        keepalive_expiry=LLM_KEEPALIVE_EXPIRY_S),
+                    timeout=httpx.Timeout(60.0, connect=LLM_CONNECT_TIMEOUT_S)
+                )
+                _client = OpenAI(api_key=api_key, base_url=os.getenv('OPENAI_API_BASE') or None,
+                                 http_client=http_client)
+    return _client
+
+
+def model_limit(model: str) -> int:
+    return MODEL_LIMITS.get(model, LLM_MODEL_CONCURRENCY)
+
+
+def _slot(model: str) -> threading.BoundedSemaphore:
+    with _stats_lock:
+        if model not in _slots:
+            _slots[model] = threading.BoundedSemaphore(model_limit(model))
+        return _slots[model]
+
+
+def _model_stats(model: str) -> dict[str, Any]:
+    # Callers hold _stats_lock
+    return _stats.setdefault(model, {
+        'calls': 0, 'errors': 0, 'tokens': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'queue_ms': 0.0,
+        'hedged': 0, 'hedge_wins': 0, 'last_error': None
+    })
+
+
+def _record(model: str, queue_s: float, call_s: Optional[float], tokens: Optional[int], error: Optional[str]):
+    """Add one call to the model's totals; ``call_s=None`` means it never got a slot."""
+    with _stats_lock:
+        stats = _model_stats(model)
+        if call_s is not None:
+            stats['calls'] += 1
+            stats['total_ms'] += call_s * 1000
+            stats['max_ms'] = max(stats['max_ms'], call_s * 1000)
+            stats['queue_ms'] += queue_s * 1000
+        stats['tokens'] += tokens or 0
+        if error:
+            stats['errors'] += 1
+            stats['last_error'] = error
+        elif call_s is not None:
+            _latencies.setdefault(model, deque(maxlen=LATENCY_WINDOW)).append(call_s)
+
+
+def record_hedge(model: str, won: bool = False):
+    """Count a hedged call fired at ``model`` (``won=False``) or one that answered first (``won=True``)."""
+    with _stats_lock:
+        _model_stats(model)['hedge_wins' if won else 'hedged'] += 1
+
+
+def latency_percentile(model: str, percentile: float, min_samples: int = 20) -> Optional[float]:
+    """Seconds below which ``percentile``% of the model's recent successful calls finished.
+
+    None until ``min_samples`` calls have been seen, so a cold model is never hedged on noise.
+    """
+    with _stats_lock:
+        recent = list(_latencies.get(model, ()))
+    if len(recent) < min_samples:
+        return None
+    recent.sort()
+    return recent[min(int(len(recent) * percentile / 100), len(recent) - 1)]
+
+
+def chat_completion(max_retries: Optional[int] = None, **params):
+    """``client.chat.completions.create(**params)`` on the shared client, within the model's concurrency limit.
+
+    ``max_retries`` overrides the SDK's own retries for this call (same
+    connection pool). Raises RuntimeError when the API is not configured,
+    LLMQueueTimeout when no slot frees up in time, and whatever the API call
+    raises.
+    """
+    client = get_client()
+    if client is None:
+        raise RuntimeError('OpenAI API not configured. Please set OPENAI_API_KEY environment variable.')
+    if max_retries is not None:
+        client = client.with_options(max_retries=max_retries)
+    model = params.get('model', '')
+    slot = _slot(model)
+    queued = time.perf_counter()
+    if not slot.acquire(timeout=LLM_QUEUE_TIMEOUT_S):
+        _record(model, time.perf_counter() - queued, None, None, 'queue timeout')
+        raise LLMQueueTimeout(f'LLM queue timeout: no free {model} slot after {LLM_QUEUE_TIMEOUT_S:g}s')
+    started = time.perf_counter()
+    try:
+        response = client.chat.completions.create(**params)
+    except Exception as e:
+        _record(model, started - queued, time.perf_counter() - started, None, type(e).__name__)
+        raise
+    finally:
+        slot.release()
+    elapsed = time.perf_counter() - started
+    usage = getattr(response, 'usage', None)
+    _record(model, started - queued, elapsed, getattr(usage, 'total_tokens', None), None)
+    logger.debug('LLM call model=%s latency_ms=%d queue_ms=%d', model, elapsed * 1000, (started - queued) * 1000)
+    return response
+
+
+def chat_completion_stream(max_retries: Optional[int] = None, **params):
+    """Streaming :func:`chat_completion`: yields the response chunks.
+
+    The model's concurrency slot is held until the stream is exhausted or
+    closed; the call is recorded (with token usage from the final chunk) when
+    it ends.
+    """
+    client = get_client()
+    if client is None:
+        raise RuntimeError('OpenAI API not configured. Please set OPENAI_API_KEY environment variable.')
+    if max_retries is not None:
+        client = client.with_options(max_retries=max_retries)
+    model = params.get('model', '')
+    slot = _slot(model)
+    queued = time.perf_counter()
+    if not slot.acquire(timeout=LLM_QUEUE_TIMEOUT_S):
+        _record(model, time.perf_counter() - queued, None, None, 'queue timeout')
+        raise LLMQueueTimeout(f'LLM queue timeout: no free {model} slot after {LLM_QUEUE_TIMEOUT_S:g}s')
+    started = time.perf_counter()
+    tokens, error = None, None
+    try:
+        with client.chat.completions.create(stream=True, stream_options={'include_usage': True}, **params) as stream:
+            for chunk in stream:
+                if chunk.usage:
+                    tokens = chunk.usage.total_tokens
+                yield chunk
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        slot.release()
+        _record(model, started - queued, time.perf_counter() - started, tokens, error)
+
+
+def call_stats() -> dict[str, Any]:
+    """Per-model call counts, errors, tokens and latency (average / max / queue wait) since start-up."""
+    with _stats_lock:
+        models = {
+            model: {
+                'calls': stats['calls'],
+                'errors': stats['errors'],
+                'tokens': stats['tokens'],
+                'avg_latency_ms': round(stats['total_ms'] / stats['calls'], 1) if stats['calls'] else 0,
+                'max_latency_ms': round(stats['max_ms'], 1),
+                'avg_queue_ms': round(stats['queue_ms'] / stats['calls'], 1) if stats['calls'] else 0,
+                'hedged': stats['hedged'],
+                'hedge_wins': stats['hedge_wins'],
+                'concurrency_limit': model_limit(model),
+                'last_error': stats['last_error']
+            }
+            for model, stats in _stats.items()
+        }
+    return {
+        'configured': get_client() is not None,
+        'max_connections': LLM_MAX_CONNECTIONS,
+        'keepalive_connections': LLM_KEEPALIVE_CONNECTIONS,
+        'models': models
+    }
@@ -0,0 +1,99 @@
+"""Token-budget micro-batching of short texts into shared prompts.
+
+One prompt per review or comment pays the instructions, the request overhead
+and a round trip for a few dozen tokens of text. ``run_batches`` packs as
+many texts as fit ``ENRICH_BATCH_TOKENS`` (at most ``ENRICH_BATCH_MAX_ROWS``)
+into one call whose answer is keyed by item number. The budget covers each
+row's text and its expected answer (``output_tokens``), so a batch's answer
+fits ``batch_max_tokens`` and long answers (summaries) get smaller batches.
+Every item in an answer is validated; items the model skipped, garbled or
+lost to a failed call are re-queued, in smaller batches, for up to
+``ENRICH_BATCH_ROUNDS`` rounds. Batches of a round run concurrently through
+``fan_out``, each allowed ``batch_timeout`` for its size.
+"""
+
+import os
+from typing import Any, Callable, Hashable, Sequence
+
+from src.utils.fanout import ENRICH_ROW_TIMEOUT_S, fan_out
+from src.utils.telemetry import estimate_tokens
+
+# Estimated tokens per call: the packed texts plus the answers expected for them
+ENRICH_BATCH_TOKENS = int(os.getenv('ENRICH_BATCH_TOKENS', 6000))
+ENRICH_BATCH_MAX_ROWS = int(os.getenv('ENRICH_BATCH_MAX_ROWS', 50))
+# Attempts per row: the first batch plus re-queues of rows missing from answers
+ENRICH_BATCH_ROUNDS = 3
+# Per-item framing in the prompt ({"i": n, "text": ...}) and in the answer
+ITEM_OVERHEAD_TOKENS = 12
+# Answer tokens the model writes per second, for batch timeouts
+ENRICH_OUTPUT_TOKENS_PER_SECOND = float(os.getenv('ENRICH_OUTPUT_TOKENS_PER_SECOND', 25))
+
+
+def batch_max_tokens(rows: int, output_tokens: int) -> int:
+    """``max_tokens`` for the answer to a batch of ``rows`` items (plus the ``{"results": [...]}`` wrapper)."""
+    return rows * (output_tokens + ITEM_OVERHEAD_TOKENS) + 50
+
+
+def batch_timeout(rows: int, output_tokens: int) -> float:
+    """Seconds allowed for a batch: one row's timeout plus the time to write the whole answer."""
+    return ENRICH_ROW_TIMEOUT_S + batch_max_tokens(rows, output_tokens) / ENRICH_OUTPUT_TOKENS_PER_SECOND
+
+
+def pack(rows: Sequence[tuple[Hashable, str]], token_budget: int = ENRICH_BATCH_TOKENS,
+         max_rows: int = ENRICH_BATCH_MAX_ROWS, output_tokens: int = 0) -> list[list[tuple[Hashable, str]]]:
+    """Split ``(key, text)`` rows, in order, into batches within the token and row budgets.
+
+    Each row costs its text, the item framing (prompt and answer) and
+    ``output_tokens`` for its expected answer. A row costing more than the
+    whole budget gets a batch of its own.
+    """
+    batches, current, used = [], [], 0
+    for row in rows:
+        cost = estimate_tokens(row[1]) + 2 * ITEM_OVERHEAD_TOKENS + output_tokens
+        if current and (used + cost > token_budget or len(current) >= max_rows):
+            batches.append(current)
+            current, used = [], 0
+        current.append(row)
+        used += cost
+    if current:
+        batches.append(current)
+    return batches
+
+
+def run_batches(rows: Sequence[tuple[Hashable, str]], call_batch: Callable[[list[str]], dict],
+                validate: Callable[[Any], Any], output_tokens: int = 0,
+                token_budget: int = ENRICH_BATCH_TOKENS, max_rows: int = ENRICH_BATCH_MAX_ROWS,
+                rounds: int = ENRICH_BATCH_ROUNDS) -> tuple[dict, dict]:
+    """Enrich ``(key, text)`` rows in packed batches.
+
+    ``call_batch(texts)`` returns ``{item number: raw answer}`` for the texts
+    it was given (numbered from 0), sizing its call with ``batch_max_tokens``
+    and ``batch_timeout``; ``validate(raw)`` returns the row's result or
+    raises. ``output_tokens`` is the expected answer size per row. Returns
+    ``(results, errors)``, both keyed by row key; every row ends up in exactly
+    one of them.
+    """
+    results, errors = {}, {}
+    pending = list(rows)
+    for attempt in range(rounds):
+        if not pending:
+            break
+        # Re-queued rows go in smaller batches, so one bad item sinks fewer neighbours
+        batches = pack(pending, token_budget, max(1, max_rows >> attempt), output_tokens)
+        # The largest batch of the round sets the deadline; each call also carries its own timeout
+        outcomes = fan_out(lambda batch: call_batch([text for _, text in batch]), batches,
+                           timeout_s=batch_timeout(max(len(batch) for batch in batches), output_tokens))
+        pending = []
+        for batch, (answers, error) in zip(batches, outcomes):
+            for number, (key, text) in enumerate(batch):
+                if error is None and number in answers:
+                    try:
+                        results[key] = validate(answers[number])
+                        errors.pop(key, None)
+                        continue
+                    except Exception as e:
+                        errors[key] = f'Invalid answer: {type(e).__name__}: {e}'
+                else:
+                    errors[key] = error or 'Missing from the batched answer'
+                pending.append((key, text))
+    return results, errors
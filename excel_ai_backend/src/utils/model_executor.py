@@ -0,0 +1,200 @@
+"""Run a chat request down the router's model chain.
+
+``execute_chain`` tries the models from ``model_router.get_model_chain`` in
+order, each with its own ``get_time_budget_seconds`` timeout (sized for
+``max_tokens``), and moves to the next tier when one fails (unknown model,
+rate limit, timeout, server error).
+Authentication errors stop the chain straight away.
+
+Hedging: once a tier has been outstanding for longer than its recent
+``LLM_HEDGE_PERCENTILE`` latency (see ``llm_client.latency_percentile``), the
+next tier is fired in parallel and whichever answers first wins. Slow tails
+then cost roughly one percentile delay instead of a full time budget, while
+only the slowest few percent of calls pay for a second request. A losing call
+is not cancelled (the HTTP client cannot abort it); it finishes in the
+background within its time budget and only counts in the pool statistics.
+
+``stream_chain`` is the streaming counterpart used by the ``?stream=1``
+endpoints. It falls through tiers the same way until a model produces its
+first token; after that the answer is committed to that model. Streams are
+not hedged, since two partial answers cannot be merged.
+"""
+
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Iterator, Optional
+
+from src.utils.llm_client import chat_completion, chat_completion_stream, latency_percentile, record_hedge
+from src.utils.model_router import get_time_budget_seconds
+
+# Hedge after this percentile of a tier's recent latency; 0 disables hedging
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', 95))
+# Threads running chain calls, shared by all requests
+LLM_EXECUTOR_WORKERS = int(os.getenv('LLM_EXECUTOR_WORKERS', 16))
+
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=LLM_EXECUTOR_WORKERS, thread_name_prefix='llm-chain')
+    return _pool
+
+
+def _error_kind(error: Exception) -> str:
+    message = str(error).lower()
+    if 'authentication' in message or 'api key' in message or 'not configured' in message:
+        return 'auth'
+    if 'rate limit' in message or 'quota' in message:
+        return 'rate_limit'
+    if 'timeout' in message or 'timed out' in message or 'connection' in message:
+        return 'timeout'
+    return 'other'
+
+
+def _failure(error: Optional[Exception], models_tried: list[str]) -> dict[str, Any]:
+    kind = _error_kind(error) if error else 'other'
+    result = {'success': False, 'models_tried': models_tried}
+    if kind == 'auth':
+        result.update(error='OpenAI API authentication failed. Please check your API key configuration.', fatal=True)
+    elif kind == 'rate_limit':
+        result.update(error='OpenAI API rate limit exceeded. Please try again in a few minutes.', retry_after=60)
+    elif kind == 'timeout':
+        result.update(error='OpenAI API connection timeout. Please check your internet connection and try again.',
+                      retry_after=10)
+    else:
+        result.update(error=f'OpenAI API request failed (models tried: {", ".join(models_tried)}): {error}',
+                      retry_after=30)
+    return result
+
+
+def execute_chain(messages: list, model_chain: list[str], max_tokens: int = 800, temperature: float = 0.3,
+                  time_budget_s: Optional[float] = None, hedge: bool = True) -> dict[str, Any]:
+    """Answer ``messages`` with the first model in ``model_chain`` that succeeds.
+
+    Each tier's budget is sized for ``max_tokens``; ``time_budget_s`` caps
+    it (e.g. for batch calls).
+    Returns ``success``, ``content``, ``usage``, ``model_used``,
+    ``models_tried`` (in launch order), ``fallback_used`` (the answer did not
+    come from the first tier) and ``hedged`` / ``hedge_won`` (a parallel
+    request was fired / answered first); failures carry ``error`` and, as
+    before, ``retry_after`` or ``fatal``.
+    """
+    chain = list(dict.fromkeys(model for model in model_chain if model))
+    if not chain:
+        return {'success': False, 'error': 'No model available for this request', 'models_tried': []}
+    pool = _get_pool()
+    models_tried: list[str] = []
+    pending: dict = {}
+    launched_at: dict[str, float] = {}
+    hedged = False
+    last_error: Optional[Exception] = None
+
+    def launch(is_hedge: bool):
+        model = chain[len(models_tried)]
+        budget = get_time_budget_seconds(model, max_tokens)
+        if time_budget_s is not None:
+            budget = min(budget, time_budget_s)
+        models_tried.append(model)
+        launched_at[model] = time.perf_counter()
+        if is_hedge:
+            record_hedge(model)
+        # No SDK retries: a failed tier falls through to the next one within its own budget
+        future = pool.submit(chat_completion, model=model, messages=messages, max_tokens=max_tokens,
+                             temperature=temperature, timeout=budget, max_retries=0)
+        pending[future] = (model, is_hedge)
+
+    launch(False)
+    while pending:
+        delay = None
+        if hedge and LLM_HEDGE_PERCENTILE > 0 and len(models_tried) < len(chain):
+            newest = models_tried[-1]
+            cutoff = latency_percentile(newest, LLM_HEDGE_PERCENTILE)
+            if cutoff is not None:
+                delay = max(cutoff - (time.perf_counter() - launched_at[newest]), 0.0)
+        done, _ = wait(pending, timeout=delay, return_when=FIRST_COMPLETED)
+        if not done:
+            hedged = True
+            launch(True)
+            continue
+
+        for future in done:
+            model, is_hedge = pending.pop(future)
+            try:
+                response = future.result()
+            except Exception as e:
+                last_error = e
+                if _error_kind(e) == 'auth':
+                    return _failure(e, models_tried)
+                continue
+            if is_hedge:
+                record_hedge(model, won=True)
+            return {
+                'success': True,
+                'content': response.choices[0].message.content,
+                'usage': response.usage.total_tokens if response.usage else 0,
+                'model_used': model,
+                'models_tried': models_tried,
+                'fallback_used': model != chain[0],
+                'hedged': hedged,
+                'hedge_won': is_hedge
+            }
+        if not pending and len(models_tried) < len(chain):
+            launch(False)
+
+    return _failure(last_error, models_tried)
+
+
+def stream_chain(messages: list, model_chain: list[str], max_tokens: int = 800,
+                 temperature: float = 0.3) -> Iterator[tuple[str, Any]]:
+    """Yield ``('token', text)`` as the answer streams in, then one ``('result', dict)``.
+
+    The result has the same keys as :func:`execute_chain` (``hedged`` and
+    ``hedge_won`` are always False). A tier that fails before its first token
+    falls through to the next one; a failure mid-answer ends the stream with
+    a failure result.
+    """
+    chain = list(dict.fromkeys(model for model in model_chain if model))
+    models_tried: list[str] = []
+    last_error: Optional[Exception] = None
+    for model in chain:
+        models_tried.append(model)
+        parts: list[str] = []
+        usage = None
+        try:
+            for chunk in chat_completion_stream(model=model, messages=messages, max_tokens=max_tokens,
+                                                temperature=temperature, timeout=get_time_budget_seconds(model),
+                                                max_retries=0):
+                if chunk.usage:
+                    usage = chunk.usage.total_tokens
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield 'token', delta
+        except Exception as e:
+            last_error = e
+            if parts or _error_kind(e) == 'auth':
+                yield 'result', _failure(e, models_tried)
+                return
+            continue
+        yield 'result', {
+            'success': True,
+            'content': ''.join(parts),
+            'usage': usage or 0,
+            'model_used': model,
+            'models_tried': models_tried,
+            'fallback_used': model != chain[0],
+            'hedged': False,
+            'hedge_won': False
+        }
+        return
+    if not chain:
+        yield 'result', {'success': False, 'error': 'No model available for this request', 'models_tried': []}
+        return
+    yield 'result', _failure(last_error, models_tried)
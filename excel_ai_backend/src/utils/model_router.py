@@ -1,4 +1,4 @@
-from typing import List, Tuple, Dict
+from typing import List, Tuple, Dict, Optional
 
 
 def get_model_chain(user, task: str) -> List[str]:
@@ -42,15 +42,30 @@ def get_model_chain(user, task: str) -> List[str]:
     return ordered
 
 
-def get_time_budget_seconds(model: str) -> int:
-    """Return per-request timeout budget per model."""
+# Typical output tokens per second, used to size budgets for long answers
+DECODE_TOKENS_PER_SECOND = {'gpt-4.1-mini': 80, 'gpt-4o-mini': 80, 'gpt-4o': 50, 'gpt-5-preview': 30}
+# Time to first token assumed on top of the decode time
+FIRST_TOKEN_SECONDS = 2
+
+
+def get_time_budget_seconds(model: str, max_tokens: Optional[int] = None) -> float:
+    """Return per-request timeout budget per model.
+
+    With ``max_tokens`` the budget also covers writing that many tokens at the
+    model's typical rate, so long answers (insights, analyses) are not cut
+    off by the short-answer budget.
+    """
     if model in ('gpt-4.1-mini', 'gpt-4o-mini'):
-        return 4
-    if model in ('gpt-4o',):
-        return 8
-    if model in ('gpt-5-preview',):
-        return 10
-    return 8
+        budget = 4
+    elif model in ('gpt-4o',):
+        budget = 8
+    elif model in ('gpt-5-preview',):
+        budget = 10
+    else:
+        budget = 8
+    if max_tokens:
+        return max(budget, FIRST_TOKEN_SECONDS + max_tokens / DECODE_TOKENS_PER_SECOND.get(model, 40))
+    return budget
 
 
 def get_task_params(task: str) -> Dict[str, int | float]:
@@ -1,11 +1,11 @@
 """
 OpenAI API helper functions
 """
-import os
 import time
-import openai
 from typing import Optional, Dict, Any
 
+from src.utils.llm_client import chat_completion
+
 def call_openai_with_retry(
     messages: list,
     model: str = "gpt-3.5-turbo",
@@ -14,16 +14,11 @@ def call_openai_with_retry(
     max_retries: int = 3
 ) -> str:
     """
-    Call OpenAI API with retry logic
+    Call OpenAI API with retry logic (on the shared pooled client)
     """
-    client = openai.OpenAI(
-        api_key=os.getenv('OPENAI_API_KEY'),
-        base_url=os.getenv('OPENAI_API_BASE', 'https://api.openai.com/v1')
-    )
-    
     for attempt in range(max_retries):
         try:
-            response = client.chat.completions.create(
+            response = chat_completion(
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens,
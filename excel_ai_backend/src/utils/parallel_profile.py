@@ -0,0 +1,111 @@
+"""Column-partitioned profiling across a process pool.
+
+Per-column statistics are independent, so wide datasets (e.g. 300-column
+finance extracts) are profiled by splitting the columns across worker
+processes. The frame is written once as an Arrow IPC stream into a
+``multiprocessing.shared_memory`` block; each worker maps that block, reads its
+columns without copying the buffers and returns only the (small) statistics.
+Frames are never pickled to the workers.
+
+Spawning workers and converting the frame to Arrow cost a fixed overhead, so
+the pool is only used when rows x columns reaches ``PARALLEL_PROFILE_MIN_CELLS``
+and there are enough columns to share out; smaller frames stay on the calling
+thread.
+"""
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+PROFILE_WORKERS = int(os.getenv('PROFILE_WORKERS', os.cpu_count() or 1))
+PARALLEL_PROFILE_MIN_CELLS = int(os.getenv('PARALLEL_PROFILE_MIN_CELLS', 20000000))
+# Fewer columns than this are not worth splitting, however many rows they have
+PARALLEL_PROFILE_MIN_COLUMNS = 16
+
+_executor: Optional[ProcessPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor() -> ProcessPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn: forking a threaded web worker is unsafe
+            _executor = ProcessPoolExecutor(PROFILE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _executor
+
+
+def use_parallel(df: pd.DataFrame) -> bool:
+    """Whether ``df`` is big and wide enough to profile in the pool."""
+    columns = len(df.columns)
+    return (PROFILE_WORKERS > 1 and columns >= PARALLEL_PROFILE_MIN_COLUMNS
+            and len(df) * columns >= PARALLEL_PROFILE_MIN_CELLS
+            # Arrow needs unique string names to hand columns back by name
+            and df.columns.is_unique and all(isinstance(col, str) for col in df.columns))
+
+
+def _write_shared(df: pd.DataFrame) -> tuple[shared_memory.SharedMemory, int]:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sizer = pa.MockOutputStream()
+    with pa.ipc.new_stream(sizer, table.schema) as writer:
+        writer.write_table(table)
+    size = sizer.size()
+
+    shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+    try:
+        with pa.ipc.new_stream(pa.FixedSizeBufferWriter(pa.py_buffer(shm.buf)), table.schema) as writer:
+            writer.write_table(table)
+    except BaseException:
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, size
+
+
+def _run_partition(name: str, size: int, dtypes: dict, fn: Callable, args: tuple) -> Any:
+    """Worker entry point: ``fn(frame_of_columns, *args)`` over a shared Arrow stream."""
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        table = pa.ipc.open_stream(pa.py_buffer(shm.buf)[:size]).read_all()
+        frame = table.select(list(dtypes)).to_pandas()
+        del table
+        # Arrow infers types for object columns (e.g. all-int objects come back int64); restore the originals
+        frame = frame.astype({col: dtype for col, dtype in dtypes.items() if frame[col].dtype != dtype})
+        return fn(frame, *args)
+    finally:
+        frame = None
+        try:
+            shm.close()
+        except BufferError:
+            pass  # a zero-copy view is still alive; the mapping goes when the worker exits
+
+
+def map_columns(df: pd.DataFrame, fn: Callable, *args) -> Optional[list]:
+    """Run ``fn(part, *args)`` on column partitions of ``df`` in the pool.
+
+    ``fn`` must be a module-level function whose result only depends on the
+    columns it is given. Returns one result per partition; partitions are
+    interleaved (columns 0, n, 2n, ...) so dtype runs are spread across workers.
+    Returns None if the frame has columns Arrow cannot hold (e.g. mixed-type
+    objects); callers then profile it serially.
+    """
+    columns = list(df.columns)
+    workers = min(PROFILE_WORKERS, len(columns))
+    partitions = [{col: df[col].dtype for col in columns[i::workers]} for i in range(workers)]
+    try:
+        shm, size = _write_shared(df)
+    except pa.ArrowException:
+        return None
+    try:
+        executor = _get_executor()
+        futures = [executor.submit(_run_partition, shm.name, size, part, fn, args) for part in partitions]
+        return [future.result() for future in futures]
+    finally:
+        shm.close()
+        shm.unlink()
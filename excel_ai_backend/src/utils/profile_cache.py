@@ -0,0 +1,188 @@
+"""Shared dataset profiles.
+
+Analyze, data-prep, data-cleaning and chart endpoints all need the same column
+statistics (dtype groups, missing/distinct counts, top values, numeric summary,
+IQR outliers, duplicate rows). :func:`get_profile` computes them once per
+dataset fingerprint and keeps the result in a small LRU cache, so moving a
+dataset through Analyze -> Prep -> Visualize profiles it once.
+
+Stored datasets are immutable, so their fingerprint is the dataset_id (plus the
+dtypes, since some endpoints expand categories after loading). Inline rows are
+fingerprinted by hashing their values.
+"""
+
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from src.utils.duplicates import duplicate_mask, row_hashes
+from src.utils.parallel_profile import map_columns, use_parallel
+from src.utils.profiler import profile_numeric
+from src.utils.sketches import HyperLogLog, error_bounds, sketch_columns
+
+PROFILE_CACHE_SIZE = int(os.getenv('PROFILE_CACHE_SIZE', 32))
+# Most frequent values kept per text column
+PROFILE_TOP_VALUES = 10
+
+
+def frame_fingerprint(df: pd.DataFrame, hashes: Optional[np.ndarray] = None) -> Optional[str]:
+    """SHA-256 over column names, dtypes and row hashes; None if a value is unhashable."""
+    if hashes is None:
+        hashes = row_hashes(df)
+    if hashes is None:
+        return None  # e.g. lists/dicts in inline JSON rows
+    digest = hashlib.sha256()
+    digest.update(json.dumps([[str(c) for c in df.columns], df.dtypes.astype(str).tolist()]).encode('utf-8'))
+    digest.update(hashes.tobytes())
+    return digest.hexdigest()
+
+
+def column_stats(df: pd.DataFrame, approx: bool = False) -> dict[str, dict]:
+    """Per-column statistics of ``df``: missing, unique, top_values, summary_stats, outlier_counts.
+
+    Every entry depends on its own column only, so column partitions can be
+    computed separately (see parallel_profile.py) and their dicts merged.
+    ``top_k_floor`` holds the Space-Saving error floors of non-numeric columns
+    in approx mode.
+    """
+    numeric = df.select_dtypes(include=[np.number]).columns.tolist()
+    categorical = df.select_dtypes(include=['object', 'category']).columns.tolist()
+    stats = {'missing': {col: int(n) for col, n in df.isnull().sum().items()}}
+    stats['summary_stats'], stats['outlier_counts'] = profile_numeric(df, numeric, approx=approx)
+
+    other = [col for col in df.columns if col not in numeric]
+    if approx:
+        sketches = sketch_columns(df, other)
+        stats['unique'] = {col: HyperLogLog().update(df[col]).count() for col in numeric}
+        stats['unique'].update({col: sketch.distinct.count() for col, sketch in sketches.items()})
+        stats['top_values'] = {
+            col: {value: count for value, count, _ in sketches[col].top_k.top(PROFILE_TOP_VALUES)}
+            for col in categorical
+        }
+        stats['top_k_floor'] = {col: sketch.top_k.floor for col, sketch in sketches.items()}
+    else:
+        stats['unique'] = {col: int(n) for col, n in df.nunique().items()}
+        stats['top_values'] = {
+            col: df[col].value_counts().head(PROFILE_TOP_VALUES).to_dict() for col in categorical
+        }
+    return stats
+
+
+def _partition_profile(df: pd.DataFrame, approx: bool) -> tuple[dict, np.ndarray]:
+    """:func:`column_stats` plus per-row group ids over these columns (equal ids = equal rows here)."""
+    groups = df.groupby(list(df.columns), sort=False, dropna=False, observed=True).ngroup()
+    return column_stats(df, approx), groups.to_numpy()
+
+
+class DatasetProfile:
+    """Column statistics for one dataset. Cached and shared - treat as read-only.
+
+    ``duplicate_positions`` are the row positions ``df.duplicated()`` flags;
+    pass them to ``drop_duplicate_rows`` to remove duplicates without another pass.
+    """
+
+    def __init__(self, df: pd.DataFrame, approx: bool = False, hashes: Optional[np.ndarray] = None):
+        self.approx = approx
+        self.rows = len(df)
+        self.columns = list(df.columns)
+        self.dtypes = df.dtypes.astype(str).to_dict()
+        self.numeric_columns = df.select_dtypes(include=[np.number]).columns.tolist()
+        self.categorical_columns = df.select_dtypes(include=['object', 'category']).columns.tolist()
+        self.datetime_columns = df.select_dtypes(include=['datetime']).columns.tolist()
+        self.memory_usage_bytes = int(df.memory_usage(deep=True).sum())
+
+        # Wide frames are split by column across the profiling pool
+        parts = map_columns(df, _partition_profile, approx) if use_parallel(df) else None
+        if parts is None:
+            stats = column_stats(df, approx)
+            self.duplicate_positions = np.flatnonzero(duplicate_mask(df, hashes))
+        else:
+            stats = parts[0][0]
+            for part, _ in parts[1:]:
+                for key, values in part.items():
+                    stats[key].update(values)
+            # A row repeats an earlier one iff its group ids repeat in every partition
+            groups = pd.DataFrame({i: part_groups for i, (_, part_groups) in enumerate(parts)})
+            self.duplicate_positions = np.flatnonzero(groups.duplicated().to_numpy())
+        self.duplicate_rows = len(self.duplicate_positions)
+
+        # Keyed in column order, whichever partition computed them
+        def ordered(values: dict) -> dict:
+            return {col: values[col] for col in self.columns if col in values}
+
+        self.missing = ordered(stats['missing'])
+        self.unique = ordered(stats['unique'])
+        self.summary_stats = ordered(stats['summary_stats'])
+        self.outlier_counts = ordered(stats['outlier_counts'])
+        self.top_values = ordered(stats['top_values'])
+        if approx:
+            self.error_bounds = error_bounds()
+            if stats['top_k_floor']:
+                self.error_bounds['top_k_max_count_error'] = {
+                    str(col): floor for col, floor in ordered(stats['top_k_floor']).items()
+                }
+        else:
+            self.error_bounds = None
+
+    def non_null(self, col) -> int:
+        return self.rows - self.missing[col]
+
+
+class ProfileCache:
+    """LRU cache of :class:`DatasetProfile` objects keyed by fingerprint."""
+
+    def __init__(self, max_entries: int = PROFILE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._profiles: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[DatasetProfile]:
+        with self._lock:
+            profile = self._profiles.get(key)
+            if profile is not None:
+                self._profiles.move_to_end(key)
+            return profile
+
+    def put(self, key, profile: DatasetProfile):
+        with self._lock:
+            self._profiles[key] = profile
+            self._profiles.move_to_end(key)
+            while len(self._profiles) > self.max_entries:
+                self._profiles.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._profiles.clear()
+
+
+profile_cache = ProfileCache()
+
+
+def get_profile(df: pd.DataFrame, dataset_id: Optional[str] = None, approx: bool = False) -> DatasetProfile:
+    """Return the cached profile of ``df``, computing it on first use.
+
+    Pass ``dataset_id`` when ``df`` was loaded from the dataset store to skip
+    hashing the rows up front. Otherwise the row hashes behind the fingerprint
+    also serve the profile's duplicate detection.
+    """
+    hashes = None
+    if dataset_id:
+        key = ('dataset', dataset_id, tuple(df.dtypes.astype(str)), approx)
+    else:
+        hashes = row_hashes(df)
+        fingerprint = frame_fingerprint(df, hashes)
+        if fingerprint is None:
+            return DatasetProfile(df, approx)
+        key = ('frame', fingerprint, approx)
+
+    profile = profile_cache.get(key)
+    if profile is None:
+        profile = DatasetProfile(df, approx, hashes)
+        profile_cache.put(key, profile)
+    return profile
@@ -0,0 +1,311 @@
+"""Mergeable profile state for stored datasets.
+
+``ProfileState`` keeps per-column statistics that can be updated one chunk at
+a time and merged:
+
+- row and null counts;
+- min/max;
+- Welford moments (mean and M2, combined with Chan's parallel formula);
+- an equi-width histogram whose bin width doubles as the range grows;
+- a HyperLogLog distinct counter;
+- Space-Saving top values (text columns only).
+
+``update(chunk)`` is O(len(chunk)) and ``merge(other)`` is O(columns). So
+chunked uploads and appends to a connector dataset update its statistics
+without rescanning the rows already stored. States are persisted next to the
+dataset as a msgpack sidecar (see :func:`save_state` / :func:`state_for`).
+"""
+
+import math
+import os
+from typing import Any, Optional
+
+import msgpack
+import numpy as np
+import pandas as pd
+
+from src.utils.dataset_store import DatasetStore
+from src.utils.sketches import HyperLogLog, SpaceSaving
+
+HISTOGRAM_BINS = int(os.getenv('PROFILE_HISTOGRAM_BINS', 64))
+# Sidecar name in the dataset store (<dataset_id>.profile)
+STATE_SIDECAR = 'profile'
+STATE_VERSION = 1
+# Most frequent values reported per text column
+STATE_TOP_VALUES = 10
+
+
+class Histogram:
+    """Histogram over bins ``[k * 2**exponent, (k + 1) * 2**exponent)``, at most ``max_bins`` wide.
+
+    Bins are aligned to powers of two, so two histograms merge exactly: the
+    finer one is coarsened to the other's width and the counts add up.
+    """
+
+    def __init__(self, max_bins: int = HISTOGRAM_BINS):
+        self.max_bins = max_bins
+        self.exponent: Optional[int] = None
+        self.counts: dict[int, int] = {}
+
+    def _span(self, lo: float, hi: float, exponent: int) -> int:
+        width = 2.0 ** exponent
+        return math.floor(hi / width) - math.floor(lo / width) + 1
+
+    def _coarsen(self, exponent: int):
+        shift = exponent - self.exponent
+        if shift > 0:
+            merged: dict[int, int] = {}
+            for key, count in self.counts.items():
+                # >> floors negative keys too
+                merged[key >> shift] = merged.get(key >> shift, 0) + count
+            self.counts = merged
+        self.exponent = exponent
+
+    def _fit(self, lo: float, hi: float, exponent: int) -> int:
+        exponent = max(exponent, math.frexp((hi - lo) / self.max_bins)[1])
+        while self._span(lo, hi, exponent) > self.max_bins:
+            exponent += 1
+        return exponent
+
+    def _bounds(self) -> tuple[float, float]:
+        width = 2.0 ** self.exponent
+        return min(self.counts) * width, (max(self.counts) + 1) * width - width / 2
+
+    def update(self, values: np.ndarray) -> 'Histogram':
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return self
+        lo, hi = float(values.min()), float(values.max())
+        exponent = -1074 if self.exponent is None else self.exponent
+        if self.counts:
+            lo, hi = min(lo, self._bounds()[0]), max(hi, self._bounds()[1])
+        exponent = self._fit(lo, hi, exponent)
+        if self.exponent is None:
+            self.exponent = exponent
+        self._coarsen(exponent)
+
+        keys, counts = np.unique(np.floor(values / 2.0 ** exponent).astype(np.int64), return_counts=True)
+        for key, count in zip(keys.tolist(), counts.tolist()):
+            self.counts[key] = self.counts.get(key, 0) + count
+        return self
+
+    def merge(self, other: 'Histogram') -> 'Histogram':
+        if not other.counts:
+            return self
+        if not self.counts:
+            self.exponent, self.counts = other.exponent, dict(other.counts)
+            return self
+        other = Histogram.from_dict(other.to_dict())
+        lo = min(self._bounds()[0], other._bounds()[0])
+        hi = max(self._bounds()[1], other._bounds()[1])
+        exponent = self._fit(lo, hi, max(self.exponent, other.exponent))
+        self._coarsen(exponent)
+        other._coarsen(exponent)
+        for key, count in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + count
+        return self
+
+    def bins(self) -> list[list[float]]:
+        """``[[lower, upper, count], ...]`` for the non-empty bins, in order."""
+        if not self.counts:
+            return []
+        width = 2.0 ** self.exponent
+        return [[key * width, (key + 1) * width, count] for key, count in sorted(self.counts.items())]
+
+    def to_dict(self) -> dict[str, Any]:
+        return {'max_bins': self.max_bins, 'exponent': self.exponent, 'counts': list(self.counts.items())}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Histogram':
+        histogram = cls(data['max_bins'])
+        histogram.exponent = data['exponent']
+        histogram.counts = {int(key): int(count) for key, count in data['counts']}
+        return histogram
+
+
+def _is_numeric(series: pd.Series) -> bool:
+    return pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+
+
+class ColumnState:
+    """Mergeable statistics for one column."""
+
+    def __init__(self, numeric: bool):
+        self.numeric = numeric
+        self.count = 0
+        self.nulls = 0
+        self.distinct = HyperLogLog()
+        self.min = math.inf
+        self.max = -math.inf
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.histogram = Histogram() if numeric else None
+        self.top_k = None if numeric else SpaceSaving()
+
+    def _combine_moments(self, count: int, mean: float, m2: float):
+        total = self.count + count
+        if total == 0:
+            return
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+
+    def _demote(self):
+        # A column that turned out not to be numeric (e.g. later CSV chunks) keeps only its counts
+        self.numeric = False
+        self.min, self.max, self.mean, self.m2 = math.inf, -math.inf, 0.0, 0.0
+        self.histogram = None
+        self.top_k = SpaceSaving()
+
+    def update(self, series: pd.Series) -> 'ColumnState':
+        if self.numeric and not _is_numeric(series):
+            self._demote()
+        nulls = int(series.isna().sum())
+        self.nulls += nulls
+        self.distinct.update(series)
+        if self.numeric:
+            values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+            values = values[~np.isnan(values)]
+            if values.size:
+                mean = float(values.mean())
+                self._combine_moments(values.size, mean, float(np.square(values - mean).sum()))
+                self.min = min(self.min, float(values.min()))
+                self.max = max(self.max, float(values.max()))
+                self.histogram.update(values)
+        else:
+            self.top_k.update(series)
+        self.count += len(series) - nulls
+        return self
+
+    def merge(self, other: 'ColumnState') -> 'ColumnState':
+        if self.numeric and not other.numeric:
+            self._demote()
+        self.distinct.merge(other.distinct)
+        if self.numeric:
+            self._combine_moments(other.count, other.mean, other.m2)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            self.histogram.merge(other.histogram)
+        elif other.top_k is not None:
+            self.top_k.merge(other.top_k)
+        self.count += other.count
+        self.nulls += other.nulls
+        return self
+
+    def summary(self) -> dict[str, Any]:
+        summary = {'count': self.count, 'nulls': self.nulls, 'distinct': self.distinct.count()}
+        if self.numeric and self.count:
+            summary.update({
+                'mean': self.mean,
+                'std': math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else None,
+                'min': self.min,
+                'max': self.max,
+                'histogram': self.histogram.bins()
+            })
+        elif self.top_k is not None:
+            summary['top_values'] = {str(value): count for value, count, _ in self.top_k.top(STATE_TOP_VALUES)}
+        return summary
+
+    def to_dict(self) -> dict[str, Any]:
+        data = {
+            'numeric': self.numeric, 'count': self.count, 'nulls': self.nulls,
+            'distinct': {'p': self.distinct.p, 'registers': self.distinct.registers.tobytes()},
+        }
+        if self.numeric:
+            data.update(min=self.min, max=self.max, mean=self.mean, m2=self.m2, histogram=self.histogram.to_dict())
+        else:
+            data['top_k'] = {
+                'capacity': self.top_k.capacity, 'floor': self.top_k.floor, 'n': self.top_k.n,
+                'counters': [[value, count, error] for value, (count, error) in self.top_k.counters.items()],
+            }
+        return data
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'ColumnState':
+        state = cls(data['numeric'])
+        state.count, state.nulls = data['count'], data['nulls']
+        state.distinct = HyperLogLog(data['distinct']['p'])
+        state.distinct.registers = np.frombuffer(data['distinct']['registers'], dtype=np.uint8).copy()
+        if state.numeric:
+            state.min, state.max, state.mean, state.m2 = data['min'], data['max'], data['mean'], data['m2']
+            state.histogram = Histogram.from_dict(data['histogram'])
+        else:
+            top_k = data['top_k']
+            state.top_k = SpaceSaving(top_k['capacity'])
+            state.top_k.floor, state.top_k.n = top_k['floor'], top_k['n']
+            state.top_k.counters = {value: (count, error) for value, count, error in top_k['counters']}
+        return state
+
+
+class ProfileState:
+    """Mergeable per-column statistics for a whole dataset."""
+
+    def __init__(self):
+        self.rows = 0
+        self.columns: dict[Any, ColumnState] = {}
+
+    def update(self, chunk: pd.DataFrame) -> 'ProfileState':
+        for col in chunk.columns:
+            if col not in self.columns:
+                self.columns[col] = ColumnState(_is_numeric(chunk[col]))
+            self.columns[col].update(chunk[col])
+        self.rows += len(chunk)
+        return self
+
+    def merge(self, other: 'ProfileState') -> 'ProfileState':
+        for col, state in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(state)
+            else:
+                self.columns[col] = ColumnState.from_dict(state.to_dict())
+        self.rows += other.rows
+        return self
+
+    def summary(self) -> dict[str, Any]:
+        """JSON-ready statistics: ``{'rows', 'columns': {name: {...}}}``."""
+        return {'rows': self.rows, 'columns': {str(col): state.summary() for col, state in self.columns.items()}}
+
+    def to_bytes(self) -> bytes:
+        payload = {
+            'version': STATE_VERSION,
+            'rows': self.rows,
+            'columns': [[col, state.to_dict()] for col, state in self.columns.items()],
+        }
+        # Top values of mixed-type object columns may hold dates etc.; store those as text
+        return msgpack.packb(payload, default=str)
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'ProfileState':
+        payload = msgpack.unpackb(data, strict_map_key=False)
+        if payload.get('version') != STATE_VERSION:
+            raise ValueError(f"Unsupported profile state version {payload.get('version')}")
+        state = cls()
+        state.rows = payload['rows']
+        state.columns = {col: ColumnState.from_dict(column) for col, column in payload['columns']}
+        return state
+
+
+def save_state(store: DatasetStore, dataset_id: str, state: ProfileState):
+    store.write_sidecar(dataset_id, STATE_SIDECAR, state.to_bytes())
+
+
+def load_state(store: DatasetStore, dataset_id: str) -> Optional[ProfileState]:
+    """The persisted state of a stored dataset, or None if it has none (or an outdated one)."""
+    data = store.read_sidecar(dataset_id, STATE_SIDECAR)
+    if data is None:
+        return None
+    try:
+        return ProfileState.from_bytes(data)
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+def state_for(store: DatasetStore, dataset_id: str) -> ProfileState:
+    """Load a dataset's state, building (one pass over its batches) and saving it if missing."""
+    state = load_state(store, dataset_id)
+    if state is None:
+        state = ProfileState()
+        for batch in store.iter_batches(dataset_id):
+            state.update(batch)
+        save_state(store, dataset_id, state)
+    return state
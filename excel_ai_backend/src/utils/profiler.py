@@ -0,0 +1,150 @@
+"""Vectorized numeric column profiler.
+
+Numeric columns are copied once into a column-major float64 block and every
+statistic ``generate_insights`` reports is computed for all columns of the
+block at once: counts and moments from one masked pass, min/max/median/
+quartiles from one column-wise sort, IQR outliers from one comparison.
+
+Moments follow pandas' nanops formulas (sample std, bias-corrected skew and
+excess kurtosis), so results match the per-column Series methods up to
+floating-point summation order. With ``approx=True`` the sort is skipped and
+median/quartiles come from KLL sketches (see sketches.py) instead.
+"""
+
+import os
+from typing import Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.utils.sketches import KLLSketch
+
+# Columns profiled per block; bounds the float64 copies to rows * block * 8 bytes each
+PROFILE_BLOCK_COLUMNS = int(os.getenv('PROFILE_BLOCK_COLUMNS', 16))
+# Same threshold pandas uses to treat tiny moment sums as zero
+_FPERR = 1e-14
+
+
+def _zero_out_fperr(values: np.ndarray) -> np.ndarray:
+    return np.where(np.abs(values) < _FPERR, 0, values)
+
+
+def _float_block(df: pd.DataFrame, columns: Sequence) -> np.ndarray:
+    block = np.empty((len(df), len(columns)), dtype=np.float64, order='F')
+    for i, col in enumerate(columns):
+        block[:, i] = df[col].to_numpy(dtype=np.float64, na_value=np.nan)
+    return block
+
+
+def _sorted_quantile(ordered: np.ndarray, count: np.ndarray, q: float) -> np.ndarray:
+    """numpy's 'linear' quantile, read from columns sorted with NaNs last."""
+    position = q * (count - 1)
+    below = np.floor(position).astype(np.int64)
+    above = np.minimum(below + 1, count - 1)
+    cols = np.arange(ordered.shape[1])
+    a, b = ordered[below, cols], ordered[above, cols]
+    t = position - below
+    diff = b - a
+    # Same lerp numpy uses, which is exact at both ends
+    return np.where(t >= 0.5, b - diff * (1 - t), a + diff * t)
+
+
+def _sketched_order_stats(block: np.ndarray) -> tuple[np.ndarray, ...]:
+    """min, max (exact) and median, q25, q75 (KLL) without sorting the block."""
+    # fmin/fmax skip NaNs (and stay quiet on all-NaN columns)
+    minimum, maximum = np.fmin.reduce(block, axis=0), np.fmax.reduce(block, axis=0)
+    quartiles = np.array([KLLSketch().update(block[:, i]).quantiles([0.5, 0.25, 0.75]) for i in range(block.shape[1])])
+    median, q25, q75 = quartiles.T if len(quartiles) else (np.empty(0),) * 3
+    return minimum, maximum, median, q25, q75
+
+
+def _profile_block(block: np.ndarray, approx: bool = False) -> dict[str, np.ndarray]:
+    mask = np.isnan(block)
+    count = block.shape[0] - mask.sum(axis=0)
+    safe = np.maximum(count, 1)
+
+    # One scratch array, updated in place: zero-filled values, then deviations from the mean
+    adjusted = np.where(mask, 0.0, block)
+    mean = adjusted.sum(axis=0) / safe
+    adjusted -= mean
+    np.copyto(adjusted, 0.0, where=mask)
+    adjusted2 = np.multiply(adjusted, adjusted, order='F')
+    m2 = adjusted2.sum(axis=0)
+    # einsum reduces the products without materializing the cubes/fourth powers
+    m3 = np.einsum('ij,ij->j', adjusted2, adjusted)
+    m4 = np.einsum('ij,ij->j', adjusted2, adjusted2)
+    del adjusted, adjusted2
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        std = np.sqrt(m2 / (count - 1))
+        z2, z3 = _zero_out_fperr(m2), _zero_out_fperr(m3)
+        skew = (count * (count - 1) ** 0.5 / (count - 2)) * (z3 / z2 ** 1.5)
+        skew = np.where(z2 == 0, 0, skew)
+        numerator = _zero_out_fperr(count * (count + 1) * (count - 1) * m4)
+        denominator = _zero_out_fperr((count - 2) * (count - 3) * m2 ** 2)
+        kurt = numerator / denominator - 3 * (count - 1) ** 2 / ((count - 2) * (count - 3))
+        kurt = np.where(denominator == 0, 0, kurt)
+
+    if approx:
+        minimum, maximum, median, q25, q75 = _sketched_order_stats(block)
+    else:
+        ordered = np.sort(block, axis=0)  # NaNs sort last
+        cols = np.arange(block.shape[1])
+        last = np.maximum(count - 1, 0)
+        mid = last // 2
+        median = np.where(count % 2 == 1, ordered[mid, cols], (ordered[mid, cols] + ordered[np.minimum(mid + 1, last), cols]) / 2)
+        q25 = _sorted_quantile(ordered, safe, 0.25)
+        q75 = _sorted_quantile(ordered, safe, 0.75)
+        minimum, maximum = ordered[0, cols], ordered[last, cols]
+        del ordered
+
+    iqr = q75 - q25
+    outside = (block < q25 - 1.5 * iqr) | (block > q75 + 1.5 * iqr)
+    outliers = np.where(iqr > 0, np.count_nonzero(outside, axis=0), 0)
+
+    return {
+        'count': count, 'mean': mean, 'median': median, 'std': std, 'min': minimum, 'max': maximum,
+        'q25': q25, 'q75': q75, 'missing_count': mask.sum(axis=0), 'skewness': skew, 'kurtosis': kurt,
+        'outliers': outliers,
+    }
+
+
+def profile_numeric(df: pd.DataFrame, columns: Optional[Sequence] = None,
+                    block_columns: int = PROFILE_BLOCK_COLUMNS, approx: bool = False) -> tuple[dict, dict]:
+    """Profile numeric columns; returns ``(summary_stats, outlier_counts)``.
+
+    ``summary_stats`` maps each column with at least one value to count, mean,
+    median, std, min, max, q25, q75, missing_count, skewness and kurtosis.
+    ``outlier_counts`` is the number of values outside 1.5 IQR (0 when IQR is 0).
+    ``approx`` estimates median and quartiles (and so the IQR bounds) with sketches.
+    """
+    if columns is None:
+        columns = df.select_dtypes(include=[np.number]).columns
+    columns = list(columns)
+    summary_stats, outlier_counts = {}, {}
+    for start in range(0, len(columns), max(block_columns, 1)):
+        chunk = columns[start:start + block_columns]
+        stats = _profile_block(_float_block(df, chunk), approx)
+        for i, col in enumerate(chunk):
+            count = int(stats['count'][i])
+            if count == 0:
+                continue
+            # pandas reports float32 columns' moments in float32; round the same way
+            dtype = df[col].dtype
+            narrow = dtype.type if isinstance(dtype, np.dtype) and dtype.kind == 'f' and dtype.itemsize < 8 else float
+            summary_stats[col] = {
+                'count': count,
+                'mean': float(narrow(stats['mean'][i])),
+                'median': float(narrow(stats['median'][i])),
+                'std': float(narrow(stats['std'][i])),
+                'min': float(stats['min'][i]),
+                'max': float(stats['max'][i]),
+                'q25': float(stats['q25'][i]),
+                'q75': float(stats['q75'][i]),
+                'missing_count': int(stats['missing_count'][i]),
+                # 0 rather than NaN when there are too few values, as generate_insights always reported
+                'skewness': float(narrow(stats['skewness'][i])) if count > 2 else 0,
+                'kurtosis': float(narrow(stats['kurtosis'][i])) if count > 3 else 0
+            }
+            outlier_counts[col] = int(stats['outliers'][i])
+    return summary_stats, outlier_counts
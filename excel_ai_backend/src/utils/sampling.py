@@ -0,0 +1,216 @@
+"""Sampled profiling for large datasets (``sample=true``).
+
+Datasets above ``SAMPLE_THRESHOLD_ROWS`` can be profiled from a seeded sample of
+``SAMPLE_ROWS`` rows instead of a full scan:
+
+``reservoir``   one pass over the stored Parquet batches (or the in-memory
+                frame) keeping the rows with the smallest random keys - a
+                uniform sample, without loading the whole dataset.
+``stratified``  ``stratify_by=<column>``: proportional allocation per value of
+                that column, so every group keeps its true share.
+
+:func:`sample_estimates` scales the sample's statistics to the full dataset
+with confidence intervals: normal intervals with a finite population correction
+for shares and means, distribution-free order-statistic intervals for quantiles.
+"""
+
+import math
+import os
+from statistics import NormalDist
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+from src.utils.dataset_store import dataset_store, frame_from_payload
+
+SAMPLE_THRESHOLD_ROWS = int(os.getenv('SAMPLE_THRESHOLD_ROWS', 1000000))
+SAMPLE_ROWS = int(os.getenv('SAMPLE_ROWS', 100000))
+SAMPLE_SEED = int(os.getenv('SAMPLE_SEED', 0))
+SAMPLE_CONFIDENCE = 0.95
+# Rows per Parquet batch read while sampling a stored dataset
+SAMPLE_BATCH_ROWS = 65536
+# Most common values per text column reported with intervals
+SAMPLE_TOP_VALUES = 5
+
+
+class SamplingError(ValueError):
+    """Raised for sampling options that cannot be applied (e.g. unknown stratify_by column)."""
+
+
+def _frame_chunks(df: pd.DataFrame, rows: int = SAMPLE_BATCH_ROWS) -> Iterable[pd.DataFrame]:
+    return (df.iloc[start:start + rows] for start in range(0, len(df), rows))
+
+
+def reservoir_sample(chunks: Iterable[pd.DataFrame], size: int, seed: int = SAMPLE_SEED) -> tuple[pd.DataFrame, int]:
+    """Uniform sample of ``size`` rows from a stream of chunks; returns ``(sample, rows_seen)``.
+
+    Every row draws a seeded random key and the ``size`` smallest keys are kept,
+    so the sample depends only on the seed and the row order. Rows stay in their
+    original order.
+    """
+    rng = np.random.default_rng(seed)
+    kept, keys, seen = [], np.empty(0), 0
+    for chunk in chunks:
+        chunk_keys = rng.random(len(chunk))
+        chunk = chunk.set_axis(pd.RangeIndex(seen, seen + len(chunk)))
+        seen += len(chunk)
+        if len(keys) >= size:
+            # Once the reservoir is full only rows beating its largest key can enter
+            entering = chunk_keys < keys.max()
+            chunk, chunk_keys = chunk[entering], chunk_keys[entering]
+        kept.append(chunk)
+        keys = np.concatenate([keys, chunk_keys])
+        if len(keys) > size:
+            keep = np.sort(np.argpartition(keys, size - 1)[:size])
+            kept, keys = [pd.concat(kept).iloc[keep]], keys[keep]
+    sample = pd.concat(kept) if kept else pd.DataFrame()
+    return sample, seen
+
+
+def stratified_positions(strata: pd.Series, size: int, seed: int = SAMPLE_SEED) -> np.ndarray:
+    """Sorted row positions of a proportionally allocated stratified sample.
+
+    Missing values form their own stratum. Allocation uses largest remainders,
+    so the sample has exactly ``min(size, len(strata))`` rows.
+    """
+    codes, _ = pd.factorize(strata, use_na_sentinel=False)
+    sizes = np.bincount(codes)
+    quota = sizes / len(codes) * min(size, len(codes))
+    allocation = np.floor(quota).astype(np.int64)
+    remainder = int(round(quota.sum())) - int(allocation.sum())
+    allocation[np.argsort(allocation - quota, kind='stable')[:remainder]] += 1
+
+    # Random order within each stratum; the first allocation[h] rows of stratum h are taken
+    rng = np.random.default_rng(seed)
+    order = np.lexsort((rng.random(len(codes)), codes))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    rank = np.arange(len(order)) - starts[codes[order]]
+    return np.sort(order[rank < allocation[codes[order]]])
+
+
+def take_rows(chunks: Iterable[pd.DataFrame], positions: np.ndarray) -> pd.DataFrame:
+    """Rows at sorted ``positions`` from a stream of chunks, in one pass."""
+    parts, start = [], 0
+    for chunk in chunks:
+        end = start + len(chunk)
+        lo, hi = np.searchsorted(positions, [start, end])
+        if hi > lo:
+            parts.append(chunk.iloc[positions[lo:hi] - start])
+        start = end
+    return pd.concat(parts) if parts else pd.DataFrame()
+
+
+def sample_from_payload(payload: Optional[dict], key: str = 'data') -> tuple[Optional[pd.DataFrame], Optional[dict]]:
+    """Resolve the request's DataFrame like ``frame_from_payload``, sampling large ones on request.
+
+    With ``sample=true`` in the payload, datasets above ``SAMPLE_THRESHOLD_ROWS``
+    are replaced by a seeded sample (``seed``, optional ``stratify_by``). Returns
+    ``(frame, sampling)`` where ``sampling`` describes the sample, or is None
+    when the frame is the full dataset.
+    """
+    if not payload or str(payload.get('sample', '')).lower() not in ('1', 'true', 'yes'):
+        return frame_from_payload(payload, key), None
+    try:
+        seed = int(payload.get('seed', SAMPLE_SEED))
+    except (TypeError, ValueError):
+        raise SamplingError('seed must be an integer')
+    stratify_by = payload.get('stratify_by')
+
+    dataset_id = payload.get('dataset_id')
+    if dataset_id:
+        meta = dataset_store.meta(dataset_id)
+        rows = meta['rows']
+        if rows <= SAMPLE_THRESHOLD_ROWS:
+            return dataset_store.get(dataset_id), None
+        if stratify_by and stratify_by not in meta['columns']:
+            raise SamplingError(f"Unknown stratify_by column '{stratify_by}'")
+        batches = dataset_store.iter_batches(dataset_id, SAMPLE_BATCH_ROWS)
+        if stratify_by:
+            strata = dataset_store.get(dataset_id, columns=[stratify_by])[stratify_by]
+            sample = take_rows(batches, stratified_positions(strata, SAMPLE_ROWS, seed))
+        else:
+            sample, rows = reservoir_sample(batches, SAMPLE_ROWS, seed)
+    else:
+        df = frame_from_payload(payload, key)
+        if df is None or len(df) <= SAMPLE_THRESHOLD_ROWS:
+            return df, None
+        rows = len(df)
+        if stratify_by and stratify_by not in df.columns:
+            raise SamplingError(f"Unknown stratify_by column '{stratify_by}'")
+        if stratify_by:
+            sample = df.iloc[stratified_positions(df[stratify_by], SAMPLE_ROWS, seed)]
+        else:
+            sample, _ = reservoir_sample(_frame_chunks(df), SAMPLE_ROWS, seed)
+
+    sampling = {
+        'method': 'stratified' if stratify_by else 'reservoir',
+        'stratify_by': stratify_by or None,
+        'seed': seed,
+        'sample_rows': len(sample),
+        'population_rows': rows,
+        'confidence': SAMPLE_CONFIDENCE,
+    }
+    return sample.reset_index(drop=True), sampling
+
+
+def _interval(low: float, high: float) -> list:
+    return [None if math.isnan(v) else v for v in (low, high)]
+
+
+def sample_estimates(sample: pd.DataFrame, profile, sampling: dict) -> dict[str, Any]:
+    """Full-dataset estimates with confidence intervals from a sample and its profile.
+
+    ``missing`` and ``most_common`` are row counts scaled to the full dataset;
+    ``mean`` and ``quantiles`` are per numeric column. Duplicate rows and
+    distinct counts do not scale from a sample and are left as sample values.
+    """
+    n, population = sampling['sample_rows'], sampling['population_rows']
+    z = NormalDist().inv_cdf((1 + sampling['confidence']) / 2)
+    fpc = math.sqrt((population - n) / (population - 1)) if population > 1 else 0.0
+
+    def scaled(count: int) -> dict[str, Any]:
+        # Wilson score interval on the FPC-adjusted sample size: unlike the Wald
+        # interval it keeps a width when none (or all) of the sampled rows match
+        share = count / n if n else 0.0
+        if n and fpc:
+            effective = n / fpc ** 2
+            spread = z * z / effective
+            center = (share + spread / 2) / (1 + spread)
+            half = z * math.sqrt(share * (1 - share) / effective + spread / effective / 4) / (1 + spread)
+        else:
+            center, half = share, 0.0
+        return {
+            'estimate': int(round(share * population)),
+            'interval': [int(math.floor(max(center - half, 0) * population)),
+                         int(math.ceil(min(center + half, 1) * population))]
+        }
+
+    estimates = {'missing': {}, 'mean': {}, 'quantiles': {}, 'most_common': {}}
+    for col in profile.columns:
+        estimates['missing'][col] = scaled(profile.missing[col])
+
+    for col, stats in profile.summary_stats.items():
+        count = stats['count']
+        half = z * stats['std'] / math.sqrt(count) * fpc if count > 1 else math.nan
+        estimates['mean'][col] = {
+            'estimate': stats['mean'],
+            'interval': _interval(stats['mean'] - half, stats['mean'] + half)
+        }
+        # Ranks count*q +- z*sqrt(count*q*(1-q)) bound the population quantile
+        ordered = np.sort(sample[col].dropna().to_numpy(dtype=np.float64))
+        estimates['quantiles'][col] = {}
+        for name, q in (('q25', 0.25), ('median', 0.5), ('q75', 0.75)):
+            half_rank = z * math.sqrt(count * q * (1 - q)) * fpc
+            low = min(max(int(math.floor(count * q - half_rank)), 0), count - 1)
+            high = min(max(int(math.ceil(count * q + half_rank)), 0), count - 1)
+            estimates['quantiles'][col][name] = {
+                'estimate': stats[name],
+                'interval': [float(ordered[low]), float(ordered[high])]
+            }
+
+    for col in profile.categorical_columns:
+        top = list(profile.top_values[col].items())[:SAMPLE_TOP_VALUES]
+        estimates['most_common'][col] = {str(value): scaled(count) for value, count in top}
+
+    return estimates
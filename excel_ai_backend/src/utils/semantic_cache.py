@@ -0,0 +1,221 @@
+"""Second response-cache tier keyed on normalized question text.
+
+``cache_key`` hashes the exact payload, so "total sales by region" and
+"Total Sales by Region?" miss each other. For the tasks in
+``SEMANTIC_CACHE_TASKS`` the question is also normalized (case, punctuation
+and whitespace folded, stopwords dropped) and stored with a MinHash
+signature of its words and character trigrams, under a scope key covering
+everything else the answer depends on (column set, platform, model chain).
+
+``get_cached`` checks the exact tier first. On a miss it compares the
+question's signature with the cached questions of the same scope: an
+identical normalized text, or an estimated Jaccard similarity of at least
+``SEMANTIC_CACHE_THRESHOLD``, is a hit. Questions whose numbers differ
+("sales in 2023" / "sales in 2024"), comparison or negation words, quoted
+values or the scope's columns they mention ("product category" / "product
+subcategory") never match. Everything runs locally; there is no embedding
+service. Per-task hit rates are reported by
+``cache_stats`` (``semantic_cache`` in the telemetry health check).
+"""
+
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.utils.cache import cache, cache_key
+
+# Lowest estimated Jaccard similarity of two questions that may share an answer
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv('SEMANTIC_CACHE_THRESHOLD', 0.8))
+# Tasks whose answers may be reused for similar questions (comma-separated; empty disables the tier)
+SEMANTIC_CACHE_TASKS = frozenset(
+    task.strip() for task in os.getenv('SEMANTIC_CACHE_TASKS', 'chat_query,formula_generate').split(',') if task.strip()
+)
+# Cached questions kept per scope, oldest dropped first
+SEMANTIC_CACHE_SCOPE_ENTRIES = int(os.getenv('SEMANTIC_CACHE_SCOPE_ENTRIES', 256))
+SEMANTIC_CACHE_MAX_SCOPES = int(os.getenv('SEMANTIC_CACHE_MAX_SCOPES', 1024))
+MINHASH_PERMUTATIONS = 64
+
+# Function words that do not change what is being asked. Negations and
+# comparison words ("not", "more", "than", ...) are kept on purpose.
+STOPWORDS = frozenset("""
+a an the this that these those of in on at by for to from with within into per
+is are was were be been being do does did can could would should will shall may might
+please show me tell give get find list what which how i we you my our your it its
+and as each all
+""".split())
+
+# Words that flip an answer while barely changing the text; questions must agree on them exactly
+GUARD_WORDS = frozenset("""
+not no without except exclude excluding more less greater fewer above below over under
+min minimum max maximum top bottom highest lowest first last before after between
+""".split())
+
+_WORD = re.compile(r'[^\W_]+')
+_NUMBER = re.compile(r'\d+')
+_QUOTED = re.compile(r'"([^"]*)"|\'([^\']*)\'')
+
+_rng = np.random.default_rng(0)
+# h(t) = (t ^ b) * a with odd a is a bijection on uint64: one cheap permutation per signature slot
+_A = _rng.integers(1, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+_B = _rng.integers(0, 2 ** 63, MINHASH_PERMUTATIONS, dtype=np.uint64)
+
+
+def normalize_text(text: str) -> str:
+    """Lower-cased words of ``text`` without punctuation or stopwords, single-spaced."""
+    words = _WORD.findall(str(text).casefold())
+    kept = [word for word in words if word not in STOPWORDS]
+    return ' '.join(kept or words)
+
+
+def mentioned_columns(text: str, columns: Sequence[str]) -> tuple:
+    """Columns whose name appears in ``text`` as whole words ("Product_Category" matches "product category")."""
+    padded = f" {' '.join(_WORD.findall(str(text).casefold()))} "
+    mentioned = []
+    for column in columns:
+        words = _WORD.findall(str(column).casefold())
+        if words and f" {' '.join(words)} " in padded:
+            mentioned.append(str(column))
+    return tuple(sorted(mentioned))
+
+
+def guard_terms(text: str, normalized: str, columns: Sequence[str] = ()) -> tuple:
+    """Numbers, guard words, quoted values and mentioned columns that must be identical for two questions to match."""
+    quoted = tuple(''.join(match).casefold().strip() for match in _QUOTED.findall(str(text)))
+    words = normalized.split()
+    return (tuple(_NUMBER.findall(normalized)), tuple(word for word in words if word in GUARD_WORDS), quoted,
+            mentioned_columns(text, columns))
+
+
+def cache_scope(task: str, payload: dict, model_chain: list[str], columns: Sequence[str] = ()) -> tuple:
+    """``(key, columns)`` scope of a semantic entry.
+
+    ``key`` is a ``cache_key`` over everything the answer depends on besides
+    the question; questions mentioning different ``columns`` never match.
+    """
+    return cache_key(task, payload, model_chain), tuple(str(column) for column in columns)
+
+
+def _shingles(normalized: str) -> list[str]:
+    """Words plus padded character trigrams of each word (tolerates typos and plural forms)."""
+    shingles = []
+    for word in normalized.split():
+        shingles.append(word)
+        padded = f'#{word}#'
+        shingles.extend(padded[i:i + 3] for i in range(len(padded) - 2))
+    return shingles
+
+
+def signature(normalized: str) -> np.ndarray:
+    """MinHash signature (``MINHASH_PERMUTATIONS`` uint64 minima) of a normalized text."""
+    shingles = _shingles(normalized) or ['']
+    hashes = pd.util.hash_array(np.array(shingles, dtype=object))
+    return ((hashes[:, None] ^ _B) * _A).min(axis=0)
+
+
+class SemanticCache:
+    """Normalized-text entries grouped by scope, with per-task lookup counters."""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD, tasks=SEMANTIC_CACHE_TASKS,
+                 scope_entries: int = SEMANTIC_CACHE_SCOPE_ENTRIES, max_scopes: int = SEMANTIC_CACHE_MAX_SCOPES):
+        self.threshold = threshold
+        self.tasks = frozenset(tasks)
+        self.scope_entries = scope_entries
+        self.max_scopes = max_scopes
+        # scope -> OrderedDict(normalized text -> (signature, guard terms, value, expires_at))
+        self._scopes: OrderedDict[str, OrderedDict] = OrderedDict()
+        self._stats: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def enabled(self, task: str) -> bool:
+        return task in self.tasks
+
+    def count(self, task: str, outcome: str):
+        with self._lock:
+            stats = self._stats.setdefault(task, {'lookups': 0, 'exact_hits': 0, 'semantic_hits': 0, 'misses': 0})
+            stats['lookups'] += 1
+            stats[outcome] += 1
+
+    def get(self, text: str, scope: tuple) -> Optional[Any]:
+        """Cached value of the closest question in ``scope`` (see ``cache_scope``), if similar enough."""
+        scope_key, columns = scope
+        normalized = normalize_text(text)
+        guards = guard_terms(text, normalized, columns)
+        now = time.time()
+        with self._lock:
+            entries = self._scopes.get(scope_key)
+            if not entries:
+                return None
+            self._scopes.move_to_end(scope_key)
+            for key in [key for key, entry in entries.items() if entry[3] < now]:
+                del entries[key]
+            if normalized in entries and entries[normalized][1] == guards:
+                return entries[normalized][2]
+            candidates = [entry for entry in entries.values() if entry[1] == guards]
+        if not candidates:
+            return None
+        # Fraction of equal minima estimates the Jaccard similarity of the shingle sets
+        similarity = (np.stack([entry[0] for entry in candidates]) == signature(normalized)).mean(axis=1)
+        best = int(similarity.argmax())
+        return candidates[best][2] if similarity[best] >= self.threshold else None
+
+    def set(self, text: str, scope: tuple, value: Any, ttl_seconds: int = 86400):
+        scope_key, columns = scope
+        normalized = normalize_text(text)
+        entry = (signature(normalized), guard_terms(text, normalized, columns), value, time.time() + ttl_seconds)
+        with self._lock:
+            entries = self._scopes.setdefault(scope_key, OrderedDict())
+            self._scopes.move_to_end(scope_key)
+            entries[normalized] = entry
+            entries.move_to_end(normalized)
+            while len(entries) > self.scope_entries:
+                entries.popitem(last=False)
+            while len(self._scopes) > self.max_scopes:
+                self._scopes.popitem(last=False)
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            tasks = {}
+            for task, counts in self._stats.items():
+                hits = counts['exact_hits'] + counts['semantic_hits']
+                tasks[task] = dict(counts, hit_rate=round(hits / counts['lookups'], 4) if counts['lookups'] else 0.0)
+            return {
+                'enabled_tasks': sorted(self.tasks),
+                'threshold': self.threshold,
+                'scopes': len(self._scopes),
+                'entries': sum(len(entries) for entries in self._scopes.values()),
+                'tasks': tasks
+            }
+
+
+semantic_cache = SemanticCache()
+
+
+def get_cached(task: str, key: str, text: str, scope: tuple) -> Optional[Any]:
+    """Exact-key hit, else (for enabled tasks) a similar question's answer in the same scope."""
+    value = cache.get(key)
+    if value is not None:
+        semantic_cache.count(task, 'exact_hits')
+        return value
+    if semantic_cache.enabled(task):
+        value = semantic_cache.get(text, scope)
+        if value is not None:
+            semantic_cache.count(task, 'semantic_hits')
+            return value
+    semantic_cache.count(task, 'misses')
+    return None
+
+
+def set_cached(task: str, key: str, text: str, scope: tuple, value: Any, ttl_seconds: int = 86400):
+    cache.set(key, value, ttl_seconds)
+    if semantic_cache.enabled(task):
+        semantic_cache.set(text, scope, value, ttl_seconds)
+
+
+def cache_stats() -> dict[str, Any]:
+    return semantic_cache.stats()
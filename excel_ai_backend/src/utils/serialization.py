@@ -0,0 +1,96 @@
+"""Content negotiation for row-heavy responses.
+
+JSON (list of row dicts) stays the default. Clients that send
+``Accept: application/vnd.apache.arrow.stream`` get an Arrow IPC stream of the
+frame, with the rest of the response as JSON in the schema metadata. Clients
+that send ``Accept: application/x-msgpack`` get the whole response as
+MessagePack, with the frame encoded column-wise.
+"""
+
+import json
+from typing import Any, Sequence
+
+import msgpack
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+from flask import Response, jsonify, request
+
+from src.utils.dataset_store import _prepare_for_parquet
+
+JSON_MIMETYPE = 'application/json'
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+MSGPACK_MIMETYPE = 'application/x-msgpack'
+
+_FORMATS = {
+    JSON_MIMETYPE: 'json',
+    ARROW_STREAM_MIMETYPE: 'arrow',
+    MSGPACK_MIMETYPE: 'msgpack',
+    'application/msgpack': 'msgpack',
+}
+
+
+def negotiate_format() -> str:
+    """Return 'json', 'arrow' or 'msgpack' for the current request's Accept header."""
+    # JSON is listed first so it wins for */* and missing Accept headers
+    best = request.accept_mimetypes.best_match(list(_FORMATS), default=JSON_MIMETYPE)
+    return _FORMATS.get(best, 'json')
+
+
+def _set_path(payload: dict, path: Sequence[str], value: Any) -> dict:
+    """Copy ``payload`` with the value at ``path`` replaced (nested dicts are copied)."""
+    out = dict(payload)
+    if len(path) == 1:
+        out[path[0]] = value
+    else:
+        out[path[0]] = _set_path(out.get(path[0]) or {}, path[1:], value)
+    return out
+
+
+def _column_values(series: pd.Series) -> list:
+    if pd.api.types.is_datetime64_any_dtype(series):
+        values = series.dt.strftime('%Y-%m-%dT%H:%M:%S').astype(object)
+        return values.where(series.notna(), None).tolist()
+    if series.isna().any():
+        return series.astype(object).where(series.notna(), None).tolist()
+    return series.tolist()
+
+
+def frame_to_columns(df: pd.DataFrame) -> dict[str, Any]:
+    """Column-oriented form of a frame: ``{'columns': [...], 'values': [[col0], [col1], ...]}``."""
+    return {
+        'columns': [str(c) for c in df.columns],
+        'values': [_column_values(df.iloc[:, i]) for i in range(df.shape[1])],
+    }
+
+
+def _msgpack_default(value: Any) -> Any:
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+
+def frame_response(payload: dict, path: Sequence[str], df: pd.DataFrame):
+    """Build the response for ``payload`` with ``df`` placed at ``path``.
+
+    ``path`` is the key path of the row data, e.g. ``('data', 'cleaned_data')``.
+    """
+    fmt = negotiate_format()
+    if fmt == 'arrow':
+        table = pa.Table.from_pandas(_prepare_for_parquet(df), preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[b'x-response'] = json.dumps(_set_path(payload, path, None), default=str).encode('utf-8')
+        metadata[b'x-frame-path'] = '.'.join(path).encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        response = Response(sink.getvalue().to_pybytes(), mimetype=ARROW_STREAM_MIMETYPE)
+    elif fmt == 'msgpack':
+        body = msgpack.packb(_set_path(payload, path, frame_to_columns(df)), default=_msgpack_default)
+        response = Response(body, mimetype=MSGPACK_MIMETYPE)
+    else:
+        response = jsonify(_set_path(payload, path, df.to_dict('records')))
+    response.vary.add('Accept')
+    return response
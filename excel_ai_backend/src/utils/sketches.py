@@ -0,0 +1,263 @@
+"""Mergeable sketches for approximate profiling (``approx=true``).
+
+``KLLSketch``    quantiles/median in O(k log n) memory; rank error ~1.3% at k=200.
+``HyperLogLog``  distinct counts in 2**p bytes; relative std error 1.04/sqrt(2**p).
+``SpaceSaving``  top-k values with per-value overcount bounds.
+
+Every sketch has ``update`` (one vectorized call per chunk) and ``merge``, so
+the same code profiles an in-memory frame, a stored dataset read batch by
+batch, or chunks as they are streamed in. ``ColumnSketch`` bundles the three
+for one column.
+"""
+
+import math
+import os
+from typing import Any, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+KLL_K = int(os.getenv('SKETCH_KLL_K', 200))
+HLL_PRECISION = int(os.getenv('SKETCH_HLL_PRECISION', 14))
+TOPK_CAPACITY = int(os.getenv('SKETCH_TOPK_CAPACITY', 64))
+# In-memory frames are fed to the sketches in slices of this many rows
+SKETCH_CHUNK_ROWS = int(os.getenv('SKETCH_CHUNK_ROWS', 100000))
+
+_KLL_MIN_CAPACITY = 8
+_KLL_DECAY = 2 / 3
+
+
+class KLLSketch:
+    """KLL quantile sketch over float values (NaNs are ignored)."""
+
+    def __init__(self, k: int = KLL_K, seed: Optional[int] = 0):
+        self.k = k
+        self.n = 0
+        self.min = math.inf
+        self.max = -math.inf
+        # levels[h] holds items of weight 2**h
+        self.levels: list[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.levels) - level - 1
+        return max(int(math.ceil(self.k * _KLL_DECAY ** depth)), _KLL_MIN_CAPACITY)
+
+    def _compress(self):
+        level = 0
+        while level < len(self.levels):
+            items = self.levels[level]
+            if len(items) <= self._capacity(level):
+                level += 1
+                continue
+            if level + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            if not (items[:-1] <= items[1:]).all():  # promoted runs into an empty level are already sorted
+                items = np.sort(items)
+            # An odd item out stays behind; every other remaining item moves up at double weight
+            keep, items = (items[-1:], items[:-1]) if len(items) % 2 else (items[:0], items)
+            promoted = items[self._rng.integers(2)::2]
+            self.levels[level] = keep
+            self.levels[level + 1] = np.concatenate([self.levels[level + 1], promoted])
+            # Growing the sketch shrinks the lower levels' capacities, so rescan from the bottom
+            level = 0
+
+    def update(self, values) -> 'KLLSketch':
+        values = np.asarray(values, dtype=np.float64).ravel()
+        values = values[~np.isnan(values)]
+        if values.size:
+            self.n += values.size
+            self.min = min(self.min, float(values.min()))
+            self.max = max(self.max, float(values.max()))
+            self.levels[0] = np.concatenate([self.levels[0], values])
+            self._compress()
+        return self
+
+    def merge(self, other: 'KLLSketch') -> 'KLLSketch':
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for level, items in enumerate(other.levels):
+            self.levels[level] = np.concatenate([self.levels[level], items])
+        self.n += other.n
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self._compress()
+        return self
+
+    def quantiles(self, qs) -> np.ndarray:
+        """Approximate quantiles for ``qs`` in [0, 1]; NaN when the sketch is empty."""
+        qs = np.asarray(qs, dtype=np.float64)
+        if self.n == 0:
+            return np.full(qs.shape, np.nan)
+        values = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(items), 2 ** h, dtype=np.int64) for h, items in enumerate(self.levels)])
+        order = np.argsort(values, kind='stable')
+        values, cumulative = values[order], np.cumsum(weights[order])
+        ranks = qs * (cumulative[-1] - 1)
+        result = values[np.minimum(np.searchsorted(cumulative, ranks, side='right'), len(values) - 1)]
+        # The extremes are tracked exactly
+        result = np.where(qs <= 0, self.min, np.where(qs >= 1, self.max, result))
+        return result
+
+    def rank_error(self) -> float:
+        """Normalized rank error at ~99% confidence (0 while nothing has been compacted)."""
+        if len(self.levels) == 1:
+            return 0.0
+        return 2.296 / self.k ** 0.9723
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit pandas value hashes (nulls are ignored)."""
+
+    def __init__(self, p: int = HLL_PRECISION):
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    @staticmethod
+    def _hashes(values: pd.Series) -> np.ndarray:
+        values = values.dropna()
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            # 5 and 5.0 are one distinct value (as in nunique), whichever chunk they came from
+            values = values.astype(np.float64)
+        return pd.util.hash_array(values.to_numpy())
+
+    def update(self, values) -> 'HyperLogLog':
+        hashes = self._hashes(values if isinstance(values, pd.Series) else pd.Series(values))
+        if hashes.size:
+            bits = 64 - self.p
+            index = (hashes >> np.uint64(bits)).astype(np.int64)
+            rest = hashes & np.uint64((1 << bits) - 1)
+            # bits <= 50, so float64 holds the remainder exactly and frexp gives its bit length
+            bit_length = np.frexp(rest.astype(np.float64))[1]
+            rank = (bits - bit_length + 1).astype(np.uint8)
+            np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other: 'HyperLogLog') -> 'HyperLogLog':
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self) -> int:
+        m = len(self.registers)
+        estimate = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def relative_error(self) -> float:
+        """Relative standard error of :meth:`count`."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class SpaceSaving:
+    """Space-Saving top-k counter.
+
+    Each kept value has a ``count`` that never underestimates its true frequency
+    and an ``error`` bounding the overestimate. Values that were dropped occur at
+    most ``floor`` times.
+    """
+
+    def __init__(self, capacity: int = TOPK_CAPACITY):
+        self.capacity = capacity
+        self.counters: dict[Any, tuple[int, int]] = {}
+        self.floor = 0
+        self.n = 0
+
+    def _absorb(self, counters: dict, floor: int, n: int):
+        merged = {}
+        # Existing values first, then new ones in their given order, so ties rank by first appearance
+        for value in [*self.counters, *(v for v in counters if v not in self.counters)]:
+            count_a, error_a = self.counters.get(value, (self.floor, self.floor))
+            count_b, error_b = counters.get(value, (floor, floor))
+            merged[value] = (count_a + count_b, error_a + error_b)
+        ranked = sorted(merged.items(), key=lambda item: item[1][0], reverse=True)
+        dropped = ranked[self.capacity:]
+        self.counters = dict(ranked[:self.capacity])
+        self.floor = max([self.floor + floor] + [count for _, (count, _) in dropped])
+        self.n += n
+
+    def update(self, values) -> 'SpaceSaving':
+        counts = (values if isinstance(values, pd.Series) else pd.Series(values)).value_counts()
+        if counts.empty:
+            return self
+        # Exact counts for this chunk, cut to capacity; the largest cut count bounds the rest
+        floor = int(counts.iloc[self.capacity]) if len(counts) > self.capacity else 0
+        top = counts.head(self.capacity)
+        self._absorb({value: (int(count), 0) for value, count in top.items()}, floor, int(counts.sum()))
+        return self
+
+    def merge(self, other: 'SpaceSaving') -> 'SpaceSaving':
+        self._absorb(other.counters, other.floor, other.n)
+        return self
+
+    def top(self, n: int = 10) -> list[tuple[Any, int, int]]:
+        """``[(value, count, error), ...]`` for the ``n`` most frequent values."""
+        ranked = sorted(self.counters.items(), key=lambda item: item[1][0], reverse=True)
+        return [(value, count, error) for value, (count, error) in ranked[:n]]
+
+
+class ColumnSketch:
+    """Per-column sketches: value/null counts, distinct count, quantiles (numeric) or top-k (other)."""
+
+    def __init__(self, numeric: bool):
+        self.numeric = numeric
+        self.count = 0
+        self.missing = 0
+        self.distinct = HyperLogLog()
+        self.quantiles = KLLSketch() if numeric else None
+        self.top_k = None if numeric else SpaceSaving()
+
+    def update(self, series: pd.Series) -> 'ColumnSketch':
+        missing = int(series.isna().sum())
+        self.missing += missing
+        self.count += len(series) - missing
+        self.distinct.update(series)
+        if self.numeric:
+            self.quantiles.update(series.to_numpy(dtype=np.float64, na_value=np.nan))
+        else:
+            self.top_k.update(series)
+        return self
+
+    def merge(self, other: 'ColumnSketch') -> 'ColumnSketch':
+        self.count += other.count
+        self.missing += other.missing
+        self.distinct.merge(other.distinct)
+        if self.numeric:
+            self.quantiles.merge(other.quantiles)
+        else:
+            self.top_k.merge(other.top_k)
+        return self
+
+
+def sketch_columns(chunks: Iterable[pd.DataFrame], columns: Optional[list] = None) -> dict[Any, ColumnSketch]:
+    """Build one :class:`ColumnSketch` per column from a frame or a stream of chunks.
+
+    A DataFrame is sliced into ``SKETCH_CHUNK_ROWS`` pieces so per-chunk work
+    (hashing, value counts) stays bounded.
+    """
+    if isinstance(chunks, pd.DataFrame):
+        df = chunks
+        chunks = (df.iloc[start:start + SKETCH_CHUNK_ROWS] for start in range(0, len(df), SKETCH_CHUNK_ROWS))
+    sketches: dict[Any, ColumnSketch] = {}
+    for chunk in chunks:
+        for col in (columns if columns is not None else chunk.columns):
+            series = chunk[col]
+            if col not in sketches:
+                numeric = pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series)
+                sketches[col] = ColumnSketch(numeric)
+            sketches[col].update(series)
+    return sketches
+
+
+def error_bounds(sketches: Optional[dict[Any, ColumnSketch]] = None) -> dict[str, Any]:
+    """Error bounds to report alongside approximate results."""
+    bounds = {
+        'quantile_rank_error': round(2.296 / KLL_K ** 0.9723, 5),
+        'distinct_count_relative_error': round(1.04 / math.sqrt(1 << HLL_PRECISION), 5),
+    }
+    if sketches:
+        bounds['top_k_max_count_error'] = {
+            str(col): sketch.top_k.floor for col, sketch in sketches.items() if sketch.top_k is not None
+        }
+    return bounds
@@ -0,0 +1,63 @@
+"""Server-Sent Events responses for the ``?stream=1`` LLM endpoints.
+
+The stream opens with a comment line, so headers and the first byte go out
+immediately. Each answer fragment is a ``token`` event (``{"content": ...}``);
+the stream ends with exactly one ``done`` event carrying the same JSON payload
+the non-streaming endpoint returns, or an ``error`` event.
+"""
+
+import json
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from flask import Response, request, stream_with_context
+
+from src.utils.model_executor import stream_chain
+
+
+def stream_requested() -> bool:
+    return str(request.args.get('stream', '')).lower() in ('1', 'true', 'yes')
+
+
+def sse_event(event: str, data: Any) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+def sse_response(events: Iterator[str]) -> Response:
+    """Stream ``events`` (already formatted) with the request context kept alive for the generator."""
+    return Response(stream_with_context(events), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def stream_llm(messages: list, model_chain: list[str], finish: Callable[[dict, int], dict],
+               max_tokens: int = 800, temperature: float = 0.3,
+               on_error: Optional[Callable[[dict], None]] = None) -> Iterator[str]:
+    """SSE events for one model-chain answer.
+
+    ``finish(result, latency_ms)`` runs once the answer is complete (it saves
+    telemetry, caches, ...) and returns the terminal ``done`` payload. A failed
+    answer, or an exception in ``finish``, ends the stream with an ``error``
+    event instead; ``on_error(result)`` is called for failed answers.
+    """
+    started = time.time()
+    yield ': stream open\n\n'
+    for kind, value in stream_chain(messages, model_chain, max_tokens=max_tokens, temperature=temperature):
+        if kind == 'token':
+            yield sse_event('token', {'content': value})
+            continue
+        if not value['success']:
+            if on_error:
+                on_error(value)
+            yield sse_event('error', value)
+            return
+        try:
+            payload = finish(value, int((time.time() - started) * 1000))
+        except Exception as e:
+            yield sse_event('error', {'success': False, 'error': str(e)})
+            return
+        yield sse_event('done', payload)
+
+
+def stream_payload(payload: dict) -> Response:
+    """A stream holding only the ``done`` event, for answers served from cache."""
+    return sse_response(iter([sse_event('done', payload)]))
@@ -11,11 +11,12 @@ logger = logging.getLogger(__name__)
 class TelemetryTracker:
     """Context manager for tracking API call metrics."""
     
-    def __init__(self, user_id, metric_type, endpoint):
+    def __init__(self, user_id, metric_type, endpoint, start_time=None):
         self.user_id = user_id
         self.metric_type = metric_type
         self.endpoint = endpoint
-        self.start_time = None
+        # Set when the metric is recorded after the request started (streamed responses)
+        self.start_time = start_time
         self.model_used = None
         self.fallback_used = False
         self.tokens_used = None
@@ -23,7 +24,7 @@ class TelemetryTracker:
         self.error_type = None
     
     def __enter__(self):
-        self.start_time = time.time()
+        self.start_time = self.start_time or time.time()
         return self
     
     def __exit__(self, exc_type, exc_val, exc_tb):
@@ -0,0 +1,47 @@
+"""Helpers shared by the tools/bench_*.py scripts.
+
+Importing this module puts excel_ai_backend on sys.path, so the scripts can
+import ``src.*`` the way the app does.
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'excel_ai_backend')
+if BACKEND_DIR not in sys.path:
+    sys.path.insert(0, BACKEND_DIR)
+
+# Column generators make_frame cycles through, by name
+DISTRIBUTIONS = {
+    'normal': lambda rng, rows: rng.normal(size=rows),
+    'lognormal': lambda rng, rows: rng.lognormal(3, 1, rows),
+    'integers': lambda rng, rows: rng.integers(0, 1000, rows).astype(np.float64),
+    'exponential': lambda rng, rows: rng.exponential(50, rows),
+}
+
+
+def timed(fn, repeat):
+    """``(best seconds, result)`` of ``repeat`` calls to ``fn``."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return min(timings), result
+
+
+def make_frame(rows, columns, seed=42, kinds=('normal',), missing=0.01, factors=0, prefix='col'):
+    """Float columns cycling through ``kinds`` (see DISTRIBUTIONS) with a ``missing`` share of gaps.
+
+    With ``factors`` > 0 every column also loads on that many shared factors,
+    so some pairs correlate.
+    """
+    rng = np.random.default_rng(seed)
+    values = np.column_stack([DISTRIBUTIONS[kinds[i % len(kinds)]](rng, rows) for i in range(columns)])
+    if factors:
+        values += rng.normal(size=(rows, factors)) @ rng.normal(size=(factors, columns)) * 0.3
+    values[rng.random((rows, columns)) < missing] = np.nan
+    return pd.DataFrame(values, columns=[f'{prefix}_{i}' for i in range(columns)])
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""Benchmark the correlation engine (src/utils/correlation.py).
+
+Compares the old pattern - ``df.corr()`` followed by a nested Python loop over
+``corr_matrix.iloc[i, j]`` - with ``correlation_matrix`` + ``matrix_pairs`` on a
+narrow frame, then times blocked ``top_correlations`` on a wide frame where the
+old pattern is not practical, checking its pairs against the full matrix.
+
+    python tools/bench_correlation.py
+    python tools/bench_correlation.py --rows 20000 --columns 80 --wide-columns 2000
+"""
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from _bench_common import make_frame, timed
+from src.utils.correlation import correlation_matrix, matrix_pairs, top_correlations
+
+
+def loop_pairs(df, threshold):
+    """The per-cell loop the routes used before the engine."""
+    corr_matrix = df.corr()
+    pairs = []
+    for i in range(len(corr_matrix.columns)):
+        for j in range(i + 1, len(corr_matrix.columns)):
+            corr_val = corr_matrix.iloc[i, j]
+            if abs(corr_val) >= threshold and not pd.isna(corr_val):
+                pairs.append((corr_matrix.columns[i], corr_matrix.columns[j], float(corr_val)))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=10000, help='rows in the generated frames')
+    parser.add_argument('--columns', type=int, default=60, help='columns in the narrow frame')
+    parser.add_argument('--wide-columns', type=int, default=1200, help='columns in the wide frame')
+    parser.add_argument('--threshold', type=float, default=0.3, help='minimum |r| for a pair to be reported')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode (best is reported)')
+    args = parser.parse_args()
+
+    df = make_frame(args.rows, args.columns, factors=5, prefix='metric')
+    loop_s, looped = timed(lambda: loop_pairs(df, args.threshold), args.repeat)
+    engine_s, pairs = timed(lambda: matrix_pairs(correlation_matrix(df), args.threshold), args.repeat)
+    engine = {(p['column1'], p['column2']): p['correlation'] for p in pairs}
+    narrow_match = (len(engine) == len(looped)
+                    and all(abs(engine.get((a, b), np.inf) - r) < 1e-6 for a, b, r in looped))
+    print(f"{args.rows:,} rows x {args.columns} columns, |r| >= {args.threshold}: {len(looped)} pairs")
+    print(f"  corr() + nested loop     {loop_s:>8.3f}s")
+    print(f"  engine matrix + triangle {engine_s:>8.3f}s  ({'match' if narrow_match else 'MISMATCH'})")
+
+    wide = make_frame(args.rows, args.wide_columns, seed=7, factors=5, prefix='metric')
+    top_s, top = timed(lambda: top_correlations(wide, threshold=args.threshold, k=100), args.repeat)
+    full = matrix_pairs(correlation_matrix(wide), args.threshold, k=100)
+    wide_match = ([(p['column1'], p['column2']) for p in top] == [(p['column1'], p['column2']) for p in full])
+    print(f"{args.rows:,} rows x {args.wide_columns} columns, top 100 pairs")
+    print(f"  blocked top_correlations {top_s:>8.3f}s  ({'match' if wide_match else 'MISMATCH'} with full matrix)")
+    return 0 if narrow_match and wide_match else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
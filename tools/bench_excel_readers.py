@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Benchmark the Excel reader backends in src/utils/excel_readers.py.
+
+Generates synthetic .xlsx workbooks of the requested sizes (or uses --files)
+and parses each one with every installed backend in a fresh subprocess,
+reporting wall-clock parse time and peak RSS.
+
+    python tools/bench_excel_readers.py --sizes 10,50,200
+    python tools/bench_excel_readers.py --files big.xlsx --readers openpyxl_stream,calamine
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import _bench_common  # noqa: F401  puts excel_ai_backend on sys.path
+
+CALIBRATION_ROWS = 20000
+
+
+def write_workbook(path, rows):
+    import datetime
+    import random
+    import openpyxl
+
+    rng = random.Random(42)
+    regions = ['North', 'South', 'East', 'West']
+    products = ['Laptop', 'Phone', 'Tablet', 'Monitor', 'Keyboard']
+    start = datetime.datetime(2024, 1, 1)
+
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Data')
+    ws.append(['Date', 'Region', 'Product', 'Revenue', 'Units_Sold', 'Discount', 'Customer', 'Notes'])
+    for i in range(rows):
+        ws.append([
+            start + datetime.timedelta(minutes=i),
+            rng.choice(regions),
+            rng.choice(products),
+            round(rng.uniform(10, 5000), 2),
+            rng.randint(1, 50),
+            rng.random() if rng.random() > 0.1 else None,
+            f'Customer {rng.randint(1, 100000)}',
+            f'order-{i}-{rng.getrandbits(32):08x}',
+        ])
+    wb.save(path)
+
+
+def generate(target_mb, workdir):
+    """Write a workbook close to target_mb, scaling from a small calibration file."""
+    path = os.path.join(workdir, f'bench_{target_mb}mb.xlsx')
+    if os.path.exists(path):
+        return path
+    calibration = os.path.join(workdir, 'calibration.xlsx')
+    if not os.path.exists(calibration):
+        write_workbook(calibration, CALIBRATION_ROWS)
+    bytes_per_row = os.path.getsize(calibration) / CALIBRATION_ROWS
+    write_workbook(path, int(target_mb * 1024 * 1024 / bytes_per_row))
+    return path
+
+
+def child(reader, path):
+    """Parse one file with one backend; print timings as JSON."""
+    from src.utils.excel_readers import is_streaming, iter_excel_chunks, read_excel
+
+    started = time.perf_counter()
+    if is_streaming(reader):
+        # Consume chunk by chunk, as the ingest path does, instead of concatenating
+        rows = 0
+        with open(path, 'rb') as f:
+            _, chunks = iter_excel_chunks(f)
+            for chunk in chunks:
+                rows += len(chunk)
+    else:
+        with open(path, 'rb') as f:
+            rows = len(read_excel(f, path, reader))
+    elapsed = time.perf_counter() - started
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'rows': rows, 'seconds': elapsed, 'peak_rss_mb': peak_kb / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10,50,200', help='comma separated workbook sizes in MB to generate')
+    parser.add_argument('--files', nargs='*', help='benchmark these workbooks instead of generating')
+    parser.add_argument('--readers', help='comma separated backends (default: all installed)')
+    parser.add_argument('--workdir', default=os.path.join(tempfile.gettempdir(), 'excel_reader_bench'))
+    parser.add_argument('--child', nargs=2, metavar=('READER', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return 0
+
+    from src.utils.excel_readers import available_readers
+
+    readers = args.readers.split(',') if args.readers else available_readers()
+    if args.files:
+        files = args.files
+    else:
+        os.makedirs(args.workdir, exist_ok=True)
+        files = []
+        for size in args.sizes.split(','):
+            print(f'Generating ~{size}MB workbook...', file=sys.stderr)
+            files.append(generate(float(size), args.workdir))
+
+    print(f"{'file':<28}{'MB':>8}  {'reader':<17}{'rows':>10}{'seconds':>10}{'peak RSS MB':>13}")
+    for path in files:
+        size_mb = os.path.getsize(path) / 1024 / 1024
+        for reader in readers:
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), '--child', reader, path],
+                capture_output=True, text=True,
+            )
+            if proc.returncode != 0:
+                error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'failed'
+                print(f'{os.path.basename(path):<28}{size_mb:>8.1f}  {reader:<17}{error}')
+                continue
+            result = json.loads(proc.stdout.strip().splitlines()[-1])
+            print(f"{os.path.basename(path):<28}{size_mb:>8.1f}  {reader:<17}{result['rows']:>10}"
+                  f"{result['seconds']:>10.2f}{result['peak_rss_mb']:>13.1f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
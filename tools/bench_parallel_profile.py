@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""Benchmark column-partitioned profiling (src/utils/parallel_profile.py).
+
+Profiles a wide finance-style frame (mostly float columns plus a few text code
+columns) serially and across the profiling pool, checks both give the same
+DatasetProfile and type suggestions, and reports the fixed cost of staging the
+frame in shared memory. The pool is warmed up before timing, as it is in a
+long-running web worker.
+
+    python tools/bench_parallel_profile.py
+    python tools/bench_parallel_profile.py --rows 200000 --columns 300 --workers 8
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+from _bench_common import make_frame, timed
+from src.routes.features import analyze_data_types
+from src.utils import parallel_profile
+from src.utils.profile_cache import DatasetProfile
+
+
+def make_code_frame(rows, columns, seed=42):
+    """``columns`` columns: one text code column per 20, the rest lognormal amounts with some gaps.
+    The last 1% of rows repeat the first 1%, so there are duplicate rows to count."""
+    rng = np.random.default_rng(seed + 1)
+    codes = np.array(['GL-1000', 'GL-2000', 'GL-3000', 'AP-4100', 'AR-5200'])
+    df = make_frame(rows, columns, seed, kinds=('lognormal',))
+    df.columns = [f'code_{i}' if i % 20 == 0 else f'amount_{i}' for i in range(columns)]
+    for i in range(0, columns, 20):
+        df[f'code_{i}'] = codes[rng.integers(0, len(codes), rows)]
+    repeated = rows // 100
+    if repeated:
+        df.iloc[rows - repeated:] = df.iloc[:repeated].to_numpy()
+    return df
+
+
+def snapshot(profile):
+    return (profile.duplicate_rows, profile.missing, profile.unique, profile.summary_stats,
+            profile.outlier_counts, profile.top_values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000, help='rows in the generated frame')
+    parser.add_argument('--columns', type=int, default=300, help='columns in the generated frame')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='profiling pool size')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per mode (best is reported)')
+    args = parser.parse_args()
+
+    df = make_code_frame(args.rows, args.columns)
+    cells = args.rows * args.columns
+    print(f"{args.rows:,} rows x {args.columns} columns ({cells:,} cells), "
+          f"{args.workers} workers, {os.cpu_count()} CPUs")
+
+    parallel_profile.PROFILE_WORKERS = 1
+    serial_s, serial = timed(lambda: DatasetProfile(df), args.repeat)
+    serial_types_s, serial_types = timed(lambda: analyze_data_types(df), args.repeat)
+
+    parallel_profile.PROFILE_WORKERS = max(args.workers, 2)
+    parallel_profile.PARALLEL_PROFILE_MIN_CELLS = 0
+    DatasetProfile(df.head(1000))  # start the pool outside the timings
+    pool_s, pooled = timed(lambda: DatasetProfile(df), args.repeat)
+    pool_types_s, pool_types = timed(lambda: analyze_data_types(df), args.repeat)
+
+    def stage():
+        shm, _ = parallel_profile._write_shared(df)
+        shm.close()
+        shm.unlink()
+    stage_s, _ = timed(stage, args.repeat)
+
+    match = snapshot(serial) == snapshot(pooled) and serial_types == pool_types
+    print(f"{'':<20}{'serial':>9}{'pool':>9}")
+    print(f"{'DatasetProfile':<20}{serial_s:>9.3f}{pool_s:>9.3f}")
+    print(f"{'analyze_data_types':<20}{serial_types_s:>9.3f}{pool_types_s:>9.3f}")
+    print(f"shared-memory staging: {stage_s:.3f}s; results {'match' if match else 'MISMATCH'}")
+    return 0 if match else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
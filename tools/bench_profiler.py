@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""Benchmark the vectorized numeric profiler in src/utils/profiler.py.
+
+Compares profile_numeric against the per-column pandas loop generate_insights
+used before (dropna + mean/median/std/min/max/quantile/skew/kurtosis per
+column, then an IQR re-filter of the frame per column), checks both produce the
+same statistics and reports the speedup.
+
+    python tools/bench_profiler.py
+    python tools/bench_profiler.py --shapes 100000x50,1000000x20 --repeat 3
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from _bench_common import make_frame, timed
+from src.utils.profiler import profile_numeric
+
+STATS = ('mean', 'median', 'std', 'min', 'max', 'q25', 'q75', 'skewness', 'kurtosis')
+
+
+def legacy_profile(df):
+    """The per-column loop generate_insights used before the vectorized profiler."""
+    summary_stats, outlier_counts = {}, {}
+    for col in df.select_dtypes(include=[np.number]).columns:
+        col_data = df[col].dropna()
+        if len(col_data) > 0:
+            summary_stats[col] = {
+                'count': len(col_data),
+                'mean': float(col_data.mean()),
+                'median': float(col_data.median()),
+                'std': float(col_data.std()),
+                'min': float(col_data.min()),
+                'max': float(col_data.max()),
+                'q25': float(col_data.quantile(0.25)),
+                'q75': float(col_data.quantile(0.75)),
+                'missing_count': int(df[col].isna().sum()),
+                'skewness': float(col_data.skew()) if len(col_data) > 2 else 0,
+                'kurtosis': float(col_data.kurtosis()) if len(col_data) > 3 else 0
+            }
+    for col, stats in summary_stats.items():
+        iqr = stats['q75'] - stats['q25']
+        if iqr > 0:
+            lower, upper = stats['q25'] - 1.5 * iqr, stats['q75'] + 1.5 * iqr
+            outlier_counts[col] = len(df[(df[col] < lower) | (df[col] > upper)][col])
+        else:
+            outlier_counts[col] = 0
+    return summary_stats, outlier_counts
+
+
+def max_relative_diff(expected, actual):
+    worst = 0.0
+    for col, stats in expected.items():
+        for key in STATS:
+            a, b = stats[key], actual[col][key]
+            if a == b or (np.isnan(a) and np.isnan(b)):
+                continue
+            worst = max(worst, abs(a - b) / max(abs(a), 1e-300))
+    return worst
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shapes', default='100000x50,1000000x20', help='comma separated ROWSxCOLS frames')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per implementation (best is reported)')
+    args = parser.parse_args()
+
+    print(f"{'shape':<14}{'legacy s':>10}{'vectorized s':>14}{'speedup':>9}{'max rel diff':>14}  counts")
+    for shape in args.shapes.split(','):
+        rows, cols = (int(v) for v in shape.lower().split('x'))
+        df = make_frame(rows, cols, kinds=('normal', 'lognormal', 'integers', 'exponential'), missing=0.02)
+        legacy_s, (expected, expected_outliers) = timed(lambda: legacy_profile(df), args.repeat)
+        fast_s, (actual, actual_outliers) = timed(lambda: profile_numeric(df), args.repeat)
+
+        counts_match = (
+            expected.keys() == actual.keys()
+            and all(expected[c]['count'] == actual[c]['count'] for c in expected)
+            and all(expected[c]['missing_count'] == actual[c]['missing_count'] for c in expected)
+            and expected_outliers == actual_outliers
+        )
+        print(f"{shape:<14}{legacy_s:>10.3f}{fast_s:>14.3f}{legacy_s / fast_s:>8.1f}x"
+              f"{max_relative_diff(expected, actual):>14.1e}  {'match' if counts_match else 'MISMATCH'}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
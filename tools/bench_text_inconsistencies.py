@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Benchmark the vectorized text-inconsistency detector in src/routes/features.py.
+
+Compares detect_text_inconsistencies against the per-value generator loop it
+replaced, checks both flag the same issues, and times every stage of
+/features/data-cleaning on the same frame so the slowest stage is visible.
+
+    python tools/bench_text_inconsistencies.py
+    python tools/bench_text_inconsistencies.py --rows 1000000 --repeat 3
+"""
+import argparse
+import re
+import sys
+
+import numpy as np
+import pandas as pd
+
+from _bench_common import timed
+from src.routes.features import (analyze_data_types, apply_safe_cleaning, detect_outliers,
+                                 detect_text_inconsistencies, generate_cleaning_suggestions,
+                                 generate_improvement_summary)
+from src.utils.profile_cache import DatasetProfile
+
+
+def make_text_frame(rows, seed=42):
+    """A clean high-cardinality text column (every check scans it fully), a messy
+    low-cardinality column, a phone column with mixed formats and a number."""
+    rng = np.random.default_rng(seed)
+    words = np.array(['alpha', 'Bravo', 'CHARLIE', 'delta', ' echo', 'Foxtrot ', 'golf', 'Hotel'])
+    phones = np.array(['555-123-4567', '(555) 123-4567', '555.123.4567'])
+    clean = np.array(['order', 'refund', 'invoice', 'shipment'])
+    text = pd.Series(clean[rng.integers(0, len(clean), rows)]) + '-' + pd.Series(rng.integers(0, rows // 4, rows)).astype(str)
+    df = pd.DataFrame({
+        'comment': text,
+        'city': words[rng.integers(0, len(words), rows)],
+        'phone': phones[rng.integers(0, len(phones), rows)],
+        'amount': rng.lognormal(3, 1, rows),
+    })
+    df.loc[rng.random(rows) < 0.02, 'city'] = None
+    return df
+
+
+def legacy_text_inconsistencies(df):
+    """The per-value loop detect_text_inconsistencies used before."""
+    inconsistencies = {'columns_with_issues': [], 'details': {}}
+    for column in df.select_dtypes(include=['object', 'category']).columns:
+        col_data = df[column].dropna().astype(str)
+        if len(col_data) == 0:
+            continue
+        issues = []
+        has_upper = any(val.isupper() for val in col_data if val.isalpha())
+        has_lower = any(val.islower() for val in col_data if val.isalpha())
+        has_title = any(val.istitle() for val in col_data if val.isalpha())
+        if sum([has_upper, has_lower, has_title]) > 1:
+            issues.append('mixed_case')
+        if any(val != val.strip() for val in col_data):
+            issues.append('whitespace')
+        if column.lower() in ['phone', 'email', 'date']:
+            formats = set()
+            for val in col_data[:50]:
+                if '@' in val:
+                    formats.add('email')
+                elif re.match(r'\d{3}-\d{3}-\d{4}', val):
+                    formats.add('phone_dash')
+                elif re.match(r'\(\d{3}\)\s\d{3}-\d{4}', val):
+                    formats.add('phone_paren')
+            if len(formats) > 1:
+                issues.append('inconsistent_format')
+        if issues:
+            inconsistencies['columns_with_issues'].append(column)
+            inconsistencies['details'][column] = issues
+    return inconsistencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000, help='rows in the generated frame')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per stage (best is reported)')
+    args = parser.parse_args()
+
+    df = make_text_frame(args.rows)
+    legacy_s, expected = timed(lambda: legacy_text_inconsistencies(df), args.repeat)
+    fast_s, actual = timed(lambda: detect_text_inconsistencies(df), args.repeat)
+    match = expected['details'] == actual['details']
+    print(f"text inconsistencies, {args.rows:,} rows: legacy {legacy_s:.3f}s, vectorized {fast_s:.3f}s "
+          f"({legacy_s / fast_s:.1f}x), flags {'match' if match else 'MISMATCH'}")
+    for column, issues in actual['by_issue'].items():
+        print(f"  {column}: " + ', '.join(f"{name}={issue['count']:,}" for name, issue in issues.items()))
+
+    # /features/data-cleaning stages, in request order
+    profile_s, profile = timed(lambda: DatasetProfile(df), args.repeat)
+    stages = [('profile', profile_s),
+              ('analyze_data_types', timed(lambda: analyze_data_types(df), args.repeat)[0]),
+              ('detect_outliers', timed(lambda: detect_outliers(df, profile), args.repeat)[0]),
+              ('detect_text_inconsistencies', fast_s)]
+    quality_issues = {
+        'missing_values': {'total_missing': 0, 'by_column': {}, 'percentage_by_column': {}},
+        'duplicates': {'count': profile.duplicate_rows},
+        'data_types': analyze_data_types(df),
+        'inconsistencies': actual,
+    }
+    suggestions_s, suggestions = timed(lambda: generate_cleaning_suggestions(df, quality_issues), args.repeat)
+    cleaning_s, (cleaned, operations) = timed(lambda: apply_safe_cleaning(df, suggestions), args.repeat)
+    summary_s, _ = timed(lambda: generate_improvement_summary(df, cleaned, operations), args.repeat)
+    stages += [('generate_cleaning_suggestions', suggestions_s), ('apply_safe_cleaning', cleaning_s),
+               ('generate_improvement_summary', summary_s)]
+
+    print(f"\n{'data-cleaning stage':<32}{'seconds':>9}")
+    for name, seconds in stages:
+        print(f"{name:<32}{seconds:>9.3f}")
+    print(f"slowest: {max(stages, key=lambda stage: stage[1])[0]}")
+    return 0 if match else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())